@@ -1,16 +1,47 @@
 # analyzer.py
-import json
-import re
+import os
 
+import context_packer
 # Importamos el cliente LLM básico
 import llm_client
 
+# Presupuesto de tokens del texto de cada artículo (las frases más relevantes para el tema que quepan),
+# el mismo en la llamada individual y en lote
+TOKENS_ARTICULO = context_packer.CONTEXTO_TOKENS_ANALISIS
+# Presupuesto aproximado de tokens de artículos por petición en lote y máximo de artículos por lote
+LOTE_PRESUPUESTO_TOKENS = int(os.getenv("ANALISIS_LOTE_TOKENS", "16000"))
+LOTE_MAX_ARTICULOS = int(os.getenv("ANALISIS_LOTE_MAX_ARTICULOS", "8"))
+
+# Esquema de la respuesta de análisis (se pide a Gemini como salida estructurada y se valida en local)
+ESQUEMA_ANALISIS = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 1, "maximum": 10},
+        "reason": {"type": "string"},
+        "resumen": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["score", "reason", "resumen", "tags"],
+}
+# En lote: un array de análisis, cada uno con el id del artículo
+ESQUEMA_ANALISIS_LOTE = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"id": {"type": "string"}, **ESQUEMA_ANALISIS["properties"]},
+        "required": ["id"] + ESQUEMA_ANALISIS["required"],
+    },
+}
+
 
 def analyze_with_gemini(tema, text):
     """
     Analiza el contenido con Gemini usando el cliente LLM y un prompt específico.
     Contiene el prompt y la lógica de parseo y manejo de errores específica para el análisis.
+    Retorna None si no se pudo obtener un análisis válido (tras los reintentos de llm_client):
+    el artículo queda sin puntuar en lugar de recibir una puntuación de error.
     """
+    texto_contexto = context_packer.seleccionar_contexto(text, tema, TOKENS_ARTICULO)
     # Definición del prompt específico para la tarea de análisis - Copiado exacto del original
     prompt = f"""
 Evalúa este artículo sobre '{tema}' y devuelve SOLO un JSON válido con:
@@ -26,31 +57,104 @@ Criterios:
 4. Utilidad: ¿Contiene datos/ejemplos concretos?
 
 Texto del artículo:
-{text[:8000]}
+{texto_contexto}
 """
 
     try:
-        # Usamos el cliente LLM para generar el texto crudo
-        # Si generate_raw_content lanza una excepción, esta será capturada aquí
-        response_text = llm_client.generate_raw_content(prompt)
-
-        # Mantenemos la lógica original para extraer y parsear el JSON
-        json_str_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-
-        if json_str_match:
-            json_str = json_str_match.group()
-            # Mantenemos la lógica original de parseo que puede lanzar JSONDecodeError
-            return json.loads(json_str)
-        else:
-            # Si no se encuentra un JSON válido, manejamos como en el original
-            print(f"⚠️ Gemini no retornó estructura JSON esperada para tema '{tema}'. Inicio respuesta: {response_text[:200]}...")
-            # Retornamos el mismo diccionario de error por defecto del original
-            return {"score": 1, "reason": "Error de análisis", "tags": []}
+        # Salida estructurada: Gemini responde JSON conforme a ESQUEMA_ANALISIS (validado, con un intento de reparación)
+        analysis = llm_client.generate_structured(prompt, ESQUEMA_ANALISIS)
+        if analysis is None:
+            print(f"⚠️ Gemini no retornó un análisis válido para tema '{tema}'.")
+        return analysis
 
     except Exception as e:
-        # Capturamos cualquier excepción (incluyendo la de generate_raw_content o json.loads)
+        # Capturamos cualquier excepción de la llamada (tras los reintentos de llm_client)
         # Imprimimos el mensaje de error como en el original
         print(f"⚠️ Error en Gemini: {str(e)}")
-        # Retornamos el mismo diccionario de error por defecto del original
-        return {"score": 1, "reason": "Error de análisis", "tags": []}
+        return None
+
+
+def dividir_en_lotes(articulos, presupuesto_tokens=None, max_articulos=None):
+    """
+    Reparte una lista de (id, texto) en lotes cuyo texto (ya reducido a TOKENS_ARTICULO) no supere el presupuesto de tokens.
+    Un artículo que por sí solo supera el presupuesto va en un lote propio. Se respeta el orden.
+    """
+    presupuesto_tokens = presupuesto_tokens or LOTE_PRESUPUESTO_TOKENS
+    max_articulos = max_articulos or LOTE_MAX_ARTICULOS
+    lotes = []
+    lote_actual = []
+    tokens_actuales = 0
+    for id_articulo, texto in articulos:
+        tokens = min(context_packer.contar_tokens(texto), TOKENS_ARTICULO)
+        if lote_actual and (tokens_actuales + tokens > presupuesto_tokens or len(lote_actual) >= max_articulos):
+            lotes.append(lote_actual)
+            lote_actual = []
+            tokens_actuales = 0
+        lote_actual.append((id_articulo, texto))
+        tokens_actuales += tokens
+    if lote_actual:
+        lotes.append(lote_actual)
+    return lotes
+
+
+def _prompt_lote(tema, lote):
+    """Prompt con las instrucciones de evaluación una sola vez y todos los artículos del lote delimitados por id."""
+    bloques = "\n\n".join(
+        f"### ARTÍCULO id={id_articulo}\n{context_packer.seleccionar_contexto(texto, tema, TOKENS_ARTICULO)}"
+        for id_articulo, texto in lote
+    )
+    return f"""
+Evalúa cada uno de estos {len(lote)} artículos sobre '{tema}' por separado y devuelve SOLO un array JSON válido,
+con un objeto por artículo (en cualquier orden) con:
+- "id": el id indicado en la cabecera del artículo
+- "score": 1-10 (1=irrelevante, 10=excelente)
+- "reason": Explicación concisa
+- "resumen": Resumen breve (máx. 100 caracteres)
+- "tags": 3-5 palabras clave relevantes
+
+Criterios:
+1. Relevancia: ¿Aborda directamente "{tema}"?
+2. Autoridad: ¿Fuente confiable/citada?
+3. Actualidad: ¿Menciona fechas recientes (2024-2025)?
+4. Utilidad: ¿Contiene datos/ejemplos concretos?
+
+{bloques}
+"""
+
+
+def _indexar_respuesta_lote(elementos, ids_esperados):
+    """Retorna {id: análisis} a partir del array devuelto; los ids desconocidos o repetidos se omiten."""
+    ids_por_texto = {str(id_articulo): id_articulo for id_articulo in ids_esperados}
+    resultados = {}
+    for elemento in elementos:
+        id_articulo = ids_por_texto.get(str(elemento.pop('id', None)))
+        if id_articulo is not None and id_articulo not in resultados:
+            resultados[id_articulo] = elemento
+    return resultados
+
+
+def analyze_batch_with_gemini(tema, articulos, presupuesto_tokens=None):
+    """
+    Variante en lote de analyze_with_gemini: evalúa varios artículos por petición.
+    'articulos' es una lista de (id, texto) con ids únicos. Retorna {id: análisis} con el mismo formato
+    que analyze_with_gemini. Los artículos que falten o no se puedan parsear en la respuesta del lote
+    se reintentan con una llamada individual; si esta también falla, su valor es None.
+    """
+    resultados = {}
+    for lote in dividir_en_lotes(articulos, presupuesto_tokens):
+        ids = [id_articulo for id_articulo, _ in lote]
+        parseados = {}
+        if len(lote) > 1:
+            try:
+                elementos = llm_client.generate_structured(_prompt_lote(tema, lote), ESQUEMA_ANALISIS_LOTE)
+                parseados = _indexar_respuesta_lote(elementos or [], ids)
+                if len(parseados) < len(lote):
+                    print(f"⚠️ Lote de {len(lote)} artículos para '{tema}': {len(lote) - len(parseados)} sin análisis válido, se reintentan uno a uno.")
+            except Exception as e:
+                print(f"⚠️ Error en Gemini (lote de {len(lote)} artículos): {str(e)}")
+        resultados.update(parseados)
 
+        for id_articulo, texto in lote:
+            if id_articulo not in resultados:
+                resultados[id_articulo] = analyze_with_gemini(tema, texto)
+    return resultados
@@ -0,0 +1,117 @@
+# benchmark_llm.py
+# Script de prueba de la capa LLM (analyzer + llm_client) con el backend simulado fake_llm_backend:
+# sin red ni API key, mide el rendimiento del análisis concurrente (o por lotes), el efecto de la caché
+# de respuestas y el comportamiento de los reintentos ante errores y 429 inyectados.
+# Los textos son los de las páginas *.html de la raíz del proyecto, con variantes para no repetir prompts.
+#
+# Uso: python benchmark_llm.py [--articulos N] [--concurrencia N] [--latencia S] [--tasa-429 P] [--lotes]
+
+import argparse
+import glob
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# La caché y la telemetría del benchmark no deben mezclarse con las de una ejecución real
+os.environ.setdefault("LLM_CACHE_DB", os.path.join(tempfile.mkdtemp(prefix="benchmark_llm_"), "llm_cache.db"))
+os.environ["LLM_TELEMETRIA"] = "0"
+
+import analyzer
+import fake_llm_backend
+import html_parsing
+import llm_client
+import rate_limiter
+
+TEMA = "panot de barcelona"
+
+
+def cargar_textos(directorio, cantidad):
+    """Textos extraídos de las páginas guardadas, repetidos con un sufijo distinto hasta 'cantidad'."""
+    base = []
+    for fichero in sorted(glob.glob(os.path.join(directorio, '*.html'))):
+        with open(fichero, 'rb') as f:
+            texto = html_parsing.extraer_contenido(f.read())
+        if texto:
+            base.append(texto)
+    if not base:
+        base = [f"Texto de prueba sobre {TEMA}. " * 50]
+    return [f"{base[i % len(base)]}\n(Variante {i})" for i in range(cantidad)]
+
+
+def analizar_todo(textos, concurrencia, por_lotes):
+    """Analiza todos los textos y retorna (segundos totales, latencias por artículo, análisis válidos)."""
+    latencias = []
+
+    def analizar(texto):
+        inicio = time.perf_counter()
+        resultado = analyzer.analyze_with_gemini(TEMA, texto)
+        latencias.append(time.perf_counter() - inicio)
+        return resultado
+
+    inicio = time.perf_counter()
+    if por_lotes:
+        lotes = analyzer.dividir_en_lotes(list(enumerate(textos)))
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            resultados = {}
+            for parcial in pool.map(lambda lote: analyzer.analyze_batch_with_gemini(TEMA, lote), lotes):
+                resultados.update(parcial)
+        validos = sum(1 for r in resultados.values() if r)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            validos = sum(1 for r in pool.map(analizar, textos) if r)
+    return time.perf_counter() - inicio, latencias, validos
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def informe(nombre, segundos, latencias, validos, total):
+    print(f"{nombre:>14}: {segundos:6.2f} s | {total / segundos:6.1f} artículos/s | válidos {validos}/{total}", end="")
+    if latencias:
+        print(f" | p50 {statistics.median(latencias):.2f} s | p95 {percentil(latencias, 0.95):.2f} s")
+    else:
+        print()
+
+
+if __name__ == "__main__":
+    directorio_proyecto = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Benchmark de la capa LLM con el backend simulado.")
+    parser.add_argument('--articulos', type=int, default=40)
+    parser.add_argument('--concurrencia', type=int, default=8)
+    parser.add_argument('--latencia', type=float, default=0.5, help="Latencia media simulada (s)")
+    parser.add_argument('--desviacion', type=float, default=0.2)
+    parser.add_argument('--tasa-errores', type=float, default=0.0)
+    parser.add_argument('--tasa-429', type=float, default=0.0)
+    parser.add_argument('--lotes', action='store_true', help="Analizar en lotes (analyze_batch_with_gemini)")
+    parser.add_argument('--rpm', type=int, default=rate_limiter.LLM_RPM, help="Peticiones/minuto del limitador")
+    parser.add_argument('--tpm', type=int, default=rate_limiter.LLM_TPM, help="Tokens/minuto del limitador")
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args()
+
+    backend = fake_llm_backend.FakeBackend(
+        latencia_media=args.latencia, latencia_desviacion=args.desviacion,
+        tasa_errores=args.tasa_errores, tasa_429=args.tasa_429, semilla=args.semilla,
+    )
+    llm_client.set_backend(backend)
+    rate_limiter.LIMITES_POR_MODELO[llm_client.MODELO_POR_DEFECTO] = (args.rpm, args.tpm)
+    textos = cargar_textos(directorio_proyecto, args.articulos)
+    modo = "lotes" if args.lotes else "individual"
+    print(f"--- {len(textos)} artículos | concurrencia {args.concurrencia} | modo {modo} | "
+          f"latencia {args.latencia}±{args.desviacion} s | errores {args.tasa_errores:.0%} | 429 {args.tasa_429:.0%} ---")
+    print(f"    llm_client: {llm_client.MAX_LLAMADAS_CONCURRENTES} llamadas simultáneas | {args.rpm} RPM | {args.tpm} TPM")
+
+    segundos, latencias, validos = analizar_todo(textos, args.concurrencia, args.lotes)
+    informe("Sin caché", segundos, latencias, validos, len(textos))
+    segundos, latencias, validos = analizar_todo(textos, args.concurrencia, args.lotes)
+    informe("Con caché", segundos, latencias, validos, len(textos))
+
+    print(f"\nBackend simulado: {backend.stats}")
+    print(f"Reintentos: {llm_client.get_retry_stats()}")
+    print(f"Caché: {llm_client.get_cache_stats()}")
+    print(f"Estructuradas: {llm_client.get_structured_stats()}")
@@ -0,0 +1,132 @@
+# benchmark_parsers.py
+# Script de prueba para comparar los backends de html_parsing sobre páginas HTML guardadas:
+# 1. Paridad: cada backend debe extraer exactamente el mismo texto que 'html.parser' (la referencia).
+#    Además, con unos casos de HTML mal formado, los backends que reparan el HTML (selectolax, lxml)
+#    deben coincidir entre sí; la diferencia con html.parser en esos casos es conocida y solo se muestra.
+# 2. Rendimiento: páginas por segundo de cada backend (parseo + extracción).
+#
+# Uso: python benchmark_parsers.py [fichero_o_directorio ...] [--repeticiones N]
+# Sin argumentos usa los *.html de la raíz del proyecto (las previsualizaciones guardadas).
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import html_parsing
+
+REFERENCIA = 'html.parser'
+
+_PARRAFO = "Texto del párrafo {} con contenido suficiente para superar el mínimo de caracteres. "
+
+# Casos en los que html.parser anida los elementos sin cerrar y repite su texto
+CASOS_MAL_FORMADOS = [
+    ("<p> sin cerrar", "<html><body><article>" + "".join(f"<p>{_PARRAFO.format(i)}" for i in range(3))
+     + "</article></body></html>"),
+    ("<li> sin cerrar", "<html><body><article><ul>" + "".join(f"<li>{_PARRAFO.format(i)}" for i in range(3))
+     + "</ul></article></body></html>"),
+    ("<div> dentro de <p>", f"<html><body><div class='entry-content'><p>{_PARRAFO.format(1)}<div>{_PARRAFO.format(2)}"
+     f"</div><p>{_PARRAFO.format(3)}</div></body></html>"),
+    ("cierres sueltos", f"<html><body><article><p>{_PARRAFO.format(1)}</span></div></p><p>{_PARRAFO.format(2)}"
+     "</b></p></article></body></html>"),
+]
+
+
+def cargar_paginas(rutas):
+    """Lee los ficheros HTML indicados (o los *.html de los directorios indicados) como bytes."""
+    ficheros = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            ficheros.extend(sorted(glob.glob(os.path.join(ruta, '*.html'))))
+        else:
+            ficheros.append(ruta)
+
+    paginas = []
+    for fichero in ficheros:
+        with open(fichero, 'rb') as f:
+            paginas.append((os.path.basename(fichero), f.read()))
+    return paginas
+
+
+def comprobar_paridad(paginas, backends):
+    """Compara la salida de cada backend con la de la referencia. Retorna el número de discrepancias."""
+    discrepancias = 0
+    for nombre, html in paginas:
+        esperado = html_parsing.extraer_contenido(html, backend=REFERENCIA)
+        for backend in backends:
+            if backend == REFERENCIA:
+                continue
+            obtenido = html_parsing.extraer_contenido(html, backend=backend)
+            if obtenido != esperado:
+                discrepancias += 1
+                print(f"❌ {backend} difiere de {REFERENCIA} en '{nombre[:60]}'")
+                print(f"   {REFERENCIA}: {(esperado or '')[:120]!r}")
+                print(f"   {backend}: {(obtenido or '')[:120]!r}")
+    return discrepancias
+
+
+def comprobar_mal_formados(backends):
+    """
+    Extrae CASOS_MAL_FORMADOS con cada backend. Los que no son la referencia deben coincidir entre sí;
+    si difieren de la referencia solo se avisa. Retorna el número de discrepancias.
+    """
+    discrepancias = 0
+    for nombre, html in CASOS_MAL_FORMADOS:
+        salidas = {backend: html_parsing.extraer_contenido(html, backend=backend) for backend in backends}
+        reparadores = [backend for backend in backends if backend != REFERENCIA]
+        if len({salidas[backend] for backend in reparadores}) > 1:
+            discrepancias += 1
+            print(f"❌ {', '.join(reparadores)} no coinciden en '{nombre}'")
+            for backend in reparadores:
+                print(f"   {backend}: {(salidas[backend] or '')[:120]!r}")
+        elif reparadores and salidas[reparadores[0]] != salidas[REFERENCIA]:
+            print(f"⚠️ '{nombre}': {REFERENCIA} difiere de {', '.join(reparadores)} (diferencia conocida)")
+        else:
+            print(f"✅ '{nombre}': todos los backends coinciden")
+    return discrepancias
+
+
+def medir_rendimiento(paginas, backend, repeticiones):
+    """Retorna (páginas/segundo, MB/segundo) extrayendo todas las páginas 'repeticiones' veces."""
+    total_bytes = sum(len(html) for _, html in paginas) * repeticiones
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for _, html in paginas:
+            html_parsing.extraer_contenido(html, backend=backend)
+    duracion = time.perf_counter() - inicio
+    return (len(paginas) * repeticiones) / duracion, total_bytes / duracion / 1e6
+
+
+if __name__ == "__main__":
+    directorio_proyecto = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Paridad y rendimiento de los backends de html_parsing.")
+    parser.add_argument('rutas', nargs='*', default=[directorio_proyecto])
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    paginas = cargar_paginas(args.rutas)
+    if not paginas:
+        print("❌ No se encontraron páginas HTML para comparar.")
+        sys.exit(1)
+
+    backends = html_parsing.backends_disponibles()
+    print(f"--- {len(paginas)} páginas | backends disponibles: {', '.join(backends)} ---")
+
+    print("\n--- Paridad con la referencia ---")
+    discrepancias = comprobar_paridad(paginas, backends)
+    print("\n--- HTML mal formado ---")
+    discrepancias += comprobar_mal_formados(backends)
+    if discrepancias:
+        print(f"❌ {discrepancias} discrepancias encontradas.")
+    else:
+        print(f"✅ Todos los backends producen la misma extracción que '{REFERENCIA}' en las páginas guardadas.")
+
+    print(f"\n--- Rendimiento ({args.repeticiones} repeticiones) ---")
+    base = None
+    for backend in reversed(backends):  # Empezamos por la referencia (la más lenta)
+        paginas_s, mb_s = medir_rendimiento(paginas, backend, args.repeticiones)
+        base = base or paginas_s
+        print(f"{backend:>12}: {paginas_s:8.1f} páginas/s | {mb_s:6.2f} MB/s | x{paginas_s / base:.1f}")
+
+    sys.exit(1 if discrepancias else 0)
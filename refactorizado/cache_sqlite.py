@@ -0,0 +1,193 @@
+# cache_sqlite.py
+# Almacén clave -> valor en una tabla SQLite con expiración por TTL y desalojo LRU por tamaño
+# y número de entradas. Es la parte común de llm_cache (respuestas de Gemini) y http_cache
+# (respuestas HTTP); cada módulo decide qué columnas guarda y cómo sirve sus entradas.
+
+import sqlite3
+import threading
+import time
+
+# Accesos (para el orden LRU) que se acumulan en memoria antes de escribirlos en disco
+ACCESOS_POR_ESCRITURA = 100
+# Cada cuánto se borran de una vez las entradas expiradas (y se recalculan los totales)
+SEGUNDOS_ENTRE_PURGAS = 3600
+
+
+class AlmacenCacheSQLite:
+    """
+    Tabla 'tabla' con clave primaria 'columna_clave', las columnas propias 'columnas' ({nombre: tipo})
+    y las de gestión size, fecha_guardado y ultimo_acceso.
+    - Una sola conexión, creada la primera vez y compartida bajo self.lock por todos los hilos.
+    - Leer no escribe: el acceso se anota en memoria y se vuelca en bloque (cada ACCESOS_POR_ESCRITURA
+      lecturas, antes de desalojar y con volcar_accesos()).
+    - El tamaño y el nº de entradas se llevan en memoria y se ajustan en cada escritura, en vez de
+      sumar toda la tabla al guardar. Si otro proceso escribe en el mismo fichero son aproximados
+      hasta la siguiente purga, que los recalcula.
+    Los errores de SQLite se relanzan; quien llama decide cómo avisar.
+    """
+
+    def __init__(self, ruta, tabla, columna_clave, columnas, ttl, max_bytes, max_entradas):
+        self.ruta = ruta
+        self.tabla = tabla
+        self.columna_clave = columna_clave
+        self.columnas = columnas
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entradas = max_entradas
+        self.lock = threading.RLock()
+        self._conn = None
+        self._accesos_pendientes = {}
+        self._total_bytes = 0
+        self._total_entradas = 0
+        self._proxima_purga = 0.0
+
+    def _conectar(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            columnas = ''.join(f'{nombre} {tipo}, ' for nombre, tipo in self.columnas.items())
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {self.tabla} (
+                    {self.columna_clave} TEXT PRIMARY KEY,
+                    {columnas}size INTEGER,
+                    fecha_guardado REAL,
+                    ultimo_acceso REAL
+                )
+            ''')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.tabla}_ultimo_acceso ON {self.tabla} (ultimo_acceso)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _recalcular_totales(self, conn):
+        self._total_bytes, self._total_entradas = conn.execute(
+            f'SELECT COALESCE(SUM(size), 0), COUNT(*) FROM {self.tabla}').fetchone()
+
+    def _purgar_si_toca(self, conn):
+        """Borra las entradas expiradas como mucho una vez cada SEGUNDOS_ENTRE_PURGAS. Retorna cuántas borró."""
+        ahora = time.time()
+        if ahora < self._proxima_purga:
+            return 0
+        self._proxima_purga = ahora + SEGUNDOS_ENTRE_PURGAS
+        borradas = conn.execute(f'DELETE FROM {self.tabla} WHERE fecha_guardado < ?', (ahora - self.ttl,)).rowcount
+        conn.commit()
+        self._recalcular_totales(conn)
+        return borradas
+
+    def _volcar_accesos(self, conn):
+        """Escribe los accesos pendientes (sin commit: lo hace quien llama)."""
+        if self._accesos_pendientes:
+            conn.executemany(f'UPDATE {self.tabla} SET ultimo_acceso = ? WHERE {self.columna_clave} = ?',
+                             [(acceso, clave) for clave, acceso in self._accesos_pendientes.items()])
+            self._accesos_pendientes.clear()
+
+    def _deshacer(self):
+        """Tras un error: deshace la transacción y vuelve a calcular los totales en la próxima escritura."""
+        if self._conn is not None:
+            self._conn.rollback()
+        self._proxima_purga = 0.0
+
+    def leer(self, clave, columnas):
+        """Retorna la tupla (columnas..., fecha_guardado) de la clave, o None. No comprueba el TTL."""
+        with self.lock:
+            conn = self._conectar()
+            row = conn.execute(
+                f'SELECT {", ".join(columnas)}, fecha_guardado FROM {self.tabla} WHERE {self.columna_clave} = ?',
+                (clave,)
+            ).fetchone()
+            if row:
+                self._accesos_pendientes[clave] = time.time()
+                if len(self._accesos_pendientes) >= ACCESOS_POR_ESCRITURA:
+                    self._volcar_accesos(conn)
+                    conn.commit()
+            return row
+
+    def guardar(self, clave, valores, size):
+        """
+        Guarda (o reemplaza) la entrada con los valores {columna: valor} y un tamaño de 'size' bytes.
+        Desaloja las entradas expiradas (periódicamente) y las menos usadas si se superan los límites.
+        Retorna el nº de entradas desalojadas.
+        """
+        ahora = time.time()
+        with self.lock:
+            conn = self._conectar()
+            try:
+                desalojadas = self._purgar_si_toca(conn)
+                anterior = conn.execute(f'SELECT size FROM {self.tabla} WHERE {self.columna_clave} = ?', (clave,)).fetchone()
+                columnas = [self.columna_clave, *valores, 'size', 'fecha_guardado', 'ultimo_acceso']
+                conn.execute(
+                    f'INSERT OR REPLACE INTO {self.tabla} ({", ".join(columnas)}) VALUES ({", ".join("?" * len(columnas))})',
+                    (clave, *valores.values(), size, ahora, ahora)
+                )
+                self._accesos_pendientes.pop(clave, None)
+                if anterior:
+                    self._total_bytes -= anterior[0] or 0
+                    self._total_entradas -= 1
+                self._total_bytes += size
+                self._total_entradas += 1
+                desalojadas += self._desalojar(conn)
+                conn.commit()
+                return desalojadas
+            except sqlite3.Error:
+                self._deshacer()
+                raise
+
+    def _desalojar(self, conn):
+        """Borra las entradas usadas hace más tiempo hasta respetar los límites (sin commit)."""
+        if self._total_bytes <= self.max_bytes and self._total_entradas <= self.max_entradas:
+            return 0
+        # El orden LRU tiene que estar al día antes de elegir qué desalojar
+        self._volcar_accesos(conn)
+        a_borrar = []
+        for clave, size in conn.execute(f'SELECT {self.columna_clave}, size FROM {self.tabla} ORDER BY ultimo_acceso ASC'):
+            if self._total_bytes <= self.max_bytes and self._total_entradas <= self.max_entradas:
+                break
+            a_borrar.append((clave,))
+            self._total_bytes -= size or 0
+            self._total_entradas -= 1
+        conn.executemany(f'DELETE FROM {self.tabla} WHERE {self.columna_clave} = ?', a_borrar)
+        return len(a_borrar)
+
+    def renovar(self, clave):
+        """Reinicia el TTL de la entrada (p. ej. tras revalidarla)."""
+        with self.lock:
+            conn = self._conectar()
+            try:
+                conn.execute(f'UPDATE {self.tabla} SET fecha_guardado = ? WHERE {self.columna_clave} = ?', (time.time(), clave))
+                conn.commit()
+            except sqlite3.Error:
+                self._deshacer()
+                raise
+
+    def eliminar(self, clave):
+        with self.lock:
+            self._accesos_pendientes.pop(clave, None)
+            conn = self._conectar()
+            try:
+                anterior = conn.execute(f'SELECT size FROM {self.tabla} WHERE {self.columna_clave} = ?', (clave,)).fetchone()
+                if anterior:
+                    conn.execute(f'DELETE FROM {self.tabla} WHERE {self.columna_clave} = ?', (clave,))
+                    conn.commit()
+                    self._total_bytes -= anterior[0] or 0
+                    self._total_entradas -= 1
+            except sqlite3.Error:
+                self._deshacer()
+                raise
+
+    def volcar_accesos(self):
+        """Escribe en disco los accesos pendientes (al salir del proceso)."""
+        with self.lock:
+            if self._accesos_pendientes:
+                conn = self._conectar()
+                self._volcar_accesos(conn)
+                conn.commit()
+
+    def limpiar(self):
+        """Vacía la tabla."""
+        with self.lock:
+            self._accesos_pendientes.clear()
+            conn = self._conectar()
+            conn.execute(f'DELETE FROM {self.tabla}')
+            conn.commit()
+            self._total_bytes = self._total_entradas = 0
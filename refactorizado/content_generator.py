@@ -1,21 +1,50 @@
 # content_generator.py
 # Genera un artículo de blog optimizado para SEO basado en fuentes y busca imágenes.
 
-import json
 import os  # Importar os para construir rutas de archivo
 import re
+import time
 from datetime import datetime
 
+import context_packer
 import database
+import json_incremental
 import llm_client
 import mock_publisher
 import web_tools
 
-
-def generate_seo_content(topic, num_sources=3, min_score=7):
+# Esquema del JSON generado (se pide a Gemini como salida estructurada y se valida en local)
+ESQUEMA_ARTICULO = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "meta_description": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "body": {"type": "string"},
+    },
+    "required": ["title", "meta_description", "tags", "body"],
+}
+CLAVES_REQUERIDAS = ESQUEMA_ARTICULO["required"]
+# Tipos de primer nivel que se comprueban mientras llega el stream
+TIPOS_RESPUESTA = {'title': str, 'meta_description': str, 'tags': list, 'body': str}
+# Consumir la respuesta en streaming (GENERACION_STREAMING=0 espera la respuesta completa, como antes)
+GENERACION_STREAMING = os.getenv("GENERACION_STREAMING", "1") == "1"
+
+
+def generate_seo_content(topic, num_sources=3, min_score=7, streaming=None):
     """
     Genera un artículo de blog optimizado para SEO basado en fuentes encontradas en la DB.
+    Con streaming=True (por defecto GENERACION_STREAMING) la respuesta se valida mientras llega
+    y una respuesta con estructura inválida se corta sin esperar al final.
     """
+    if streaming is None:
+        streaming = GENERACION_STREAMING
+    with llm_client.contexto_llamadas(tema=topic, etapa='generacion'):
+        return _generate_seo_content(topic, num_sources, min_score, streaming)
+
+
+def _generate_seo_content(topic, num_sources, min_score, streaming):
+    """Cuerpo de generate_seo_content (las llamadas a Gemini quedan asociadas al tema en la telemetría)."""
     print(f"\n✍️ Generando contenido para: {topic}")
 
     source_articles_meta = database.get_relevant_articles(topic=topic, min_score=min_score, limit=num_sources)
@@ -24,7 +53,7 @@ def generate_seo_content(topic, num_sources=3, min_score=7):
         print(f"❌ No se encontraron suficientes artículos fuente con score >= {min_score} para generar contenido sobre '{topic}'.")
         return None
 
-    print(f"📚 Encontrados {len(source_articles_meta)} artículos fuente relevantes. Cargando contenido...")
+    print(f"📚 Encontrados {len(source_articles_meta)} artículos fuente relevantes. Cargando contenido guardado...")
 
     source_contents = []
     total_score = 0
@@ -37,10 +66,16 @@ def generate_seo_content(topic, num_sources=3, min_score=7):
         score = article_meta.get('score', 0)
 
         if url and source_id is not None:
-            content = web_tools.fetch_and_extract_content(url)
+            # El texto se guardó al scrapear la fuente: la generación no depende de la red.
+            # Solo las fuentes antiguas (sin texto guardado) se descargan, una vez, y se completan en la DB.
+            content = article_meta.get('texto')
+            if not content:
+                content = web_tools.fetch_and_extract_content(url)
+                if content:
+                    database.guardar_texto_fuente(source_id, content)
 
             if content:
-                source_contents.append(f"### Fuente {i+1}: {article_meta.get('titulo', url)}\n\n{content}\n\n---\n\n")
+                source_contents.append((article_meta.get('titulo', url), content))
                 print(f"   - ✅ Contenido cargado de: {url[:60]}... (Score: {score})")
                 total_score += score
                 loaded_source_count += 1
@@ -55,7 +90,15 @@ def generate_seo_content(topic, num_sources=3, min_score=7):
     avg_source_score = total_score / loaded_source_count if loaded_source_count > 0 else 0
     print(f"📊 Score promedio de fuentes cargadas: {avg_source_score:.2f}")
 
-    sources_text = "".join(source_contents)
+    # Cada fuente se reduce a sus frases más relevantes para el tema: como mucho CONTEXTO_TOKENS_FUENTE
+    # por fuente y CONTEXTO_TOKENS_PROMPT entre todas, así el tamaño del prompt queda acotado.
+    textos_fuentes = context_packer.empaquetar_fuentes([content for _, content in source_contents], topic)
+    sources_text = "".join(
+        f"### Fuente {i+1}: {titulo}\n\n{texto}\n\n---\n\n"
+        for i, ((titulo, _), texto) in enumerate(zip(source_contents, textos_fuentes))
+    )
+    print(f"📏 Contexto de fuentes: ~{context_packer.contar_tokens(sources_text)} tokens "
+          f"(original ~{sum(context_packer.contar_tokens(c) for _, c in source_contents)})")
 
     generation_prompt = f"""
 Eres un experto redactor de contenido SEO y especialista en [marketing digital]. Tu objetivo es crear un artículo de blog **único, valioso y altamente optimizado para SEO** sobre el tema: **"{topic}"**.
@@ -96,48 +139,73 @@ Produce **SOLO** el objeto JSON. No añadas texto explicativo antes ni después
 
     try:
         print("🧠 Solicitando generación de contenido a Gemini...")
-        raw_response_text = llm_client.generate_raw_content(generation_prompt)
-
-        json_match = re.search(r'\{.*\}', raw_response_text, re.DOTALL)
-
-        if json_match:
-            json_str = json_match.group(0)
-            json_str = json_str.replace('```json', '').replace('```', '').strip()
-
-            # Regex para caracteres de control no válidos en JSON (excepto tab, newline, return)
-            # Incluye ASCII control (0-31 excepto 9,10,13), DEL (127), C1 control (128-159), Line/Paragraph Separator
-            regex_control_chars = r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F\u2028\u2029]'
-            cleaned_json_str = re.sub(regex_control_chars, '', json_str)
+        if streaming:
+            generated_data = _generar_en_streaming(generation_prompt)
+        else:
+            generated_data = _generar_completo(generation_prompt)
+        if generated_data is None:
+            return None
 
+        print("✅ Contenido generado y parseado con éxito.")
+        generated_data['tema'] = topic
+        generated_data['score_fuentes_promedio'] = avg_source_score
+        generated_data['fuente_ids_usadas'] = source_ids_used # Aunque no se usen ahora, es buena data
 
-            generated_data = json.loads(cleaned_json_str)
+        return generated_data
 
-            required_keys = ['title', 'meta_description', 'tags', 'body']
-            if not all(key in generated_data for key in required_keys):
-                 print(f"❌ Respuesta de IA con formato JSON incompleto. Faltan claves.")
-                 print(f"Respuesta limpia recibida:\n{cleaned_json_str[:500]}...")
-                 return None
+    except Exception as e:
+        print(f"❌ Error general al generar contenido: {str(e)}")
+        return None
 
-            print("✅ Contenido generado y parseado con éxito.")
-            generated_data['tema'] = topic
-            generated_data['score_fuentes_promedio'] = avg_source_score
-            generated_data['fuente_ids_usadas'] = source_ids_used # Aunque no se usen ahora, es buena data
 
-            return generated_data
+def _generar_completo(generation_prompt):
+    """
+    Espera la respuesta entera, pedida como JSON conforme a ESQUEMA_ARTICULO, y la valida
+    (con un intento de reparación en llm_client). Retorna el dict generado o None.
+    """
+    generated_data = llm_client.generate_structured(generation_prompt, ESQUEMA_ARTICULO)
+    if generated_data is None:
+        print("❌ La respuesta de la IA no contenía un objeto JSON válido con las claves requeridas.")
+    return generated_data
 
-        else:
-            print("❌ La respuesta de la IA no contenía un objeto JSON válido.")
-            print(f"Respuesta cruda recibida:\n{raw_response_text[:500]}...")
-            return None
 
-    except json.JSONDecodeError as e:
-        print(f"❌ Error al parsear la respuesta JSON de la IA (incluso después de limpieza): {str(e)}")
-        if 'cleaned_json_str' in locals():
-             print(f"Cadena intentando parsear (limpia):\n{cleaned_json_str[:500]}...")
-        return None
-    except Exception as e:
-        print(f"❌ Error general al generar contenido: {str(e)}")
+def _generar_en_streaming(generation_prompt):
+    """
+    Consume la respuesta por trozos y la parsea sobre la marcha: muestra el título y la meta descripción
+    en cuanto llegan y corta la generación en cuanto la estructura es inválida. Retorna el dict generado o None.
+    """
+    parser = json_incremental.ParserJSONIncremental(tipos=TIPOS_RESPUESTA, requeridas=CLAVES_REQUERIDAS)
+    inicio = time.monotonic()
+    recibido = []
+    generation_config = llm_client.config_json(ESQUEMA_ARTICULO)
+    stream = llm_client.generate_raw_content_stream(generation_prompt, generation_config=generation_config)
+    try:
+        for trozo in stream:
+            recibido.append(trozo)
+            if parser.terminado:
+                # Objeto ya completo: se agota el stream (espacios finales) para que la llamada se cierre
+                # con su uso real y se guarde en caché, en vez de abandonarla
+                continue
+            for clave, valor in parser.alimentar(trozo):
+                if clave == 'title':
+                    print(f"   📰 Título ({time.monotonic() - inicio:.1f} s): {valor}")
+                elif clave == 'meta_description':
+                    print(f"   🔎 Meta descripción ({time.monotonic() - inicio:.1f} s): {valor}")
+        generated_data = parser.finalizar()
+        errores = llm_client.validar_esquema(generated_data, ESQUEMA_ARTICULO)
+        if errores:
+            raise json_incremental.ErrorEstructuraJSON("; ".join(errores[:3]))
+        return generated_data
+    except json_incremental.ErrorEstructuraJSON as e:
+        print(f"❌ Generación abortada tras {time.monotonic() - inicio:.1f} s: {e}")
+        print(f"Respuesta recibida hasta el momento:\n{''.join(recibido)[:500]}...")
+        # Si el stream llegó a completarse, la respuesta ya está en caché: no debe volver a servirse
+        llm_client.descartar_respuesta(generation_prompt, generation_config=generation_config)
         return None
+    finally:
+        # Solo si se corta antes de tiempo (estructura inválida), cerrar el stream abandona la generación en curso
+        stream.close()
+
 
 # === Bloque para pruebas independientes ===
 if __name__ == "__main__":
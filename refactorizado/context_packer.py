@@ -0,0 +1,125 @@
+# context_packer.py
+# Selección del contexto que se envía a Gemini dentro de un presupuesto de tokens.
+# En lugar de cortar el texto por un número fijo de caracteres, se divide en frases, se ordenan por
+# relevancia respecto al tema (términos del tema + posición) y se eligen las mejores hasta llenar
+# el presupuesto. Las frases elegidas se devuelven en su orden original.
+# Un texto que ya cabe en el presupuesto se devuelve tal cual (el prompt no cambia y la caché LLM sigue valiendo).
+
+import os
+import re
+
+import relevance
+
+# Presupuestos por defecto (tokens aproximados)
+CONTEXTO_TOKENS_ANALISIS = int(os.getenv("CONTEXTO_TOKENS_ANALISIS", "2000"))
+CONTEXTO_TOKENS_FUENTE = int(os.getenv("CONTEXTO_TOKENS_FUENTE", "3000"))
+CONTEXTO_TOKENS_PROMPT = int(os.getenv("CONTEXTO_TOKENS_PROMPT", "9000"))
+
+# Caracteres por token en texto en español (aproximación suficiente para presupuestos)
+CARACTERES_POR_TOKEN = 4
+# Peso de la posición: las primeras frases (entradilla) suelen resumir el artículo
+PESO_POSICION = 0.5
+FRASES_CON_BONUS = 5
+# Frases con menos términos útiles que esto cuentan la mitad (pies de foto, fechas sueltas...)
+MIN_TERMINOS_FRASE = 4
+
+_RE_FIN_FRASE = re.compile(r'(?<=[.!?…])\s+(?=[A-ZÁÉÍÓÚÜÑ¿¡"«“(0-9])')
+
+
+def contar_tokens(texto):
+    """Estimación local del número de tokens de un texto (sin llamar a la API)."""
+    return len(texto) // CARACTERES_POR_TOKEN + 1 if texto else 0
+
+
+def dividir_frases(texto):
+    """Retorna la lista de (num_parrafo, frase) del texto."""
+    frases = []
+    for num_parrafo, parrafo in enumerate(p.strip() for p in texto.split("\n")):
+        if not parrafo:
+            continue
+        for frase in _RE_FIN_FRASE.split(parrafo):
+            frase = frase.strip()
+            if frase:
+                frases.append((num_parrafo, frase))
+    return frases
+
+
+def _puntuar_frase(frase, indice, terminos_tema):
+    terminos = relevance.normalizar(frase)
+    coincidencias = sum(1 for t in terminos if t in terminos_tema)
+    cobertura = len(terminos_tema.intersection(terminos)) / len(terminos_tema) if terminos_tema else 0.0
+    puntuacion = cobertura + coincidencias / (coincidencias + 2)
+    if len(terminos) < MIN_TERMINOS_FRASE:
+        puntuacion *= 0.5
+    if indice < FRASES_CON_BONUS:
+        puntuacion += PESO_POSICION * (FRASES_CON_BONUS - indice) / FRASES_CON_BONUS
+    return puntuacion
+
+
+def seleccionar_contexto(texto, tema, presupuesto_tokens):
+    """
+    Retorna el texto reducido a las frases más relevantes para el tema que caben en presupuesto_tokens,
+    en su orden original y respetando los saltos de párrafo.
+    """
+    if not texto or contar_tokens(texto) <= presupuesto_tokens:
+        return texto
+
+    frases = dividir_frases(texto)
+    terminos_tema = set(relevance.normalizar(tema))
+    orden = sorted(
+        range(len(frases)),
+        key=lambda i: (-_puntuar_frase(frases[i][1], i, terminos_tema), i)
+    )
+
+    elegidas = set()
+    usados = 0
+    for i in orden:
+        coste = contar_tokens(frases[i][1])
+        if usados + coste > presupuesto_tokens:
+            continue  # Puede caber otra frase más corta
+        elegidas.add(i)
+        usados += coste
+
+    if not elegidas:
+        # Ni una frase cabe entera: último recurso, corte por caracteres
+        return texto[:presupuesto_tokens * CARACTERES_POR_TOKEN]
+
+    partes = []
+    parrafo_anterior = None
+    for i in sorted(elegidas):
+        num_parrafo, frase = frases[i]
+        if parrafo_anterior is not None:
+            partes.append(" " if num_parrafo == parrafo_anterior else "\n")
+        partes.append(frase)
+        parrafo_anterior = num_parrafo
+    return "".join(partes)
+
+
+def empaquetar_fuentes(textos, tema, presupuesto_por_fuente=None, presupuesto_total=None):
+    """
+    Reduce varios textos para que cada uno quepa en presupuesto_por_fuente y todos juntos en presupuesto_total.
+    El presupuesto que no usan las fuentes cortas se reparte entre las largas. Retorna los textos en el mismo orden.
+    """
+    presupuesto_por_fuente = presupuesto_por_fuente or CONTEXTO_TOKENS_FUENTE
+    presupuesto_total = presupuesto_total or CONTEXTO_TOKENS_PROMPT
+    if not textos:
+        return []
+
+    necesarios = [min(contar_tokens(t), presupuesto_por_fuente) for t in textos]
+    asignados = [0] * len(textos)
+    restante = presupuesto_total
+    pendientes = list(range(len(textos)))
+    # Reparto equitativo: las fuentes que necesitan menos que su parte liberan presupuesto para las demás
+    while pendientes and restante > 0:
+        parte = restante // len(pendientes)
+        satisfechas = [i for i in pendientes if necesarios[i] <= parte]
+        if not satisfechas:
+            for i in pendientes:
+                asignados[i] = parte
+            break
+        for i in satisfechas:
+            asignados[i] = necesarios[i]
+            restante -= necesarios[i]
+            pendientes.remove(i)
+
+    return [seleccionar_contexto(texto, tema, asignado) for texto, asignado in zip(textos, asignados)]
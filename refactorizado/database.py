@@ -1,21 +1,390 @@
 # database.py (Corregido: get_config no define ni retorna prompts por defecto como strings)
 
+import atexit
+import base64
+import functools
+import hashlib
 import json
 import os
 import sqlite3
+import threading
+import zlib
 from datetime import datetime
 
-# Define la ruta a tu archivo de esquema SQL
-SCHEMA_FILE_PATH = "C:\\Users\\oscar\\Desktop\\proyectospy\\auto-seo\\schema.sql" # <-- VERIFICA ESTA RUTA
+import dedup
+import relevance
+from url_utils import canonicalize_article_url
+
+# schema.sql está en la raíz del proyecto, junto a esta carpeta (se puede cambiar con DB_SCHEMA_FILE)
+SCHEMA_FILE_PATH = os.getenv(
+    "DB_SCHEMA_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema.sql")
+)
 DB_FILE_PATH = "seo_autopilot.db"
 
 
+# === Conexiones ===
+# Cada hilo reutiliza su propia conexión (sqlite3 no comparte conexiones entre hilos) en lugar de abrir
+# y cerrar una por consulta. En modo WAL los lectores no bloquean al escritor ni al revés.
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "10000"))
+DB_CACHED_STATEMENTS = 256
+
+_local = threading.local()
+# (hilo, conexión) de todas las conexiones abiertas, para cerrar las de hilos que ya terminaron
+_conexiones = []
+_conexiones_lock = threading.Lock()
+
+
+def _abrir_conexion():
+    # Cada conexión solo la usa su hilo; check_same_thread=False permite cerrarla desde otro
+    # (la limpieza de las de hilos terminados y cerrar_conexiones), siempre bajo _conexiones_lock.
+    conn = sqlite3.connect(DB_FILE_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, cached_statements=DB_CACHED_STATEMENTS,
+                           check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    registrar_funciones_sql(conn)
+    return conn
+
+
+def registrar_funciones_sql(conn):
+    """
+    Registra en conn las funciones Python que usan los triggers de articulos_fts (raices y descomprimir_texto).
+    SQLite no las guarda en el fichero: cualquier conexión que escriba en articulos o articulos_fuente_tags
+    sin pasar por este módulo (otro script, el cliente sqlite3...) tiene que registrarlas antes, o esas
+    escrituras fallan con "no such function: raices". Si la DB se modificó sin los triggers (copia
+    restaurada, triggers borrados...), reconstruir_indice_fts() vuelve a sincronizar el índice.
+    """
+    # Los triggers del índice FTS indexan el texto de las fuentes, que se guarda comprimido
+    conn.create_function('descomprimir_texto', 1, descomprimir_texto, deterministic=True)
+    conn.create_function('raices', 1, _raices, deterministic=True)
+
+
+def _conectar():
+    """Retorna la conexión persistente del hilo actual (se abre la primera vez, con los PRAGMA de rendimiento)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.ruta == DB_FILE_PATH:
+        return conn
+    anterior = conn
+    conn = _abrir_conexion()
+    _local.conn = conn
+    _local.ruta = DB_FILE_PATH
+    with _conexiones_lock:
+        vivas = []
+        for hilo, conexion in _conexiones:
+            # Se descartan las de hilos terminados y, si cambió DB_FILE_PATH (p. ej. en pruebas), la anterior de este hilo
+            if hilo.is_alive() and conexion is not anterior:
+                vivas.append((hilo, conexion))
+            else:
+                _cerrar(conexion)
+        vivas.append((threading.current_thread(), conn))
+        _conexiones[:] = vivas
+    return conn
+
+
+def _cerrar(conexion):
+    """Cierra una conexión ignorando errores: quien la llama ya la ha quitado (o va a quitarla) de _conexiones."""
+    try:
+        conexion.close()
+    except sqlite3.Error as e:
+        print(f"⚠️ Error al cerrar una conexión SQLite: {e}")
+
+
+def _liberar(conn):
+    """Fin de uso de la conexión en una función: no se cierra, pero no puede quedar una transacción abierta."""
+    if conn.in_transaction:
+        conn.rollback()
+
+
+def cerrar_conexiones():
+    """Cierra todas las conexiones abiertas (al salir del proceso o antes de borrar/mover el fichero de la DB)."""
+    with _conexiones_lock:
+        for _, conexion in _conexiones:
+            _cerrar(conexion)
+        _conexiones.clear()
+    _local.__dict__.clear()
+
+
+atexit.register(cerrar_conexiones)
+
+
+# Un único escritor a la vez en todo el proceso: los temas procesados en paralelo comparten la DB
+# y SQLite solo admite un escritor; serializarlo aquí evita los "database is locked".
+_db_write_lock = threading.RLock()
+
+
+def _serializar_escritura(func):
+    """Decorador para las funciones que escriben en la DB: las ejecuta bajo _db_write_lock."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _db_write_lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# === Migraciones ===
+# schema.sql crea las tablas que falten (CREATE TABLE IF NOT EXISTS), pero no altera las existentes.
+# Los cambios posteriores son migraciones numeradas; PRAGMA user_version guarda la última aplicada.
+# Cada paso es una sentencia SQL o una función(cursor), y debe ser idempotente: una DB nueva ya
+# tiene en schema.sql parte de lo que añaden las primeras migraciones.
+
+def _columna(tabla, nombre, tipo):
+    """Paso de migración que añade una columna si no existe."""
+    def paso(cursor):
+        cursor.execute(f'PRAGMA table_info({tabla})')
+        if nombre not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f'ALTER TABLE {tabla} ADD COLUMN {nombre} {tipo}')
+            print(f"✅ Columna '{nombre}' añadida a la tabla '{tabla}'.")
+    return paso
+
+
+# Pesos BM25 de las columnas de articulos_fts (titulo, resumen, tags, texto)
+FTS_PESOS_COLUMNAS = "10.0, 5.0, 5.0, 1.0"
+
+
+@functools.lru_cache(maxsize=256)
+def _raices(texto):
+    """
+    Función SQL raices(): articulos_fts indexa las raíces de relevance.normalizar, no las palabras.
+    Con caché: los triggers de tags desindexan y vuelven a indexar el mismo texto.
+    """
+    return ' '.join(relevance.normalizar(texto)) if texto else None
+
+
+def _sql_fts(id_fuente, fila=None, borrar=False, tags_sin=None, tags_con=None):
+    """
+    Sentencia que indexa (o, con borrar, desindexa) en articulos_fts la fuente id_fuente.
+    fila: 'new'/'old' para tomar los valores del trigger; si no, se leen de articulos (alias 'a';
+    sin WHERE si id_fuente es 'a.id', para indexar todas las fuentes).
+    tags_sin / tags_con: tag_id que se quita / añade para reconstruir los tags que había antes del cambio.
+    """
+    filtro_tags = f"t.id IN (SELECT tag_id FROM articulos_fuente_tags WHERE articulo_fuente_id = {id_fuente})"
+    if tags_sin:
+        filtro_tags += f" AND t.id != {tags_sin}"
+    if tags_con:
+        filtro_tags = f"({filtro_tags} OR t.id = {tags_con})"
+    # Orden fijo: al desindexar hay que repetir los mismos términos en las mismas posiciones
+    tags = f"(SELECT group_concat(tag, ' ') FROM (SELECT t.tag FROM tags t WHERE {filtro_tags} ORDER BY t.tag))"
+    origen = fila or 'a'
+    valores = (f"raices({origen}.titulo), raices({origen}.resumen), raices({tags}), "
+               f"raices(descomprimir_texto({origen}.texto_comprimido))")
+    if borrar:
+        columnas, valores = "(articulos_fts, rowid, titulo, resumen, tags, texto)", f"'delete', {id_fuente}, {valores}"
+    else:
+        columnas, valores = "(rowid, titulo, resumen, tags, texto)", f"{id_fuente}, {valores}"
+    if fila:
+        return f"INSERT INTO articulos_fts {columnas} VALUES ({valores})"
+    donde = "" if id_fuente == 'a.id' else f" WHERE a.id = {id_fuente}"
+    return f"INSERT INTO articulos_fts {columnas} SELECT {valores} FROM articulos a{donde}"
+
+
+# Contadores agregados que mantienen los triggers: tabla -> (tabla origen, {columna: (tipo, expresión sobre la fila)})
+CONTADORES = {
+    'contadores_fuentes': ('articulos', {
+        'usada_para_generar': ('INTEGER', 'COALESCE({fila}.usada_para_generar, 0)'),
+        'score': ('INTEGER', 'COALESCE({fila}.score, 0)'),
+    }),
+    'contadores_generados': ('articulos_generados', {
+        'tema': ('TEXT', '{fila}.tema'),
+        'estado': ('TEXT', "COALESCE({fila}.estado, '')"),
+    }),
+}
+
+
+def _pasos_contador(tabla):
+    """Pasos de migración que crean la tabla de contadores, sus triggers y la llenan con los totales actuales."""
+    origen, claves = CONTADORES[tabla]
+    columnas = ', '.join(claves)
+    def expresiones(fila):
+        return ', '.join(expr.format(fila=fila) for _, expr in claves.values())
+    def sumar(fila):
+        return (f"INSERT INTO {tabla} ({columnas}, total) VALUES ({expresiones(fila)}, 1) "
+                f"ON CONFLICT ({columnas}) DO UPDATE SET total = total + 1")
+    def restar(fila):
+        condicion = ' AND '.join(f"{columna} = {expr.format(fila=fila)}" for columna, (_, expr) in claves.items())
+        return f"UPDATE {tabla} SET total = total - 1 WHERE {condicion}"
+    return [
+        f"CREATE TABLE IF NOT EXISTS {tabla} ({', '.join(f'{c} {tipo} NOT NULL' for c, (tipo, _) in claves.items())}, "
+        f"total INTEGER NOT NULL DEFAULT 0, PRIMARY KEY ({columnas}))",
+        f"DELETE FROM {tabla}",
+        f"INSERT INTO {tabla} ({columnas}, total) SELECT {expresiones(origen)}, COUNT(*) FROM {origen} GROUP BY {expresiones(origen)}",
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_insertar AFTER INSERT ON {origen} BEGIN {sumar('new')}; END",
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_borrar AFTER DELETE ON {origen} BEGIN {restar('old')}; END",
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_actualizar AFTER UPDATE OF {columnas} ON {origen} BEGIN "
+        f"{restar('old')}; {sumar('new')}; END",
+    ]
+
+
+# Vacía articulos_fts y vuelve a indexar todas las fuentes (migración 7 y reconstruir_indice_fts)
+PASOS_REINDEXAR_FTS = [
+    "INSERT INTO articulos_fts (articulos_fts) VALUES ('delete-all')",
+    _sql_fts('a.id'),
+]
+
+
+def _recalcular_urls_canonicas(cursor):
+    """Paso de migración: url_canonica de todas las fuentes con la versión actual de canonicalize_article_url."""
+    filas = cursor.execute('SELECT id, url FROM articulos').fetchall()
+    cursor.executemany('UPDATE articulos SET url_canonica = ? WHERE id = ?',
+                       [(canonicalize_article_url(url), articulo_id) for articulo_id, url in filas])
+
+
+MIGRACIONES = [
+    (1, "Texto comprimido, URL canónica y SimHash de las fuentes", [
+        _columna('articulos', 'texto_comprimido', 'BLOB'),
+        _columna('articulos', 'texto_hash', 'TEXT'),
+        _columna('articulos', 'url_canonica', 'TEXT'),
+        _columna('articulos', 'simhash', 'INTEGER'),
+    ]),
+    (2, "Índices de las consultas frecuentes", [
+        # get_relevant_articles: fuentes no usadas por score y fecha
+        'CREATE INDEX IF NOT EXISTS idx_articulos_pendientes ON articulos (usada_para_generar, score, fecha_publicacion_fuente)',
+        # get_all_sources: últimas fuentes scrapeadas
+        'CREATE INDEX IF NOT EXISTS idx_articulos_fecha_scraping ON articulos (fecha_scraping)',
+        # get_all_generated_articles: sin filtro, por tema o por estado, siempre por fecha
+        'CREATE INDEX IF NOT EXISTS idx_generados_fecha ON articulos_generados (fecha_generacion)',
+        'CREATE INDEX IF NOT EXISTS idx_generados_tema_fecha ON articulos_generados (tema, fecha_generacion)',
+        'CREATE INDEX IF NOT EXISTS idx_generados_estado_fecha ON articulos_generados (estado, fecha_generacion)',
+        # Imágenes de un artículo generado
+        'CREATE INDEX IF NOT EXISTS idx_imagenes_articulo ON imagenes_generadas (articulo_generado_id)',
+        # Telemetría (también está en schema.sql)
+        'CREATE INDEX IF NOT EXISTS idx_llm_llamadas_fecha ON llm_llamadas (fecha)',
+    ]),
+    (3, "Índice de texto completo de las fuentes (FTS5)", [
+        # Sin contenido propio (content=''): el texto ya está guardado, comprimido, en articulos.
+        # rowid = articulos.id. Para desindexar una fila hay que repetir sus valores, que se recalculan.
+        """CREATE VIRTUAL TABLE IF NOT EXISTS articulos_fts USING fts5(
+               titulo, resumen, tags, texto,
+               content = '', tokenize = 'unicode61 remove_diacritics 2'
+           )""",
+        f"INSERT INTO articulos_fts (articulos_fts, rank) VALUES ('rank', 'bm25({FTS_PESOS_COLUMNAS})')",
+        f"""CREATE TRIGGER IF NOT EXISTS articulos_fts_insertar AFTER INSERT ON articulos BEGIN
+               {_sql_fts('new.id', 'new')};
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS articulos_fts_actualizar AFTER UPDATE OF titulo, resumen, texto_comprimido ON articulos BEGIN
+               {_sql_fts('old.id', 'old', borrar=True)};
+               {_sql_fts('new.id', 'new')};
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS articulos_fts_borrar AFTER DELETE ON articulos BEGIN
+               {_sql_fts('old.id', 'old', borrar=True)};
+           END""",
+        # Los tags se guardan después que la fuente: se desindexa la fila con los tags de antes y se vuelve a indexar
+        f"""CREATE TRIGGER IF NOT EXISTS articulos_fts_tag_insertar AFTER INSERT ON articulos_fuente_tags BEGIN
+               {_sql_fts('new.articulo_fuente_id', borrar=True, tags_sin='new.tag_id')};
+               {_sql_fts('new.articulo_fuente_id')};
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS articulos_fts_tag_borrar AFTER DELETE ON articulos_fuente_tags BEGIN
+               {_sql_fts('old.articulo_fuente_id', borrar=True, tags_con='old.tag_id')};
+               {_sql_fts('old.articulo_fuente_id')};
+           END""",
+        # Fuentes guardadas antes de la migración
+        _sql_fts('a.id'),
+        # Nº de fuentes que contienen cada término (para descartar los que aparecen en casi todas)
+        "CREATE VIRTUAL TABLE IF NOT EXISTS articulos_fts_vocab USING fts5vocab(articulos_fts, 'row')",
+    ]),
+    (4, "Contadores de fuentes y artículos generados para los listados paginados",
+        _pasos_contador('contadores_fuentes') + _pasos_contador('contadores_generados')),
+    (5, "URL canónica recalculada e indexada para el índice de URLs conocidas", [
+        # canonicalize_article_url ya no quita parámetros genéricos (source, ref...): se recalcula.
+        # Si vuelve a cambiar, hará falta otra migración con este mismo paso.
+        _recalcular_urls_canonicas,
+        'CREATE INDEX IF NOT EXISTS idx_articulos_url_canonica ON articulos (url_canonica)',
+    ]),
+    (6, "Índices de los listados paginados sobre COALESCE(fecha, '')", [
+        # Los listados ordenan por COALESCE(fecha, '') para no perder las filas sin fecha; los índices
+        # de la migración 2 sobre la columna sola ya no sirven para esas consultas
+        'DROP INDEX IF EXISTS idx_articulos_fecha_scraping',
+        'DROP INDEX IF EXISTS idx_generados_fecha',
+        'DROP INDEX IF EXISTS idx_generados_tema_fecha',
+        'DROP INDEX IF EXISTS idx_generados_estado_fecha',
+        "CREATE INDEX IF NOT EXISTS idx_articulos_orden_scraping ON articulos (COALESCE(fecha_scraping, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_generados_orden ON articulos_generados (COALESCE(fecha_generacion, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_generados_tema_orden ON articulos_generados (tema, COALESCE(fecha_generacion, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_generados_estado_orden ON articulos_generados (estado, COALESCE(fecha_generacion, ''))",
+    ]),
+    # Las fuentes escritas por conexiones sin las funciones de los triggers (ver registrar_funciones_sql)
+    # pueden haber dejado el índice desincronizado. Si cambia relevance.normalizar (las raíces indexadas),
+    # hace falta otra migración con estos mismos pasos.
+    (7, "Reconstrucción del índice de texto completo de las fuentes", PASOS_REINDEXAR_FTS),
+]
+
+
+def version_esquema():
+    """Retorna la última migración aplicada a la DB (PRAGMA user_version)."""
+    conn = _conectar()
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        _liberar(conn)
+
+
+def _aplicar_migraciones(conn):
+    """Aplica en orden las migraciones pendientes, cada una en su propia transacción. Retorna la versión final."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for numero, descripcion, pasos in MIGRACIONES:
+        if numero <= version:
+            continue
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        try:
+            for paso in pasos:
+                if callable(paso):
+                    paso(cursor)
+                else:
+                    cursor.execute(paso)
+            # user_version forma parte de la transacción: o se aplica todo o nada
+            cursor.execute(f'PRAGMA user_version = {int(numero)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"❌ Falló la migración {numero} ({descripcion}).")
+            raise
+        version = numero
+        print(f"✅ Migración {numero} aplicada: {descripcion}.")
+    return version
+
+
+def comprimir_texto(texto):
+    """Comprime el texto de una fuente. Retorna (blob_zlib, sha256_hex) o (None, None) si no hay texto."""
+    if not texto:
+        return None, None
+    datos = texto.encode('utf-8')
+    return zlib.compress(datos, 6), hashlib.sha256(datos).hexdigest()
+
+
+def descomprimir_texto(blob):
+    """Inverso de comprimir_texto. Retorna el texto o None si no hay blob o está corrupto."""
+    if not blob:
+        return None
+    try:
+        return zlib.decompress(blob).decode('utf-8')
+    except (zlib.error, UnicodeDecodeError) as e:
+        print(f"⚠️ Texto de fuente comprimido ilegible: {e}")
+        return None
+
+
+def _comprobar_indice_fts(conn):
+    """
+    Recuperación al arrancar: si articulos_fts no tiene indexadas tantas fuentes como hay en articulos
+    (la DB se modificó sin los triggers), lo reconstruye. Contar ambas tablas cuesta unos milisegundos.
+    """
+    try:
+        indexadas = conn.execute('SELECT COUNT(*) FROM articulos_fts_docsize').fetchone()[0]
+        total = conn.execute('SELECT COUNT(*) FROM articulos').fetchone()[0]
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ No se pudo comprobar el índice de texto completo: {str(e)}")
+        return
+    if indexadas != total:
+        print(f"⚠️ El índice de texto completo tiene {indexadas} fuentes y la tabla 'articulos' {total}: se reconstruye.")
+        reconstruir_indice_fts()
+
+
 def inicializar_db():
     """
     Inicializa la conexión con la base de datos y crea las tablas.
     """
     print(f"--- Intentando inicializar DB: {DB_FILE_PATH} ---")
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     sql_script = ""
     try:
@@ -33,6 +402,8 @@ def inicializar_db():
             cursor.executescript(sql_script)
             conn.commit()
             print("✅ Script SQL ejecutado y commit realizado.")
+            print(f"✅ Esquema en la versión {_aplicar_migraciones(conn)}.")
+            _comprobar_indice_fts(conn)
         else:
              print("⏩ Saltando ejecución del script SQL porque estaba vacío o no se encontró el archivo.")
 
@@ -63,7 +434,7 @@ def inicializar_db():
         conn.rollback()
         raise
     finally:
-        conn.close()
+        _liberar(conn)
         print("--- Fin inicialización DB ---")
 
 
@@ -71,7 +442,7 @@ def inicializar_db():
 
 def url_existe(url):
     """Verifica si una URL ya existe en la base de datos (tabla articulos)."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         cursor.execute('SELECT 1 FROM articulos WHERE url = ?', (url,))
@@ -83,11 +454,11 @@ def url_existe(url):
         print(f"Error en url_existe: {str(e)}")
         return False
     finally:
-        conn.close()
+        _liberar(conn)
 
 def obtener_urls_existentes():
     """Obtiene todas las URLs ya almacenadas en la base de datos (tabla articulos)."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         cursor.execute('SELECT url FROM articulos')
@@ -99,11 +470,99 @@ def obtener_urls_existentes():
         print(f"Error en obtener_urls_existentes: {str(e)}")
         return set()
     finally:
-        conn.close()
+        _liberar(conn)
+
+# === Índice en memoria de URLs conocidas ===
+# Se carga una vez por proceso desde la columna url_canonica y se mantiene al día al guardar fuentes,
+# para descartar duplicados sin abrir una conexión a SQLite por cada URL candidata.
+# Guarda URLs canónicas (url_utils.canonicalize_article_url): las variantes AMP, móvil o con
+# parámetros de seguimiento de una URL ya guardada también cuentan como conocidas.
+SQL_URLS_CANONICAS = 'SELECT url_canonica FROM articulos WHERE url_canonica IS NOT NULL'
+_urls_conocidas = None
+_urls_conocidas_lock = threading.Lock()
+
+
+def cargar_indice_urls(forzar=False):
+    """Carga (o recarga con forzar=True) el índice en memoria de URLs ya guardadas. Retorna su tamaño."""
+    global _urls_conocidas
+    with _urls_conocidas_lock:
+        if _urls_conocidas is None or forzar:
+            _urls_conocidas = _leer_urls_canonicas()
+            print(f"📇 Índice de URLs conocidas cargado: {len(_urls_conocidas)} URLs.")
+        return len(_urls_conocidas)
+
+
+def _leer_urls_canonicas():
+    """URLs canónicas de todas las fuentes guardadas, leídas del índice idx_articulos_url_canonica (sin tocar los textos)."""
+    conn = _conectar()
+    try:
+        urls = {row[0] for row in conn.execute(SQL_URLS_CANONICAS)}
+        # Fuentes escritas sin url_canonica (fuera de guardar_articulos): se calcula aquí
+        urls.update(canonicalize_article_url(row[0]) for row in conn.execute('SELECT url FROM articulos WHERE url_canonica IS NULL'))
+        return urls
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Error SQL en cargar_indice_urls: {str(e)}. ¿Se aplicó la migración 5?")
+        return set()
+    finally:
+        _liberar(conn)
+
+
+def url_conocida(url):
+    """Como url_existe, pero contra el índice en memoria de URLs canónicas (se carga la primera vez que se usa)."""
+    if _urls_conocidas is None:
+        cargar_indice_urls()
+    return canonicalize_article_url(url) in _urls_conocidas
+
+
+def _registrar_url_conocida(url):
+    with _urls_conocidas_lock:
+        if _urls_conocidas is not None:
+            _urls_conocidas.add(canonicalize_article_url(url))
+
+
+# === Índice en memoria de huellas SimHash de las fuentes guardadas ===
+_indice_simhash = None
+_indice_simhash_lock = threading.Lock()
+
+
+def cargar_indice_simhash(forzar=False):
+    """Carga (o recarga) el índice de huellas SimHash de las fuentes guardadas. Retorna su tamaño."""
+    global _indice_simhash
+    with _indice_simhash_lock:
+        if _indice_simhash is None or forzar:
+            indice = dedup.IndiceSimHash()
+            conn = _conectar()
+            try:
+                for articulo_id, url, huella in conn.execute('SELECT id, url, simhash FROM articulos WHERE simhash IS NOT NULL'):
+                    indice.agregar(dedup.desde_entero_sqlite(huella), url)
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ Error SQL en cargar_indice_simhash: {str(e)}. ¿Existe la columna 'simhash'?")
+            finally:
+                _liberar(conn)
+            _indice_simhash = indice
+            print(f"🧬 Índice de huellas SimHash cargado: {len(indice)} fuentes.")
+        return len(_indice_simhash)
+
+
+def buscar_casi_duplicado(huella):
+    """
+    Busca entre las fuentes guardadas una cuyo texto sea casi idéntico (SimHash a distancia <= dedup.MAX_DISTANCIA).
+    Retorna (url_de_la_fuente, distancia) o None.
+    """
+    if _indice_simhash is None:
+        cargar_indice_simhash()
+    return _indice_simhash.buscar(huella)
+
+
+def _registrar_simhash(huella, url):
+    with _indice_simhash_lock:
+        if _indice_simhash is not None:
+            _indice_simhash.agregar(huella, url)
+
 
 def get_source_id_by_url(url):
     """Obtiene el ID de un artículo fuente por su URL."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         cursor.execute('SELECT id FROM articulos WHERE url = ?', (url,))
@@ -116,84 +575,230 @@ def get_source_id_by_url(url):
         print(f"Error en get_source_id_by_url: {str(e)}")
         return None
     finally:
-        conn.close()
+        _liberar(conn)
 
-def guardar_articulo(articulo):
-    """Guarda un artículo fuente en la tabla 'articulos' y sus tags."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+# Máximo de parámetros por consulta "IN (...)" (SQLite antiguo admite 999 variables por sentencia)
+MAX_PARAMETROS_CONSULTA = 500
+
+# Caché en proceso tag -> id (los tags nunca se borran, así que un id conocido sigue siendo válido).
+# Solo se actualiza tras un commit; se vacía si cambia DB_FILE_PATH.
+_ids_tags = {}
+_ids_tags_ruta = None
+_ids_tags_lock = threading.Lock()
+
+
+def _en_bloques(valores, tamano=MAX_PARAMETROS_CONSULTA):
+    valores = list(valores)
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def _ids_por_valor(cursor, tabla, columna, valores):
+    """Retorna {valor: id} de las filas de 'tabla' cuya 'columna' está en valores, en consultas por bloques."""
+    ids = {}
+    for bloque in _en_bloques(valores):
+        marcadores = ','.join('?' * len(bloque))
+        cursor.execute(f'SELECT {columna}, id FROM {tabla} WHERE {columna} IN ({marcadores})', bloque)
+        ids.update(cursor.fetchall())
+    return ids
+
+
+def _resolver_tags(cursor, tags):
+    """
+    Retorna {tag: id} para todos los tags, insertando los que no existan. Los ids que ya están en la caché
+    no tocan la DB; el resto se resuelve con un executemany y un SELECT por bloques.
+    Los ids nuevos se devuelven aparte para añadirlos a la caché cuando la transacción se confirme.
+    """
+    global _ids_tags, _ids_tags_ruta
+    with _ids_tags_lock:
+        if _ids_tags_ruta != DB_FILE_PATH:
+            _ids_tags = {}
+            _ids_tags_ruta = DB_FILE_PATH
+        ids = {tag: _ids_tags[tag] for tag in tags if tag in _ids_tags}
+    faltan = [tag for tag in tags if tag not in ids]
+    nuevos = {}
+    if faltan:
+        cursor.executemany('INSERT OR IGNORE INTO tags (tag) VALUES (?)', [(tag,) for tag in faltan])
+        nuevos = _ids_por_valor(cursor, 'tags', 'tag', faltan)
+        ids.update(nuevos)
+    return ids, nuevos
+
+
+@_serializar_escritura
+def guardar_articulos(articulos):
+    """
+    Guarda varios artículos fuente (y sus tags) en una única transacción.
+    Retorna la lista de IDs en el mismo orden que 'articulos' (el ID existente si la URL ya estaba guardada,
+    None si no se pudo obtener). Si falla, deshace todo y relanza la excepción.
+    """
+    if not articulos:
+        return []
+    conn = _conectar()
     cursor = conn.cursor()
     try:
-        cursor.execute('''
+        filas = []
+        huellas = []
+        for articulo in articulos:
+            texto_comprimido, texto_hash = comprimir_texto(articulo.get('texto'))
+            huella = articulo.get('simhash')
+            if huella is None:
+                huella = dedup.simhash(articulo.get('texto'))
+            huellas.append(huella)
+            filas.append((
+                articulo.get('titulo', ''),
+                articulo['url'],
+                articulo['score'],
+                articulo.get('resumen', ''),
+                articulo.get('fuente', ''),
+                articulo.get('fecha_publicacion_fuente', datetime.now().strftime('%Y-%m-%d')),
+                articulo.get('usada_para_generar', 0),
+                texto_comprimido,
+                texto_hash,
+                canonicalize_article_url(articulo['url']),
+                dedup.a_entero_sqlite(huella)
+            ))
+
+        cursor.executemany('''
             INSERT OR IGNORE INTO articulos
-            (titulo, url, score, resumen, fuente, fecha_publicacion_fuente, fecha_scraping, usada_para_generar)
-            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
-        ''', (
-            articulo.get('titulo', ''),
-            articulo['url'],
-            articulo['score'],
-            articulo.get('resumen', ''),
-            articulo.get('fuente', ''),
-            articulo.get('fecha_publicacion_fuente', datetime.now().strftime('%Y-%m-%d')),
-            articulo.get('usada_para_generar', 0)
-        ))
-        articulo_id = cursor.lastrowid
-        # ... (lógica para obtener ID si usó IGNORE y guardar tags) ...
-        if not articulo_id:
-             cursor.execute('SELECT id FROM articulos WHERE url = ?', (articulo['url'],))
-             articulo_id_row = cursor.fetchone()
-             if articulo_id_row:
-                  articulo_id = articulo_id_row[0]
-             else:
-                  print(f"⚠️ Falló al obtener ID para URL {articulo['url']} después de INSERT OR IGNORE.")
-                  conn.rollback()
-                  return None
-
-        tag_table_name = 'articulos_fuente_tags'
-        try:
-            for tag in articulo.get('tags', []):
-                tag = tag.strip()
-                if not tag: continue
-                cursor.execute('INSERT OR IGNORE INTO tags (tag) VALUES (?)', (tag,))
-                cursor.execute('SELECT id FROM tags WHERE tag = ?', (tag,))
-                tag_id_row = cursor.fetchone()
-                if tag_id_row:
-                    tag_id = tag_id_row[0]
-                    cursor.execute(f'INSERT OR IGNORE INTO {tag_table_name} (articulo_fuente_id, tag_id) VALUES (?, ?)', (articulo_id, tag_id))
-        except Exception as e:
-             print(f"Error en la sección de tags/relaciones para artículo ID {articulo_id}: {str(e)}")
-             pass # No relanzar, solo imprimir advertencia
-
+            (titulo, url, score, resumen, fuente, fecha_publicacion_fuente, fecha_scraping, usada_para_generar, texto_comprimido, texto_hash, url_canonica, simhash)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?)
+        ''', filas)
+        # Las fuentes que ya existían: completar su texto si se guardaron antes de tener esta columna
+        cursor.executemany(
+            'UPDATE articulos SET texto_comprimido = ?, texto_hash = ?, simhash = ? WHERE url = ? AND texto_comprimido IS NULL',
+            [(fila[7], fila[8], fila[10], fila[1]) for fila in filas if fila[7]]
+        )
+        ids_por_url = _ids_por_valor(cursor, 'articulos', 'url', {fila[1] for fila in filas})
+        ids = [ids_por_url.get(articulo['url']) for articulo in articulos]
+        for articulo, articulo_id in zip(articulos, ids):
+            if articulo_id is None:
+                print(f"⚠️ Falló al obtener ID para URL {articulo['url']} después de INSERT OR IGNORE.")
+
+        tags_por_articulo = []
+        for articulo, articulo_id in zip(articulos, ids):
+            tags = [tag.strip() for tag in articulo.get('tags', []) if tag and tag.strip()]
+            if articulo_id is not None:
+                tags_por_articulo.append((articulo_id, tags))
+        todos_tags = list(dict.fromkeys(tag for _, tags in tags_por_articulo for tag in tags))
+        ids_tags, nuevos_tags = _resolver_tags(cursor, todos_tags)
+        cursor.executemany(
+            'INSERT OR IGNORE INTO articulos_fuente_tags (articulo_fuente_id, tag_id) VALUES (?, ?)',
+            [(articulo_id, ids_tags[tag]) for articulo_id, tags in tags_por_articulo for tag in tags if tag in ids_tags]
+        )
 
         conn.commit()
-        return articulo_id
+        with _ids_tags_lock:
+            if _ids_tags_ruta == DB_FILE_PATH:
+                _ids_tags.update(nuevos_tags)
+        for articulo, huella, articulo_id in zip(articulos, huellas, ids):
+            if articulo_id is not None:
+                _registrar_url_conocida(articulo['url'])
+                _registrar_simhash(huella, articulo['url'])
+        return ids
 
     except Exception as e:
-        print(f"Error general al guardar artículo fuente {articulo.get('url', 'N/A')}: {str(e)}")
+        print(f"Error general al guardar {len(articulos)} artículos fuente: {str(e)}")
         conn.rollback()
         raise
     finally:
-        conn.close()
+        _liberar(conn)
+
+
+def guardar_articulo(articulo):
+    """Guarda un artículo fuente en la tabla 'articulos' y sus tags. Retorna su ID (o None)."""
+    return guardar_articulos([articulo])[0]
+
+
+# Consultas frecuentes, compartidas con verificar_planes_consulta()
+SQL_FUENTES_PENDIENTES = '''
+    SELECT id, url, titulo, score, resumen, fuente, usada_para_generar, texto_comprimido
+    FROM articulos
+    WHERE score >= ? AND usada_para_generar = 0
+    ORDER BY score DESC, fecha_publicacion_fuente DESC
+    LIMIT ?
+'''
+# Con tema: relevancia BM25 en articulos_fts (rank) ponderada por el score del análisis y la antigüedad.
+# orden = relevancia * (1 + FTS_PESO_SCORE * score/10) / (1 + días/FTS_DIAS_RECENCIA)
+FTS_PESO_SCORE = 1.0
+FTS_DIAS_RECENCIA = 30.0
+# Un término presente en más de esta fracción de las fuentes no discrimina (su IDF en BM25 es <= 0)
+# y ordenar todas sus coincidencias es lo más caro de la consulta: se omite si el tema tiene otros.
+# Si todos los términos del tema son así, se ordena solo por score y fecha (sin FTS).
+FTS_MAX_FRACCION_DOCS = 0.5
+# Por debajo de este nº de fuentes no se omite ningún término (las frecuencias aún no son representativas)
+FTS_MIN_FUENTES_FRECUENCIA = 1000
+# Candidatos que se ponderan como mucho: las fuentes elegibles más recientes que coinciden con el tema.
+# FTS5 calcula rank para TODAS las coincidencias antes de ordenar por él (aunque haya LIMIT), así que
+# el recorte se hace por rowid (= articulos.id, orden de guardado), que sí respeta el LIMIT, y rank
+# solo se calcula para esas filas. Las fuentes más antiguas apenas pesan por el factor de antigüedad.
+FTS_MAX_CANDIDATOS = 500
+SQL_FUENTES_PENDIENTES_TEMA = f'''
+    SELECT a.id, a.url, a.titulo, a.score, a.resumen, a.fuente, a.usada_para_generar, a.texto_comprimido,
+           candidatos.relevancia AS relevancia_tema
+    FROM (
+        SELECT articulos_fts.rowid AS id, -articulos_fts.rank AS relevancia
+        FROM articulos_fts JOIN articulos a ON a.id = articulos_fts.rowid
+        WHERE articulos_fts MATCH ? AND a.score >= ? AND a.usada_para_generar = 0
+        ORDER BY articulos_fts.rowid DESC
+        LIMIT {FTS_MAX_CANDIDATOS}
+    ) candidatos JOIN articulos a ON a.id = candidatos.id
+    ORDER BY candidatos.relevancia * (1 + {FTS_PESO_SCORE} * a.score / 10.0)
+             / (1 + MAX(0, julianday('now') - COALESCE(julianday(a.fecha_publicacion_fuente), julianday(a.fecha_scraping), julianday('now'))) / {FTS_DIAS_RECENCIA}) DESC
+    LIMIT ?
+'''
+SQL_IMAGENES_ARTICULO = 'SELECT url, alt_text, caption, licencia, autor FROM imagenes_generadas WHERE articulo_generado_id = ?'
+
+
+def _consulta_fts_tema(cursor, tema):
+    """
+    Expresión MATCH de FTS5 para un tema: las raíces de sus términos (relevance.normalizar, igual que al
+    indexar) unidas con OR ("panot de barcelona" -> "panot" OR "barcelon"), sin los que están en casi
+    todas las fuentes (FTS_MAX_FRACCION_DOCS). None si no queda ningún término útil.
+    """
+    terminos = list(dict.fromkeys(relevance.normalizar(tema or '')))
+    if not terminos:
+        return None
+    # Total de fuentes desde el contador que mantienen los triggers (migración 4): COUNT(*) recorre la tabla
+    total = cursor.execute('SELECT COALESCE(SUM(total), 0) FROM contadores_fuentes').fetchone()[0]
+    if total >= FTS_MIN_FUENTES_FRECUENCIA:
+        maximo = FTS_MAX_FRACCION_DOCS * total
+        utiles = []
+        for termino in terminos:
+            fila = cursor.execute('SELECT doc FROM articulos_fts_vocab WHERE term = ?', (termino,)).fetchone()
+            if not fila or fila[0] <= maximo:
+                utiles.append(termino)
+        if not utiles:
+            print(f"⏩ Los términos de '{tema}' aparecen en más del {FTS_MAX_FRACCION_DOCS:.0%} de las fuentes: se ordena por score y fecha.")
+            return None
+        terminos = utiles
+    return ' OR '.join(f'"{termino}"' for termino in terminos)
 
 
 def get_relevant_articles(topic=None, min_score=7, limit=3):
-    """Obtiene URLs y datos de artículos fuente NO USADOS con score >= min_score."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    """
+    Obtiene URLs y datos de artículos fuente NO USADOS con score >= min_score.
+    Con topic, solo fuentes que tratan el tema, ordenadas por relevancia (índice FTS), score y antigüedad;
+    sin topic, por score y fecha.
+    Cada resultado incluye 'texto' (el texto limpio guardado, descomprimido) o None si la fuente no lo tiene.
+    """
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         fecha_col = 'fecha_publicacion_fuente'
-        cursor.execute(f'''
-            SELECT id, url, titulo, score, resumen, fuente, usada_para_generar
-            FROM articulos
-            WHERE score >= ? AND usada_para_generar = 0
-            ORDER BY score DESC, {fecha_col} DESC
-            LIMIT ?
-        ''', (min_score, limit))
+        consulta_tema = _consulta_fts_tema(cursor, topic) if topic else None
+        if consulta_tema:
+            cursor.execute(SQL_FUENTES_PENDIENTES_TEMA, (consulta_tema, min_score, limit))
+        else:
+            cursor.execute(SQL_FUENTES_PENDIENTES, (min_score, limit))
         rows = cursor.fetchall()
         col_names = [description[0] for description in cursor.description]
         results = []
         for row in rows:
-            results.append(dict(zip(col_names, row)))
-        print(f"📚 Encontrados {len(results)} artículos fuente NO usados (score >= {min_score}).")
+            result = dict(zip(col_names, row))
+            result['texto'] = descomprimir_texto(result.pop('texto_comprimido'))
+            results.append(result)
+        sobre_tema = f" sobre '{topic}'" if consulta_tema else ""
+        print(f"📚 Encontrados {len(results)} artículos fuente NO usados{sobre_tema} (score >= {min_score}).")
         return results
     except sqlite3.OperationalError as e:
         print(f"⚠️ Error SQL en get_relevant_articles: {str(e)}. ¿Existe la tabla 'articulos' y la columna '{fecha_col}' y 'usada_para_generar'?")
@@ -202,11 +807,38 @@ def get_relevant_articles(topic=None, min_score=7, limit=3):
         print(f"Error en get_relevant_articles: {str(e)}")
         return []
     finally:
-        conn.close()
+        _liberar(conn)
+
+@_serializar_escritura
+def guardar_texto_fuente(source_article_id, texto):
+    """Guarda (o reemplaza) el texto limpio comprimido de una fuente ya existente."""
+    texto_comprimido, texto_hash = comprimir_texto(texto)
+    if not texto_comprimido:
+        return False
+    conn = _conectar()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            'UPDATE articulos SET texto_comprimido = ?, texto_hash = ?, simhash = ? WHERE id = ?',
+            (texto_comprimido, texto_hash, dedup.a_entero_sqlite(dedup.simhash(texto)), source_article_id)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Error SQL en guardar_texto_fuente: {str(e)}. ¿Existe la columna 'texto_comprimido'?")
+        conn.rollback()
+        return False
+    except Exception as e:
+        print(f"Error en guardar_texto_fuente ID {source_article_id}: {str(e)}")
+        conn.rollback()
+        return False
+    finally:
+        _liberar(conn)
 
+@_serializar_escritura
 def mark_source_used(source_article_id):
     """Marca un artículo fuente como usado para generar contenido."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         cursor.execute('''
@@ -222,11 +854,12 @@ def mark_source_used(source_article_id):
         print(f"Error en mark_source_used ID {source_article_id}: {str(e)}")
         conn.rollback()
     finally:
-        conn.close()
+        _liberar(conn)
 
+@_serializar_escritura
 def save_generated_article(article_data):
     """Guarda un artículo generado en la tabla articulos_generados."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         tags_list = article_data.get('tags', [])
@@ -270,11 +903,12 @@ def save_generated_article(article_data):
         conn.rollback()
         raise
     finally:
-        conn.close()
+        _liberar(conn)
 
+@_serializar_escritura
 def save_image_metadata(image_data):
     """Guarda la metadata de una imagen asociada a un artículo generado."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         if not isinstance(image_data.get('articulo_generado_id'), int):
@@ -301,7 +935,7 @@ def save_image_metadata(image_data):
         print(f"Error al guardar metadata de imagen para articulo generado ID {image_data.get('articulo_generado_id', 'N/A')}: {str(e)}")
         conn.rollback()
     finally:
-        conn.close()
+        _liberar(conn)
 
 # === Funciones para la tabla configuracion (CORREGIDAS) ===
 
@@ -312,7 +946,7 @@ def get_config(tema):
     Retorna un diccionario con la configuración si existe, o un diccionario vacío {} si no.
     Maneja errores de DB retornando también {}.
     """
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         cursor.execute('SELECT * FROM configuracion WHERE tema = ?', (tema,))
@@ -336,8 +970,9 @@ def get_config(tema):
         print(f"❌ Error en get_config para tema '{tema}': {str(e)}")
         return {}
     finally:
-        conn.close()
+        _liberar(conn)
 
+@_serializar_escritura
 def save_config(config_dict):
     """
     Guarda o actualiza la configuración para un tema.
@@ -347,7 +982,7 @@ def save_config(config_dict):
         print("❌ Error: config_dict debe incluir un 'tema' para guardar la configuración.")
         return False
 
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         # Definir los campos válidos para la tabla configuracion
@@ -395,37 +1030,15 @@ def save_config(config_dict):
         conn.rollback()
         return False
     finally:
-        conn.close()
+        _liberar(conn)
 
 
 # Funciones para obtener datos de artículos generados para la UI/Admin
 # Añadido filtro por tema/seccion
 def get_all_generated_articles(tema=None, estado=None, limit=100):
-    """Obtiene todos los artículos generados, opcionalmente filtrados por tema/seccion o estado."""
-    conn = sqlite3.connect(DB_FILE_PATH)
-    cursor = conn.cursor()
+    """Obtiene los últimos artículos generados, opcionalmente filtrados por tema/seccion o estado (ver pagina_articulos_generados)."""
     try:
-        query = 'SELECT id, tema, titulo, fecha_generacion, estado, score_fuentes_promedio FROM articulos_generados WHERE 1=1'
-        params = []
-
-        if tema: # Filtrar por tema (seccion)
-            query += ' AND tema = ?'
-            params.append(tema)
-        if estado:
-            query += ' AND estado = ?'
-            params.append(estado)
-
-        query += ' ORDER BY fecha_generacion DESC LIMIT ?'
-        params.append(limit)
-
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        col_names = [description[0] for description in cursor.description]
-        results = []
-        for row in rows:
-            results.append(dict(zip(col_names, row)))
-
+        results = _leer_pagina('generados', _filtros_generados(tema, estado), limit)
         print(f"📚 Encontrados {len(results)} artículos generados (Filtros: Tema/Seccion={tema}, Estado={estado}).")
         return results
 
@@ -435,13 +1048,11 @@ def get_all_generated_articles(tema=None, estado=None, limit=100):
     except Exception as e:
         print(f"Error en get_all_generated_articles: {str(e)}")
         return []
-    finally:
-        conn.close()
 
 
 def get_generated_article_by_id(article_id):
     """Obtiene un artículo generado por su ID, incluyendo metadata de imágenes asociadas."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         # Obtener datos del artículo principal
@@ -465,7 +1076,7 @@ def get_generated_article_by_id(article_id):
 
 
         # Obtener metadata de imágenes asociadas
-        cursor.execute('SELECT url, alt_text, caption, licencia, autor FROM imagenes_generadas WHERE articulo_generado_id = ?', (article_id,))
+        cursor.execute(SQL_IMAGENES_ARTICULO, (article_id,))
         image_rows = cursor.fetchall()
         image_col_names = [description[0] for description in cursor.description]
         images_data = []
@@ -484,11 +1095,12 @@ def get_generated_article_by_id(article_id):
         print(f"❌ Error en get_generated_article_by_id para ID {article_id}: {str(e)}")
         return None
     finally:
-        conn.close()
+        _liberar(conn)
 
+@_serializar_escritura
 def update_generated_article(article_id, updated_data):
     """Actualiza campos de un artículo generado por su ID."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         set_clauses = []
@@ -537,24 +1149,13 @@ def update_generated_article(article_id, updated_data):
         conn.rollback()
         return False
     finally:
-        conn.close()
+        _liberar(conn)
 
 # Funciones para obtener fuentes para la UI/Admin
 def get_all_sources(limit=100): # Simplificado, sin filtro por tema/estado por ahora
-    """Obtiene todos los artículos fuente."""
-    conn = sqlite3.connect(DB_FILE_PATH)
-    cursor = conn.cursor()
+    """Obtiene los últimos artículos fuente (ver pagina_fuentes para recorrerlos todos)."""
     try:
-        query = 'SELECT id, titulo, url, score, fuente, fecha_scraping, usada_para_generar FROM articulos ORDER BY fecha_scraping DESC LIMIT ?'
-        params = [limit]
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        col_names = [description[0] for description in cursor.description]
-        results = []
-        for row in rows:
-            results.append(dict(zip(col_names, row)))
-
+        results = _leer_pagina('fuentes', [], limit)
         print(f"📚 Encontrados {len(results)} artículos fuente.")
         return results
 
@@ -564,14 +1165,326 @@ def get_all_sources(limit=100): # Simplificado, sin filtro por tema/estado por a
     except Exception as e:
         print(f"Error en get_all_sources: {str(e)}")
         return []
+
+
+# === Listados paginados para el panel de administración ===
+# Paginación por clave (keyset) sobre (fecha, id), del más reciente al más antiguo: cada página continúa
+# después de la última fila de la anterior usando el índice de la fecha, así que su coste no crece con
+# el número de página (a diferencia de OFFSET). El cursor es opaco para el cliente.
+# Se ordena por COALESCE(fecha, ''): con una fecha NULL la comparación (fecha, id) < (?, ?) da NULL y esas
+# filas desaparecían a partir de la segunda página. Los índices son sobre esa misma expresión (migración 6).
+# Los totales salen de las tablas contadores_* que mantienen los triggers (migración 4), no de COUNT(*).
+MAX_TAMANO_PAGINA = 1000
+
+LISTADOS = {
+    'fuentes': {
+        'tabla': 'articulos',
+        'columnas': 'id, titulo, url, score, fuente, fecha_scraping, usada_para_generar',
+        'fecha': 'fecha_scraping',
+        'orden': "COALESCE(fecha_scraping, '')",
+    },
+    'generados': {
+        'tabla': 'articulos_generados',
+        'columnas': 'id, tema, titulo, fecha_generacion, estado, score_fuentes_promedio',
+        'fecha': 'fecha_generacion',
+        'orden': "COALESCE(fecha_generacion, '')",
+    },
+}
+
+
+def _fila_dict(cursor, row):
+    """row_factory: cada fila como dict columna -> valor."""
+    return {columna[0]: valor for columna, valor in zip(cursor.description, row)}
+
+
+def _filtros_fuentes(usada=None, min_score=None):
+    filtros = []
+    if usada is not None:
+        filtros.append(('usada_para_generar = ?', int(bool(usada))))
+    if min_score is not None:
+        filtros.append(('score >= ?', min_score))
+    return filtros
+
+
+def _filtros_generados(tema=None, estado=None):
+    filtros = []
+    if tema: # Filtrar por tema (seccion)
+        filtros.append(('tema = ?', tema))
+    if estado:
+        filtros.append(('estado = ?', estado))
+    return filtros
+
+
+def _consulta_pagina(listado, filtros, despues_de, limit):
+    """Retorna (query, params) de una página de 'listado': filtros [(condición, valor)], despues_de (fecha, id) o None."""
+    tabla, columnas, orden = (LISTADOS[listado][k] for k in ('tabla', 'columnas', 'orden'))
+    condiciones = [condicion for condicion, _ in filtros]
+    params = [valor for _, valor in filtros]
+    if despues_de:
+        # La primera condición es redundante, pero sin ella SQLite no busca en el índice de la expresión:
+        # recorrería desde el principio hasta el cursor
+        condiciones.append(f'{orden} <= ? AND ({orden}, id) < (?, ?)')
+        params.extend([despues_de[0], *despues_de])
+    where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return f'SELECT {columnas} FROM {tabla}{where} ORDER BY {orden} DESC, id DESC LIMIT ?', params + [limit]
+
+
+def _leer_pagina(listado, filtros, limit, despues_de=None):
+    """Filas (dicts) de una página de 'listado'. Las excepciones de SQLite se propagan."""
+    conn = _conectar()
+    cursor = conn.cursor()
+    cursor.row_factory = _fila_dict
+    try:
+        cursor.execute(*_consulta_pagina(listado, filtros, despues_de, limit))
+        return cursor.fetchall()
     finally:
-        conn.close()
+        cursor.close()
+        _liberar(conn)
+
+
+def _codificar_cursor(fecha, id_fila):
+    # Mismo valor que COALESCE(fecha, '') en la consulta
+    fecha = fecha or ''
+    return base64.urlsafe_b64encode(json.dumps([fecha, id_fila]).encode('utf-8')).decode('ascii')
+
+
+def _decodificar_cursor(cursor):
+    """Inverso de _codificar_cursor. Lanza ValueError si el cursor no es válido."""
+    try:
+        fecha, id_fila = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor de paginación inválido: {cursor!r}") from e
+    if not isinstance(id_fila, int) or not isinstance(fecha, (str, type(None))):
+        raise ValueError(f"Cursor de paginación inválido: {cursor!r}")
+    return fecha or '', id_fila
+
+
+def _pagina(listado, filtros, limit, cursor):
+    """
+    Página de 'listado' a partir del cursor (None = primera página).
+    Retorna {'items': [dicts], 'siguiente': cursor de la página siguiente o None si es la última}.
+    """
+    limit = max(1, min(int(limit), MAX_TAMANO_PAGINA))
+    try:
+        despues_de = _decodificar_cursor(cursor) if cursor else None
+        # Una fila de más indica si hay página siguiente sin contar nada
+        filas = _leer_pagina(listado, filtros, limit + 1, despues_de)
+    except ValueError as e:
+        print(f"⚠️ {e}")
+        return {'items': [], 'siguiente': None}
+    except sqlite3.Error as e:
+        print(f"⚠️ Error SQL al paginar '{LISTADOS[listado]['tabla']}': {str(e)}")
+        return {'items': [], 'siguiente': None}
+    siguiente = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        siguiente = _codificar_cursor(filas[-1][LISTADOS[listado]['fecha']], filas[-1]['id'])
+    return {'items': filas, 'siguiente': siguiente}
+
+
+def pagina_fuentes(limit=100, cursor=None, usada=None, min_score=None):
+    """Página de artículos fuente (más recientes primero). usada: True/False para filtrar por usada_para_generar."""
+    return _pagina('fuentes', _filtros_fuentes(usada, min_score), limit, cursor)
+
+
+def pagina_articulos_generados(limit=100, cursor=None, tema=None, estado=None):
+    """Página de artículos generados (más recientes primero), opcionalmente filtrados por tema/seccion o estado."""
+    return _pagina('generados', _filtros_generados(tema, estado), limit, cursor)
+
+
+def _iterar(funcion_pagina, tamano_pagina, filtros):
+    cursor = None
+    while True:
+        pagina = funcion_pagina(limit=tamano_pagina, cursor=cursor, **filtros)
+        yield from pagina['items']
+        cursor = pagina['siguiente']
+        if not cursor:
+            return
+
+
+def iterar_fuentes(tamano_pagina=500, usada=None, min_score=None):
+    """
+    Generador de todos los artículos fuente (dicts), página a página: no carga la tabla en memoria ni
+    mantiene una consulta abierta entre páginas.
+    """
+    return _iterar(pagina_fuentes, tamano_pagina, {'usada': usada, 'min_score': min_score})
+
+
+def iterar_articulos_generados(tamano_pagina=500, tema=None, estado=None):
+    """Generador de todos los artículos generados (dicts), página a página, con los filtros de pagina_articulos_generados."""
+    return _iterar(pagina_articulos_generados, tamano_pagina, {'tema': tema, 'estado': estado})
+
+
+def _contar(tabla, filtros):
+    conn = _conectar()
+    try:
+        condiciones = [condicion for condicion, _ in filtros]
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        return conn.execute(f'SELECT COALESCE(SUM(total), 0) FROM {tabla}{where}', [valor for _, valor in filtros]).fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"⚠️ Error SQL al contar en '{tabla}': {str(e)}. ¿Se aplicó la migración 4?")
+        return 0
+    finally:
+        _liberar(conn)
+
+
+def contar_fuentes(usada=None, min_score=None):
+    """Nº de artículos fuente con los filtros de pagina_fuentes, leído de contadores_fuentes."""
+    return _contar('contadores_fuentes', _filtros_fuentes(usada, min_score))
+
+
+def contar_articulos_generados(tema=None, estado=None):
+    """Nº de artículos generados con los filtros de pagina_articulos_generados, leído de contadores_generados."""
+    return _contar('contadores_generados', _filtros_generados(tema, estado))
+
+
+# === Telemetría de llamadas a Gemini ===
+# Agrupaciones permitidas en informe_llamadas_llm -> expresión SQL
+AGRUPACIONES_LLAMADAS = {
+    'tema': 'tema',
+    'etapa': 'etapa',
+    'dia': 'date(fecha)',
+    'llamador': 'llamador',
+    'modelo': 'modelo',
+}
+
+@_serializar_escritura
+def guardar_llamadas_llm(registros):
+    """Inserta en bloque registros de telemetría (dicts con las columnas de llm_llamadas)."""
+    if not registros:
+        return 0
+    conn = _conectar()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany('''
+            INSERT INTO llm_llamadas
+            (fecha, tema, etapa, llamador, modelo, tokens_prompt, tokens_respuesta, latencia, reintentos, cache_hit, coste, error)
+            VALUES (:fecha, :tema, :etapa, :llamador, :modelo, :tokens_prompt, :tokens_respuesta, :latencia, :reintentos, :cache_hit, :coste, :error)
+        ''', registros)
+        conn.commit()
+        return len(registros)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Error SQL en guardar_llamadas_llm: {str(e)}. ¿Existe la tabla 'llm_llamadas'?")
+        conn.rollback()
+        return 0
+    except Exception as e:
+        print(f"Error en guardar_llamadas_llm: {str(e)}")
+        conn.rollback()
+        return 0
+    finally:
+        _liberar(conn)
+
+def informe_llamadas_llm(agrupar_por=('tema', 'etapa', 'dia'), desde=None, limit=50):
+    """
+    Agrega la telemetría de llm_llamadas por las columnas indicadas (ver AGRUPACIONES_LLAMADAS),
+    opcionalmente desde una fecha ('YYYY-MM-DD[ HH:MM:SS]', UTC). Ordenado por coste descendente.
+    Retorna una lista de dicts con llamadas, aciertos de caché, tokens, latencias, reintentos, errores y coste.
+    """
+    columnas = [c for c in agrupar_por if c in AGRUPACIONES_LLAMADAS]
+    if len(columnas) != len(agrupar_por):
+        print(f"⚠️ Agrupaciones no válidas en informe_llamadas_llm: {set(agrupar_por) - set(columnas)}")
+        return []
+    select_grupo = "".join(f"{AGRUPACIONES_LLAMADAS[c]} AS {c}, " for c in columnas)
+    group_by = f"GROUP BY {', '.join(AGRUPACIONES_LLAMADAS[c] for c in columnas)}" if columnas else ""
+    where = "WHERE fecha >= ?" if desde else ""
+    params = ([desde] if desde else []) + [limit]
+
+    conn = _conectar()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            SELECT {select_grupo}
+                   COUNT(*) AS llamadas,
+                   SUM(cache_hit) AS cache_hits,
+                   SUM(COALESCE(tokens_prompt, 0)) AS tokens_prompt,
+                   SUM(COALESCE(tokens_respuesta, 0)) AS tokens_respuesta,
+                   AVG(CASE WHEN cache_hit = 0 THEN latencia END) AS latencia_media,
+                   SUM(latencia) AS latencia_total,
+                   SUM(reintentos) AS reintentos,
+                   SUM(error IS NOT NULL) AS errores,
+                   SUM(coste) AS coste
+            FROM llm_llamadas
+            {where}
+            {group_by}
+            ORDER BY coste DESC
+            LIMIT ?
+        ''', params)
+        col_names = [description[0] for description in cursor.description]
+        return [dict(zip(col_names, row)) for row in cursor.fetchall()]
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Error SQL en informe_llamadas_llm: {str(e)}. ¿Existe la tabla 'llm_llamadas'?")
+        return []
+    except Exception as e:
+        print(f"Error en informe_llamadas_llm: {str(e)}")
+        return []
+    finally:
+        _liberar(conn)
+
+
+@_serializar_escritura
+def reconstruir_indice_fts():
+    """Vacía articulos_fts y vuelve a indexar todas las fuentes (p. ej. tras modificar la DB sin los triggers). Retorna el nº de fuentes."""
+    conn = _conectar()
+    try:
+        for paso in PASOS_REINDEXAR_FTS:
+            conn.execute(paso)
+        conn.commit()
+        total = conn.execute('SELECT COUNT(*) FROM articulos').fetchone()[0]
+        print(f"✅ Índice de texto completo reconstruido: {total} fuentes.")
+        return total
+    except sqlite3.Error as e:
+        print(f"⚠️ Error SQL en reconstruir_indice_fts: {str(e)}. ¿Existe la tabla 'articulos_fts'?")
+        conn.rollback()
+        return 0
+    finally:
+        _liberar(conn)
+
+
+def verificar_planes_consulta():
+    """
+    Comprueba con EXPLAIN QUERY PLAN que las consultas frecuentes usan índices: ni recorren una tabla
+    entera ni ordenan en un B-tree temporal. Retorna {consulta: [pasos del plan que no usan índice]};
+    todas las listas vacías = todo correcto.
+    """
+    consultas = {
+        'get_relevant_articles': (SQL_FUENTES_PENDIENTES, (7, 3)),
+        'pagina_fuentes': _consulta_pagina('fuentes', [], None, 100),
+        'pagina_fuentes(cursor)': _consulta_pagina('fuentes', [], ('2025-01-01', 1), 100),
+        'pagina_articulos_generados': _consulta_pagina('generados', [], None, 100),
+        'pagina_articulos_generados(cursor)': _consulta_pagina('generados', [], ('2025-01-01', 1), 100),
+        'pagina_articulos_generados(tema, cursor)': _consulta_pagina('generados', _filtros_generados(tema='x'), ('2025-01-01', 1), 100),
+        'pagina_articulos_generados(estado, cursor)': _consulta_pagina('generados', _filtros_generados(estado='x'), ('2025-01-01', 1), 100),
+        'pagina_articulos_generados(tema, estado)': _consulta_pagina('generados', _filtros_generados('x', 'x'), None, 100),
+        'get_generated_article_by_id (imágenes)': (SQL_IMAGENES_ARTICULO, (1,)),
+        'cargar_indice_urls': (SQL_URLS_CANONICAS, ()),
+        'get_relevant_articles(tema)': (SQL_FUENTES_PENDIENTES_TEMA, ('"x"', 7, 3)),
+    }
+    # Pasos esperados que no son un problema: la consulta con tema recorre las coincidencias de FTS por
+    # rowid y reordena en memoria los FTS_MAX_CANDIDATOS candidatos como mucho
+    pasos_acotados = {
+        'get_relevant_articles(tema)': ('SCAN articulos_fts VIRTUAL TABLE', 'SCAN candidatos', 'USE TEMP B-TREE FOR ORDER BY'),
+    }
+    conn = _conectar()
+    try:
+        problemas = {}
+        for nombre, (query, params) in consultas.items():
+            plan = [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+            problemas[nombre] = [
+                paso for paso in plan
+                if ((paso.startswith('SCAN') and 'USING' not in paso) or 'TEMP B-TREE' in paso)
+                and not paso.startswith(pasos_acotados.get(nombre, ()))
+            ]
+            if problemas[nombre]:
+                print(f"❌ {nombre} no usa índices: {'; '.join(problemas[nombre])}")
+        return problemas
+    finally:
+        _liberar(conn)
 
 
 # Funciones para obtener lista de TEMAS/SECCIONES disponibles
 def get_available_temas_secciones():
     """Obtiene una lista de todos los temas/secciones con configuración guardada."""
-    conn = sqlite3.connect(DB_FILE_PATH)
+    conn = _conectar()
     cursor = conn.cursor()
     try:
         cursor.execute('SELECT DISTINCT tema FROM configuracion ORDER BY tema')
@@ -585,7 +1498,7 @@ def get_available_temas_secciones():
         print(f"❌ Error en get_available_temas_secciones: {str(e)}")
         return []
     finally:
-        conn.close()
+        _liberar(conn)
 
 
 # Bloque __main__ para probar solo database.py
@@ -595,6 +1508,7 @@ if __name__ == "__main__":
         # Limpieza para empezar fresco en la prueba
         if os.path.exists(DB_FILE_PATH):
             print(f"Borrando '{DB_FILE_PATH}' para prueba...")
+            cerrar_conexiones()
             os.remove(DB_FILE_PATH)
             print("Borrado.")
 
@@ -602,6 +1516,10 @@ if __name__ == "__main__":
         inicializar_db()
         print("--- Prueba de inicialización completada ---")
 
+        print("\n--- Verificando que las consultas frecuentes usan índices ---")
+        if not any(verificar_planes_consulta().values()):
+            print("✅ Todas las consultas frecuentes usan índices.")
+
         # --- Prueba de get_config y save_config ---
         print("\n--- Probando get_config para tema 'DemoTestConfig' (debería retornar defaults) ---")
         config_test_default = get_config("DemoTestConfig")
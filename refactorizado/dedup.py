@@ -0,0 +1,118 @@
+# dedup.py
+# Detección de contenido casi duplicado (la misma noticia sindicada en varios medios o URLs)
+# mediante huellas SimHash de 64 bits del texto extraído.
+# Módulo puro (sin DB ni red): database mantiene el índice global de las fuentes guardadas.
+
+import hashlib
+import re
+import threading
+import unicodedata
+
+# Distancia de Hamming máxima (en bits) para considerar dos textos casi duplicados
+MAX_DISTANCIA = 3
+# Palabras por shingle: con 3 el orden local de las palabras cuenta, pero tolera ediciones menores
+TAMANO_SHINGLE = 3
+
+_BITS = 64
+_MASCARA = (1 << _BITS) - 1
+# Con 4 bandas de 16 bits, dos huellas a distancia <= 3 coinciden en al menos una banda (palomar)
+_BANDAS = 4
+_BITS_BANDA = _BITS // _BANDAS
+_RE_PALABRA = re.compile(r'\w+', re.UNICODE)
+
+
+def _normalizar(texto):
+    """Minúsculas y sin acentos, para que 'Panot' y 'panót' cuenten igual."""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def _hash64(token):
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(texto):
+    """Retorna la huella SimHash de 64 bits (entero sin signo) del texto, o None si no hay texto."""
+    if not texto:
+        return None
+    palabras = _RE_PALABRA.findall(_normalizar(texto))
+    if not palabras:
+        return None
+    if len(palabras) < TAMANO_SHINGLE:
+        shingles = [' '.join(palabras)]
+    else:
+        shingles = [' '.join(palabras[i:i + TAMANO_SHINGLE]) for i in range(len(palabras) - TAMANO_SHINGLE + 1)]
+
+    pesos = [0] * _BITS
+    for shingle in shingles:
+        h = _hash64(shingle)
+        for bit in range(_BITS):
+            pesos[bit] += 1 if (h >> bit) & 1 else -1
+
+    huella = 0
+    for bit in range(_BITS):
+        if pesos[bit] > 0:
+            huella |= 1 << bit
+    return huella
+
+
+def distancia_hamming(a, b):
+    return bin((a ^ b) & _MASCARA).count('1')
+
+
+def a_entero_sqlite(huella):
+    """SQLite guarda enteros con signo de 64 bits: convierte la huella sin signo a ese rango."""
+    if huella is None:
+        return None
+    return huella - (1 << _BITS) if huella >= (1 << (_BITS - 1)) else huella
+
+
+def desde_entero_sqlite(valor):
+    """Inverso de a_entero_sqlite."""
+    if valor is None:
+        return None
+    return valor & _MASCARA
+
+
+class IndiceSimHash:
+    """
+    Índice en memoria de huellas para buscar casi duplicados sin recorrer todo el corpus:
+    cada huella se indexa por sus 4 bandas de 16 bits y solo se comparan las que comparten banda.
+    Seguro para usar desde varios hilos.
+    """
+
+    def __init__(self, max_distancia=MAX_DISTANCIA):
+        self.max_distancia = max_distancia
+        self._bandas = [dict() for _ in range(_BANDAS)]
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._total
+
+    @staticmethod
+    def _claves(huella):
+        mascara_banda = (1 << _BITS_BANDA) - 1
+        return [(huella >> (i * _BITS_BANDA)) & mascara_banda for i in range(_BANDAS)]
+
+    def agregar(self, huella, referencia=None):
+        """Indexa una huella. 'referencia' (ej: id o URL de la fuente) es lo que retornará buscar()."""
+        if huella is None:
+            return
+        with self._lock:
+            for banda, clave in zip(self._bandas, self._claves(huella)):
+                banda.setdefault(clave, []).append((huella, referencia))
+            self._total += 1
+
+    def buscar(self, huella):
+        """Retorna (referencia, distancia) del casi duplicado más cercano o None si no hay ninguno."""
+        if huella is None:
+            return None
+        mejor = None
+        with self._lock:
+            for banda, clave in zip(self._bandas, self._claves(huella)):
+                for otra, referencia in banda.get(clave, ()):
+                    distancia = distancia_hamming(huella, otra)
+                    if distancia <= self.max_distancia and (mejor is None or distancia < mejor[1]):
+                        mejor = (referencia, distancia)
+        return mejor
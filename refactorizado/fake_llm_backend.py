@@ -0,0 +1,223 @@
+# fake_llm_backend.py
+# Backend local de llm_client que sustituye a Gemini en pruebas y benchmarks (sin red ni API key).
+# Devuelve JSON válido y determinista (misma entrada -> misma respuesta) para los prompts del analizador
+# (individual y en lote) y del generador, o conforme al response_schema si la llamada lo indica.
+# Simula la latencia con una distribución configurable e inyecta errores transitorios y 429.
+#
+# Uso: LLM_BACKEND=fake python main.py
+#  o:  llm_client.set_backend(fake_llm_backend.FakeBackend(latencia_media=0.5, tasa_429=0.1))
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import types
+
+from google.api_core import exceptions as google_exceptions
+
+CARACTERES_POR_TOKEN = 4
+# Trozos en los que se divide una respuesta en streaming
+TROZOS_STREAM = 8
+
+_RE_ID_LOTE = re.compile(r'### ARTÍCULO id=(\S+)')
+_RE_TEMA = re.compile(r"sobre(?: el tema:)? \**['\"]([^'\"]+)['\"]")
+
+
+class FakeBackend:
+    """
+    latencia_media / latencia_desviacion: segundos por llamada; distribucion 'lognormal' (cola larga,
+    como una API real), 'normal' o 'fija'. tasa_errores / tasa_429: probabilidad de que una llamada
+    falle con ServiceUnavailable / ResourceExhausted (este último con retry_delay de segundos_429).
+    """
+    nombre = "fake"
+
+    def __init__(self, latencia_media=0.8, latencia_desviacion=0.3, distribucion="lognormal",
+                 tasa_errores=0.0, tasa_429=0.0, segundos_429=1, semilla=None):
+        self.latencia_media = latencia_media
+        self.latencia_desviacion = latencia_desviacion
+        self.distribucion = distribucion
+        self.tasa_errores = tasa_errores
+        self.tasa_429 = tasa_429
+        self.segundos_429 = segundos_429
+        # El azar solo decide latencias y errores; el contenido depende únicamente del prompt
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.stats = {'llamadas': 0, 'errores': 0, 'errores_429': 0}
+
+    @classmethod
+    def desde_entorno(cls):
+        semilla = os.getenv("LLM_FAKE_SEMILLA")
+        return cls(
+            latencia_media=float(os.getenv("LLM_FAKE_LATENCIA", "0.8")),
+            latencia_desviacion=float(os.getenv("LLM_FAKE_DESVIACION", "0.3")),
+            distribucion=os.getenv("LLM_FAKE_DISTRIBUCION", "lognormal"),
+            tasa_errores=float(os.getenv("LLM_FAKE_ERRORES", "0")),
+            tasa_429=float(os.getenv("LLM_FAKE_429", "0")),
+            semilla=int(semilla) if semilla else None,
+        )
+
+    def crear_modelo(self, model_name):
+        return FakeModel(self, model_name)
+
+    def _sortear(self):
+        """Retorna (latencia, excepción a lanzar o None) para una llamada."""
+        with self._lock:
+            self.stats['llamadas'] += 1
+            if self.distribucion == "fija" or self.latencia_desviacion <= 0:
+                latencia = self.latencia_media
+            elif self.distribucion == "normal":
+                latencia = self._rng.gauss(self.latencia_media, self.latencia_desviacion)
+            else:
+                # Lognormal con la media y desviación pedidas
+                varianza = (self.latencia_desviacion / self.latencia_media) ** 2
+                sigma2 = math.log1p(varianza)
+                mu = math.log(self.latencia_media) - sigma2 / 2
+                latencia = self._rng.lognormvariate(mu, sigma2 ** 0.5)
+            azar = self._rng.random()
+            error = None
+            if azar < self.tasa_429:
+                self.stats['errores_429'] += 1
+                error = google_exceptions.ResourceExhausted(
+                    f"Resource has been exhausted (fake). retry_delay {{\n  seconds: {self.segundos_429}\n}}"
+                )
+            elif azar < self.tasa_429 + self.tasa_errores:
+                self.stats['errores'] += 1
+                error = google_exceptions.ServiceUnavailable("The service is currently unavailable (fake).")
+        return max(0.0, latencia), error
+
+
+class FakeModel:
+    """Imita la interfaz de GenerativeModel que usa llm_client."""
+
+    def __init__(self, backend, model_name):
+        self.backend = backend
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        latencia, error = self.backend._sortear()
+        if error:
+            # Los errores llegan antes (como un 429 real, que no consume el tiempo de generación)
+            time.sleep(latencia / 10)
+            raise error
+        texto = responder(prompt, generation_config)
+        if stream:
+            return _RespuestaStream(prompt, texto, latencia)
+        time.sleep(latencia)
+        return _respuesta(prompt, texto)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        latencia, error = self.backend._sortear()
+        if error:
+            await asyncio.sleep(latencia / 10)
+            raise error
+        await asyncio.sleep(latencia)
+        return _respuesta(prompt, responder(prompt, generation_config))
+
+
+def _uso(prompt, texto):
+    return types.SimpleNamespace(
+        prompt_token_count=len(prompt) // CARACTERES_POR_TOKEN + 1,
+        candidates_token_count=len(texto) // CARACTERES_POR_TOKEN + 1,
+    )
+
+
+def _respuesta(prompt, texto):
+    return types.SimpleNamespace(text=texto, usage_metadata=_uso(prompt, texto))
+
+
+class _RespuestaStream:
+    """Iterable de trozos, repartiendo la latencia entre ellos; usage_metadata disponible al final."""
+
+    def __init__(self, prompt, texto, latencia):
+        self._prompt = prompt
+        self._texto = texto
+        self._latencia = latencia
+        self.usage_metadata = None
+
+    def __iter__(self):
+        tamano = max(1, len(self._texto) // TROZOS_STREAM + 1)
+        trozos = [self._texto[i:i + tamano] for i in range(0, len(self._texto), tamano)]
+        for trozo in trozos:
+            time.sleep(self._latencia / len(trozos))
+            yield types.SimpleNamespace(text=trozo)
+        self.usage_metadata = _uso(self._prompt, self._texto)
+
+
+# === Contenido determinista ===
+
+def _rng_para(prompt):
+    return random.Random(hashlib.sha256(prompt.encode('utf-8')).digest())
+
+
+def _tema(prompt):
+    coincidencia = _RE_TEMA.search(prompt)
+    return coincidencia.group(1) if coincidencia else "tema"
+
+
+def _analisis(rng, tema):
+    score = rng.randint(1, 10)
+    return {
+        "score": score,
+        "reason": f"Evaluación simulada: relevancia {score}/10 para '{tema}'.",
+        "resumen": f"Resumen simulado sobre {tema}"[:100],
+        "tags": [f"{tema.split()[0] if tema.split() else 'tag'}", "simulado", f"tag{rng.randint(1, 50)}"],
+    }
+
+
+def _articulo(rng, tema):
+    parrafos = "\n\n".join(
+        f"## Sección {i + 1}\n\nTexto simulado número {rng.randint(1000, 9999)} sobre {tema}. " * 3
+        for i in range(rng.randint(3, 6))
+    )
+    return {
+        "title": f"{tema.capitalize()}: guía simulada",
+        "meta_description": f"Artículo simulado sobre {tema} para pruebas de rendimiento."[:160],
+        "tags": [tema, "simulado", "benchmark"],
+        "body": f"Introducción simulada sobre {tema}.\n\n{parrafos}\n\n## Conclusión\n\nFin del artículo simulado.",
+    }
+
+
+def _valor_para_esquema(esquema, rng, nombre=None, tema="tema"):
+    """Valor aleatorio (pero determinista para el mismo rng) conforme a un esquema de la API."""
+    tipo = esquema.get('type', 'string').lower()
+    if 'enum' in esquema:
+        return rng.choice(esquema['enum'])
+    if tipo == 'object':
+        return {clave: _valor_para_esquema(sub, rng, clave, tema) for clave, sub in esquema.get('properties', {}).items()}
+    if tipo == 'array':
+        return [_valor_para_esquema(esquema.get('items', {}), rng, nombre, tema) for _ in range(rng.randint(1, 4))]
+    if tipo == 'integer':
+        return rng.randint(1, 10)
+    if tipo == 'number':
+        return round(rng.uniform(0, 10), 2)
+    if tipo == 'boolean':
+        return rng.random() < 0.5
+    return f"{nombre or 'valor'} simulado sobre {tema}"
+
+
+def responder(prompt, generation_config=None):
+    """Texto de respuesta determinista para un prompt (JSON de análisis, de lote, de artículo o según el esquema)."""
+    rng = _rng_para(prompt)
+    tema = _tema(prompt)
+    ids_lote = _RE_ID_LOTE.findall(prompt)
+    if ids_lote:
+        datos = []
+        for id_articulo in ids_lote:
+            analisis = _analisis(_rng_para(f"{prompt}\0{id_articulo}"), tema)
+            datos.append({"id": id_articulo, **analisis})
+    elif '"score"' in prompt:
+        datos = _analisis(rng, tema)
+    elif '"meta_description"' in prompt or '`meta_description`' in prompt:
+        datos = _articulo(rng, tema)
+    else:
+        esquema = (generation_config or {}).get('response_schema')
+        if isinstance(esquema, dict):
+            datos = _valor_para_esquema(esquema, rng, tema=tema)
+        else:
+            return f"Respuesta simulada sobre {tema}."
+    return json.dumps(datos, ensure_ascii=False)
@@ -0,0 +1,297 @@
+# html_parsing.py
+# Extracción del texto principal de un artículo a partir de su HTML, con backends de parseo intercambiables.
+# - 'selectolax': parser en C (lexbor). El más rápido; opcional (pip install selectolax).
+# - 'lxml': BeautifulSoup sobre lxml. Opcional (pip install lxml).
+# - 'html.parser': BeautifulSoup con el parser puro de Python. Siempre disponible (referencia).
+# Con HTML bien formado todos producen la misma salida que extract_article_content; benchmark_parsers.py
+# lo comprueba. Con HTML mal formado (<p> o <li> sin cerrar, cierres sueltos) no: selectolax y lxml lo
+# reparan como un navegador (un <p> cierra el anterior) y coinciden entre sí, mientras que html.parser
+# anida los elementos sin cerrar y repite su texto. Por eso el backend por defecto sigue siendo
+# 'html.parser' (la extracción de siempre) y los rápidos hay que pedirlos.
+
+import os
+import re
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from bs4.dammit import UnicodeDammit
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # Dependencia opcional
+    LexborHTMLParser = None
+
+try:
+    import lxml  # noqa: F401  (solo comprobamos que BeautifulSoup podrá usarlo)
+    _LXML_DISPONIBLE = True
+except ImportError:  # Dependencia opcional
+    _LXML_DISPONIBLE = False
+
+# 'html.parser' (por defecto), 'selectolax' o 'lxml'; 'auto' elige el más rápido instalado, así que la
+# extracción de páginas mal formadas puede cambiar según lo que haya instalado en cada máquina
+HTML_PARSER = os.getenv("HTML_PARSER", "html.parser")
+
+# Elementos que generalmente no son parte del cuerpo del artículo
+TAGS_A_ELIMINAR = ['script', 'style', 'nav', 'footer', 'iframe', 'aside', 'header', 'form', '.sidebar']
+
+# Selectores comunes para identificar el cuerpo del artículo, por orden de preferencia
+SELECTORES_CONTENIDO = [
+    'article', # La etiqueta semántica article
+    '.article-content', '.entry-content', '.post-content', # Clases comunes
+    '#main-content', '#content', # IDs comunes para el área principal
+    'div[itemprop="articleBody"]', # Microdatos
+    'div.body', 'div.story', 'div.text', 'div.content' # Otros selectores genéricos
+]
+
+# Elementos de bloque alternativos cuando el contenedor no tiene <p>
+TAGS_BLOQUE = ['h1', 'h2', 'h3', 'h4', 'h5', 'li', 'blockquote', 'pre', 'div']
+
+# Límite de párrafos/bloques a procesar (evita procesar contenido masivo accidentalmente)
+MAX_BLOQUES = 20
+# Mínimo de caracteres para considerar que hay contenido
+MIN_CARACTERES = 100
+
+_RE_BODY = re.compile(r'<body[\s>/]', re.IGNORECASE)
+
+
+class DetectorFinArticulo(HTMLParser):
+    """
+    Parser incremental (se alimenta con trozos del HTML según llegan) que detecta cuándo
+    ya se ha descargado todo lo que extract_article_content va a usar, para cortar la descarga.
+    Se considera suficiente cuando:
+      - se ha cerrado el primer <article> (el selector preferente; select_one toma el primero), o
+      - dentro de ese <article> ya se han completado MAX_BLOQUES párrafos útiles, o
+      - el texto en <p> de todo el documento supera max_caracteres (páginas sin <article>).
+    Los <p> y <article> dentro de elementos que extract_article_content elimina (nav, aside...) no cuentan.
+    """
+
+    _TAGS_ELIMINADOS = {tag for tag in TAGS_A_ELIMINAR if not tag.startswith('.')}
+
+    def __init__(self, max_caracteres=100000):
+        super().__init__(convert_charrefs=True)
+        self.max_caracteres = max_caracteres
+        self.suficiente = False
+        self._profundidad_article = 0
+        self._article_visto = False
+        self._profundidad_eliminados = 0
+        self._en_p = False
+        self._parrafos_article = 0
+        self._caracteres_p = 0
+
+    def alimentar(self, texto):
+        """Procesa un trozo más del documento. Retorna True si ya no hace falta seguir descargando."""
+        if not self.suficiente:
+            self.feed(texto)
+        return self.suficiente
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._TAGS_ELIMINADOS:
+            self._profundidad_eliminados += 1
+        elif tag == 'article' and self._profundidad_eliminados == 0:
+            if self._profundidad_article or not self._article_visto:
+                self._profundidad_article += 1
+                self._article_visto = True
+        elif tag == 'p':
+            self._cerrar_p()
+            self._en_p = self._profundidad_eliminados == 0
+
+    def handle_endtag(self, tag):
+        if tag in self._TAGS_ELIMINADOS:
+            self._profundidad_eliminados = max(0, self._profundidad_eliminados - 1)
+        elif tag == 'p':
+            self._cerrar_p()
+        elif tag == 'article' and self._profundidad_article and self._profundidad_eliminados == 0:
+            self._cerrar_p()
+            self._profundidad_article -= 1
+            if self._profundidad_article == 0:
+                self.suficiente = True
+
+    def handle_data(self, data):
+        if self._en_p:
+            self._caracteres_p += len(data.strip())
+            if self._caracteres_p >= self.max_caracteres:
+                self.suficiente = True
+
+    def _cerrar_p(self):
+        if self._en_p and self._profundidad_article:
+            self._parrafos_article += 1
+            if self._parrafos_article >= MAX_BLOQUES:
+                self.suficiente = True
+        self._en_p = False
+
+
+def backends_disponibles():
+    """Retorna los backends instalados, del más rápido al más lento."""
+    backends = []
+    if LexborHTMLParser is not None:
+        backends.append('selectolax')
+    if _LXML_DISPONIBLE:
+        backends.append('lxml')
+    backends.append('html.parser')
+    return backends
+
+
+def _resolver_backend(backend):
+    backend = backend or HTML_PARSER
+    disponibles = backends_disponibles()
+    if backend == 'auto':
+        return disponibles[0]
+    if backend not in disponibles:
+        print(f"⚠️ Backend de parseo '{backend}' no disponible. Usando '{disponibles[0]}'.")
+        return disponibles[0]
+    return backend
+
+
+def _decodificar(html):
+    """Convierte bytes a str detectando el encoding igual que BeautifulSoup, para que todos los backends vean el mismo texto."""
+    if isinstance(html, str):
+        return html
+    return UnicodeDammit(html, is_html=True).unicode_markup or ''
+
+
+def extraer_contenido(html, backend=None):
+    """
+    Extrae el texto principal del artículo de un documento HTML (str o bytes).
+    backend: 'auto', 'selectolax', 'lxml' o 'html.parser' (por defecto HTML_PARSER). Ver la cabecera del
+    módulo: con HTML mal formado el resultado depende del backend.
+    Retorna el texto extraído o None si no se encuentra contenido significativo.
+    """
+    backend = _resolver_backend(backend)
+    markup = _decodificar(html)
+    if backend == 'selectolax':
+        return _extraer_con_selectolax(markup)
+    return extract_article_content(BeautifulSoup(markup, backend))
+
+
+def _descendientes(node, selector):
+    """Como find_all(limit=MAX_BLOQUES) de BeautifulSoup: css() de selectolax también incluye al propio nodo."""
+    return [n for n in node.css(selector) if n.mem_id != node.mem_id][:MAX_BLOQUES]
+
+
+def _extraer_con_selectolax(markup):
+    """Misma lógica que extract_article_content, sobre el árbol de selectolax."""
+    tree = LexborHTMLParser(markup)
+
+    # '.sidebar' en la lista original es un nombre de tag (no un selector) y nunca coincide; lo imitamos
+    for node in tree.css(', '.join(tag for tag in TAGS_A_ELIMINAR if not tag.startswith('.'))):
+        node.decompose()
+
+    content_element = None
+    for selector in SELECTORES_CONTENIDO:
+        content_element = tree.css_first(selector)
+        if content_element:
+            break
+
+    if not content_element:
+        # lexbor siempre crea <body>; html.parser solo si el documento lo trae. Imitamos a html.parser.
+        body = tree.body if _RE_BODY.search(markup) else None
+        content_element = body or tree.css_first('div')
+
+    if not content_element:
+         return None
+
+    paragraphs = _descendientes(content_element, 'p')
+
+    if not paragraphs:
+        block_elements = _descendientes(content_element, ', '.join(TAGS_BLOQUE))
+        if block_elements:
+             content_text = "\n\n".join(elem.text(deep=True, separator='', strip=True) for elem in block_elements)
+             return content_text if len(content_text) > MIN_CARACTERES else None
+
+    if paragraphs:
+        content_text = ' '.join(p.text(deep=True, separator='', strip=True) for p in paragraphs)
+        return content_text if len(content_text) > MIN_CARACTERES else None
+
+    return None
+
+
+def extract_article_content(soup):
+    """
+    Extrae el contenido principal del artículo de un objeto BeautifulSoup.
+    Intenta identificar bloques de contenido comunes y limpia elementos irrelevantes.
+    Retorna el texto extraído o una cadena vacía/None si no se encuentra contenido significativo.
+    """
+    # Remover elementos que generalmente no son parte del cuerpo del artículo
+    for element in soup(TAGS_A_ELIMINAR): # Añadidos más selectores comunes
+        if element: # Added check
+            try:
+                element.decompose()
+            except Exception as e:
+                 # print(f"⚠️ Error al descomponer elemento: {e}") # Depuración, opcional
+                 pass
+
+
+    content_element = None
+    for selector in SELECTORES_CONTENIDO:
+        content_element = soup.select_one(selector)
+        if content_element:
+            # print(f"✅ Contenido encontrado usando selector: {selector}") # Depuración, opcional
+            break # Encontramos un candidato, salimos del bucle
+
+    # Si no se encontró un contenedor específico, intentar con el body o un div genérico
+    if not content_element:
+        # print("⚠️ No se encontró contenedor específico. Intentando fallback con body o div.") # Depuración, opcional
+        content_element = soup.body or soup.find('div') # Fallback al body o al primer div
+
+    if not content_element:
+         # print("❌ No se encontró ningún elemento para extraer contenido.") # Depuración, opcional
+         return None
+
+
+    # Extraer texto de los párrafos dentro del elemento encontrado
+    # Limite de párrafos para evitar descargar/procesar contenido masivo accidentalmente
+    paragraphs = content_element.find_all('p', limit=MAX_BLOQUES) # Aumentado ligeramente el límite
+
+    # Si no hay párrafos directos, intentar extraer texto de otros elementos de bloque comunes
+    if not paragraphs:
+        # print("⚠️ No se encontraron <p> directos. Intentando otros elementos de bloque.") # Depuración, opcional
+        block_elements = content_element.find_all(TAGS_BLOQUE, limit=MAX_BLOQUES) # Añadir otros elementos relevantes
+        if block_elements:
+             # Concatenar el texto de los elementos encontrados, añadiendo saltos de línea para simular estructura
+             content_text = "\n\n".join(elem.get_text(strip=True) for elem in block_elements)
+             if len(content_text) > MIN_CARACTERES: # Mínimo de caracteres para considerar que hay contenido
+                  # print(f"✅ Contenido extraído de elementos de bloque: {len(content_text)} chars") # Depuración, opcional
+                  return content_text
+             else:
+                  # print("⚠️ Contenido extraído de elementos de bloque muy corto.") # Depuración, opcional
+                  return None
+
+    # Si se encontraron párrafos, unirlos
+    if paragraphs:
+        content_text = ' '.join(p.get_text(strip=True) for p in paragraphs) # Usar strip=True para limpiar espacios en blanco
+        if len(content_text) > MIN_CARACTERES:
+            # print(f"✅ Contenido extraído de <p>: {len(content_text)} chars") # Depuración, opcional
+            return content_text
+        else:
+             # print("⚠️ Contenido extraído de <p> muy corto.") # Depuración, opcional
+             return None
+
+    # Si no se encontró contenido significativo por ninguno de los métodos
+    # print("❌ No se pudo extraer contenido significativo.") # Depuración, opcional
+    return None
+
+
+# === Bloque para pruebas independientes ===
+if __name__ == "__main__":
+    print("--- Prueba independiente de DetectorFinArticulo ---")
+    parrafo = "<p>" + "Texto del artículo. " * 10 + "</p>"
+    casos = [
+        # (descripción, trozos del HTML, trozo tras el que debe cortar la descarga o None)
+        ("cierre del primer <article>",
+         ["<html><body><article>", parrafo, "</article>", "<footer>pie</footer>"], 2),
+        ("<article> dentro de <aside> antes del principal",
+         ["<html><body><aside><article>", "<p>Relacionado</p></article></aside>",
+          "<article>", parrafo, "</article>"], 4),
+        ("<article> dentro de <nav> sin cerrar el principal",
+         ["<nav><article><p>Menú</p></article></nav>", "<article>", parrafo], None),
+    ]
+    fallos = 0
+    for descripcion, trozos, esperado in casos:
+        detector = DetectorFinArticulo()
+        corte = next((i for i, trozo in enumerate(trozos) if detector.alimentar(trozo)), None)
+        fallos += corte != esperado
+        print(f"{'✅' if corte == esperado else '❌'} {descripcion}: corta tras el trozo {corte} (esperado {esperado})")
+    if fallos:
+        print(f"❌ {fallos} casos fallidos.")
+        exit(1)
+    print("✅ Todos los casos correctos.")
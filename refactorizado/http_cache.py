@@ -0,0 +1,134 @@
+# http_cache.py
+# Caché en disco (SQLite) de respuestas HTTP para web_tools.fetch_and_extract_content.
+# Guarda cuerpo, cabeceras, ETag y Last-Modified por URL canónica; expira por TTL y
+# desaloja por LRU cuando se supera el tamaño máximo (cache_sqlite.AlmacenCacheSQLite).
+# Este módulo solo almacena: la revalidación (GET condicional) la hace web_tools.
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cache_sqlite import AlmacenCacheSQLite
+from url_utils import canonicalize_url
+
+HTTP_CACHE_DB = os.getenv("HTTP_CACHE_DB", "http_cache.db")
+# Segundos durante los que una respuesta se sirve sin tocar la red
+HTTP_CACHE_TTL = int(os.getenv("HTTP_CACHE_TTL", str(6 * 3600)))
+# Tamaño máximo total de los cuerpos guardados (bytes) y número máximo de entradas
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+HTTP_CACHE_MAX_ENTRADAS = int(os.getenv("HTTP_CACHE_MAX_ENTRADAS", "20000"))
+
+_lock = threading.Lock()
+_almacen = AlmacenCacheSQLite(
+    HTTP_CACHE_DB, 'respuestas', 'url_key',
+    {'url': 'TEXT NOT NULL', 'status': 'INTEGER', 'headers': 'TEXT', 'etag': 'TEXT', 'last_modified': 'TEXT', 'body': 'BLOB'},
+    HTTP_CACHE_TTL, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_MAX_ENTRADAS,
+)
+atexit.register(_almacen.volcar_accesos)
+_stats = {
+    'hits': 0,              # Servidas desde caché sin red (dentro del TTL)
+    'revalidadas': 0,       # 304 Not Modified tras un GET condicional
+    'misses': 0,            # No había entrada (o no era revalidable) y se descargó entera
+    'guardadas': 0,
+    'desalojadas': 0,
+    'bytes_ahorrados': 0,   # Bytes de cuerpo que no hubo que descargar (hits + revalidadas)
+}
+
+
+def _contar(clave, n=1):
+    _stats[clave] += n
+
+
+def obtener(url):
+    """
+    Retorna la entrada cacheada para la URL como dict (body, headers, etag, last_modified,
+    fresca) o None si no existe. 'fresca' indica si sigue dentro del TTL.
+    """
+    key = canonicalize_url(url)
+    try:
+        row = _almacen.leer(key, ('body', 'headers', 'etag', 'last_modified'))
+        if not row:
+            return None
+    except sqlite3.Error as e:
+        print(f"⚠️ Error leyendo caché HTTP para {url[:60]}...: {e}")
+        return None
+
+    body, headers, etag, last_modified, fecha_guardado = row
+    return {
+        'body': body,
+        'headers': json.loads(headers) if headers else {},
+        'etag': etag,
+        'last_modified': last_modified,
+        'fresca': (time.time() - fecha_guardado) < HTTP_CACHE_TTL,
+    }
+
+
+def cabeceras_condicionales(entrada):
+    """Construye las cabeceras If-None-Match / If-Modified-Since a partir de una entrada."""
+    headers = {}
+    if entrada and entrada.get('etag'):
+        headers['If-None-Match'] = entrada['etag']
+    if entrada and entrada.get('last_modified'):
+        headers['If-Modified-Since'] = entrada['last_modified']
+    return headers
+
+
+def registrar_hit(entrada):
+    with _lock:
+        _contar('hits')
+        _contar('bytes_ahorrados', len(entrada['body'] or b''))
+
+
+def registrar_miss():
+    with _lock:
+        _contar('misses')
+
+
+def marcar_revalidada(url, entrada):
+    """Tras un 304: renueva el TTL de la entrada y cuenta los bytes ahorrados."""
+    key = canonicalize_url(url)
+    with _lock:
+        _contar('revalidadas')
+        _contar('bytes_ahorrados', len(entrada['body'] or b''))
+    try:
+        _almacen.renovar(key)
+    except sqlite3.Error as e:
+        print(f"⚠️ Error renovando caché HTTP para {url[:60]}...: {e}")
+
+
+def guardar(url, status, headers, body):
+    """Guarda (o reemplaza) la respuesta de una URL y desaloja entradas antiguas si hace falta."""
+    headers = {k: v for k, v in dict(headers or {}).items()}
+    cache_control = headers.get('Cache-Control', headers.get('cache-control', '')).lower()
+    if 'no-store' in cache_control:
+        return
+
+    key = canonicalize_url(url)
+    etag = headers.get('ETag') or headers.get('etag')
+    last_modified = headers.get('Last-Modified') or headers.get('last-modified')
+    try:
+        desalojadas = _almacen.guardar(key, {'url': url, 'status': status, 'headers': json.dumps(headers), 'etag': etag,
+                                             'last_modified': last_modified, 'body': body}, len(body or b''))
+    except sqlite3.Error as e:
+        print(f"⚠️ Error guardando en caché HTTP {url[:60]}...: {e}")
+        return
+    with _lock:
+        _contar('guardadas')
+        _contar('desalojadas', desalojadas)
+
+
+def get_stats():
+    """Retorna una copia de los contadores de la caché, con la tasa de aciertos calculada."""
+    with _lock:
+        stats = dict(_stats)
+    consultas = stats['hits'] + stats['revalidadas'] + stats['misses']
+    stats['tasa_aciertos'] = (stats['hits'] + stats['revalidadas']) / consultas if consultas else 0.0
+    return stats
+
+
+def limpiar():
+    """Vacía la caché en disco (los contadores no se tocan)."""
+    _almacen.limpiar()
@@ -0,0 +1,141 @@
+# json_incremental.py
+# Parser incremental del objeto JSON de primer nivel que devuelve Gemini en streaming.
+# Recibe la respuesta por trozos y entrega cada campo de primer nivel en cuanto su valor está completo
+# (p. ej. "title" mucho antes de que termine "body"). Detecta pronto las respuestas con una estructura
+# imposible (no empieza por un objeto, un valor no es JSON válido, un campo tiene el tipo equivocado...)
+# para poder cortar la generación sin esperar al final.
+
+import json
+import re
+
+# Texto tolerado antes de la '{' inicial (espacios, ```json, una frase de cortesía...)
+MAX_PREAMBULO = 200
+
+# Caracteres de control no válidos en JSON (excepto tab, newline, return): se eliminan antes de parsear
+_RE_CONTROL = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F\u2028\u2029]')
+
+
+class ErrorEstructuraJSON(ValueError):
+    """La respuesta no puede acabar siendo el objeto JSON esperado."""
+
+
+class ParserJSONIncremental:
+    """
+    Uso:
+        parser = ParserJSONIncremental(tipos={'title': str, 'body': str}, requeridas=['title', 'body'])
+        for trozo in stream:
+            for clave, valor in parser.alimentar(trozo):
+                ...
+        datos = parser.finalizar()
+    alimentar() y finalizar() lanzan ErrorEstructuraJSON en cuanto la estructura es inválida.
+    """
+
+    def __init__(self, tipos=None, requeridas=None):
+        self.tipos = tipos or {}
+        self.requeridas = list(requeridas or [])
+        self.datos = {}
+        self.terminado = False
+        self._texto = ""           # Texto del objeto desde la '{' inicial
+        self._pos = 0              # Siguiente carácter del objeto por examinar
+        self._preambulo = 0
+        self._iniciado = False
+        self._profundidad = 0
+        self._en_cadena = False
+        self._escape = False
+        self._inicio_clave = None
+        self._inicio_valor = None  # Posición donde empieza el valor del campo actual (profundidad 1)
+        self._clave = None
+
+    def alimentar(self, trozo):
+        """Procesa un trozo de la respuesta. Retorna la lista de (clave, valor) completados con este trozo."""
+        if self.terminado or not trozo:
+            return []
+        if not self._iniciado:
+            trozo = self._saltar_preambulo(trozo)
+            if trozo is None:
+                return []
+        self._texto += trozo
+        return self._avanzar()
+
+    def _saltar_preambulo(self, trozo):
+        inicio = trozo.find('{')
+        descartado = trozo if inicio == -1 else trozo[:inicio]
+        self._preambulo += len(descartado)
+        resto = descartado.replace('```json', '').replace('```', '').strip()
+        if '[' in resto:
+            raise ErrorEstructuraJSON("La respuesta es un array, se esperaba un objeto JSON.")
+        if self._preambulo > MAX_PREAMBULO:
+            raise ErrorEstructuraJSON(f"Más de {MAX_PREAMBULO} caracteres sin empezar el objeto JSON.")
+        if inicio == -1:
+            return None
+        self._iniciado = True
+        return trozo[inicio:]
+
+    def _avanzar(self):
+        completados = []
+        texto = self._texto
+        i = self._pos
+        while i < len(texto):
+            c = texto[i]
+            if self._en_cadena:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._en_cadena = False
+                    if self._profundidad == 1 and self._inicio_valor is None:
+                        # Fin de una clave de primer nivel: el valor empieza tras los ':'
+                        self._clave = json.loads(_RE_CONTROL.sub('', texto[self._inicio_clave:i + 1]), strict=False)
+            elif c == '"':
+                self._en_cadena = True
+                if self._profundidad == 1 and self._inicio_valor is None:
+                    self._inicio_clave = i
+            elif c in '{[':
+                self._profundidad += 1
+            elif c in '}]':
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    if self._inicio_valor is not None:
+                        completados.append(self._cerrar_valor(texto, i))
+                    self.terminado = True
+                    i += 1
+                    break
+            elif self._profundidad == 1:
+                if c == ':':
+                    if self._clave is None:
+                        raise ErrorEstructuraJSON("Se encontró ':' sin una clave de primer nivel.")
+                    self._inicio_valor = i + 1
+                elif c == ',':
+                    if self._inicio_valor is not None:
+                        completados.append(self._cerrar_valor(texto, i))
+            i += 1
+        self._pos = i
+        return completados
+
+    def _cerrar_valor(self, texto, fin):
+        """Parsea el valor del campo actual (entre los ':' y fin) y comprueba su tipo."""
+        clave = self._clave
+        crudo = _RE_CONTROL.sub('', texto[self._inicio_valor:fin]).strip()
+        self._clave = None
+        self._inicio_valor = None
+        try:
+            valor = json.loads(crudo, strict=False)
+        except json.JSONDecodeError as e:
+            raise ErrorEstructuraJSON(f"Valor inválido para '{clave}': {e}") from e
+        tipo = self.tipos.get(clave)
+        if tipo is not None and not isinstance(valor, tipo):
+            raise ErrorEstructuraJSON(f"El campo '{clave}' debería ser {tipo.__name__} y es {type(valor).__name__}.")
+        self.datos[clave] = valor
+        return clave, valor
+
+    def finalizar(self):
+        """Llamar al acabar el stream. Retorna el dict completo o lanza ErrorEstructuraJSON."""
+        if not self._iniciado:
+            raise ErrorEstructuraJSON("La respuesta no contenía un objeto JSON.")
+        if not self.terminado:
+            raise ErrorEstructuraJSON("La respuesta terminó antes de cerrar el objeto JSON.")
+        faltan = [clave for clave in self.requeridas if clave not in self.datos]
+        if faltan:
+            raise ErrorEstructuraJSON(f"Faltan claves: {', '.join(faltan)}")
+        return self.datos
@@ -0,0 +1,145 @@
+# llm_cache.py
+# Caché persistente (SQLite) de respuestas de Gemini para llm_client.
+# La clave es el hash del modelo + prompt (+ configuración de generación): un prompt idéntico
+# devuelve la respuesta guardada en microsegundos en lugar de repetir la llamada.
+# Expira por TTL y desaloja por LRU al superar el tamaño máximo (cache_sqlite.AlmacenCacheSQLite).
+
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from cache_sqlite import AlmacenCacheSQLite
+
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+# Segundos durante los que una respuesta guardada es válida
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# Tamaño máximo total de las respuestas guardadas (bytes) y número máximo de entradas
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+LLM_CACHE_MAX_ENTRADAS = int(os.getenv("LLM_CACHE_MAX_ENTRADAS", "50000"))
+# LLM_CACHE_DESACTIVADA=1 desactiva la caché en todo el proceso
+LLM_CACHE_ACTIVADA = os.getenv("LLM_CACHE_DESACTIVADA", "0") != "1"
+# Entradas que se mantienen además en memoria: un acierto aquí no toca SQLite (microsegundos)
+LLM_CACHE_MEMORIA = int(os.getenv("LLM_CACHE_MEMORIA", "512"))
+
+_lock = threading.Lock()
+_almacen = AlmacenCacheSQLite(
+    LLM_CACHE_DB, 'respuestas_llm', 'clave',
+    {'modelo': 'TEXT NOT NULL', 'respuesta': 'TEXT NOT NULL', 'latencia': 'REAL'},
+    LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES, LLM_CACHE_MAX_ENTRADAS,
+)
+atexit.register(_almacen.volcar_accesos)
+# clave -> (respuesta, latencia, fecha_guardado), ordenado de menos a más reciente
+_memoria = OrderedDict()
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'expiradas': 0,             # Había entrada pero fuera del TTL (cuentan también como miss)
+    'omitidas': 0,              # Consultas con la caché desactivada o en modo refresco
+    'guardadas': 0,
+    'desalojadas': 0,
+    'segundos_ahorrados': 0.0,  # Suma de la latencia original de las respuestas servidas desde caché
+}
+
+
+def clave(model_name, prompt, extra=None):
+    """Clave de caché: SHA-256 del nombre del modelo, el prompt y (opcional) la configuración de generación."""
+    h = hashlib.sha256()
+    h.update(model_name.encode('utf-8'))
+    h.update(b'\0')
+    h.update(prompt.encode('utf-8'))
+    if extra:
+        h.update(b'\0')
+        h.update(json.dumps(extra, sort_keys=True, default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _recordar(clave_cache, entrada):
+    _memoria[clave_cache] = entrada
+    _memoria.move_to_end(clave_cache)
+    while len(_memoria) > LLM_CACHE_MEMORIA:
+        _memoria.popitem(last=False)
+
+
+def _servir(entrada):
+    respuesta, latencia, _ = entrada
+    _stats['hits'] += 1
+    _stats['segundos_ahorrados'] += latencia or 0.0
+    return respuesta
+
+
+def obtener(clave_cache):
+    """Retorna la respuesta guardada para la clave si existe y está dentro del TTL; si no, None."""
+    with _lock:
+        entrada = _memoria.get(clave_cache)
+        if entrada is not None and time.time() - entrada[2] < LLM_CACHE_TTL:
+            # Los aciertos en memoria no actualizan ultimo_acceso en disco: el LRU de disco
+            # se aproxima con el último acceso que pasó por SQLite.
+            _memoria.move_to_end(clave_cache)
+            return _servir(entrada)
+        _memoria.pop(clave_cache, None)
+
+        try:
+            row = _almacen.leer(clave_cache, ('respuesta', 'latencia'))
+            if not row:
+                _stats['misses'] += 1
+                return None
+            if time.time() - row[2] >= LLM_CACHE_TTL:
+                _stats['misses'] += 1
+                _stats['expiradas'] += 1
+                return None
+            _recordar(clave_cache, row)
+            return _servir(row)
+        except sqlite3.Error as e:
+            print(f"⚠️ Error leyendo caché LLM: {e}")
+            return None
+
+
+def registrar_omitida():
+    with _lock:
+        _stats['omitidas'] += 1
+
+
+def guardar(clave_cache, model_name, respuesta, latencia=None):
+    """Guarda (o reemplaza) una respuesta y desaloja las entradas menos usadas si se superan los límites."""
+    if respuesta is None:
+        return
+    with _lock:
+        _recordar(clave_cache, (respuesta, latencia, time.time()))
+        try:
+            desalojadas = _almacen.guardar(clave_cache, {'modelo': model_name, 'respuesta': respuesta, 'latencia': latencia},
+                                           len(respuesta.encode('utf-8')))
+            _stats['guardadas'] += 1
+            _stats['desalojadas'] += desalojadas
+        except sqlite3.Error as e:
+            print(f"⚠️ Error guardando en caché LLM: {e}")
+
+
+def eliminar(clave_cache):
+    """Borra la respuesta guardada para la clave (si la hay), p. ej. porque resultó no ser válida."""
+    with _lock:
+        _memoria.pop(clave_cache, None)
+        try:
+            _almacen.eliminar(clave_cache)
+        except sqlite3.Error as e:
+            print(f"⚠️ Error eliminando de la caché LLM: {e}")
+
+
+def get_stats():
+    """Retorna una copia de los contadores de la caché, con la tasa de aciertos calculada."""
+    with _lock:
+        stats = dict(_stats)
+    consultas = stats['hits'] + stats['misses']
+    stats['tasa_aciertos'] = stats['hits'] / consultas if consultas else 0.0
+    return stats
+
+
+def limpiar():
+    """Vacía la caché en disco (los contadores no se tocan)."""
+    with _lock:
+        _memoria.clear()
+        _almacen.limpiar()
@@ -1,24 +1,679 @@
 # llm_client.py
+import asyncio
+import atexit
+import contextvars
+import functools
+import json
 import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 
 import google.generativeai as genai
 from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _ErrorJSON = orjson.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+    _ErrorJSON = json.JSONDecodeError
+
+import database
+import llm_cache
+import rate_limiter
 
 load_dotenv()
-# Configurar la API de Gemini con la clave de entorno
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-def generate_raw_content(prompt, model_name="gemini-2.0-flash-lite-preview-02-05"):
+MODELO_POR_DEFECTO = "gemini-2.0-flash-lite-preview-02-05"
+
+# Límite global de llamadas simultáneas a Gemini en todo el proceso
+# (compartido por todos los temas y etapas que se ejecutan en paralelo, en hilos o en asyncio).
+MAX_LLAMADAS_CONCURRENTES = int(os.getenv("LLM_MAX_CONCURRENTES", "4"))
+_semaforo_llamadas = threading.BoundedSemaphore(MAX_LLAMADAS_CONCURRENTES)
+
+# Reintentos ante errores transitorios (429, 5xx, timeouts): backoff exponencial con jitter,
+# respetando el retraso que indique el servidor si lo hay.
+LLM_MAX_REINTENTOS = int(os.getenv("LLM_MAX_REINTENTOS", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "2"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+# Tokens de respuesta que se suponen al reservar cupo en el limitador (se corrige con el uso real)
+TOKENS_SALIDA_ESTIMADOS = 1024
+_ERRORES_CUOTA = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)
+_ERRORES_REINTENTABLES = _ERRORES_CUOTA + (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+)
+_RE_RETRY_DELAY = re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)')
+
+_retry_stats = {'llamadas': 0, 'reintentos': 0, 'errores_cuota': 0, 'segundos_espera_limitador': 0.0}
+_retry_stats_lock = threading.Lock()
+
+# === Telemetría de llamadas (tabla llm_llamadas) ===
+LLM_TELEMETRIA = os.getenv("LLM_TELEMETRIA", "1") == "1"
+# Los registros se acumulan en memoria y se insertan en bloque (un acierto de caché no paga un INSERT)
+TELEMETRIA_TAMANO_BLOQUE = 50
+# Precio estimado en USD por millón de tokens (entrada, salida)
+PRECIOS_USD_POR_MILLON = {
+    "gemini-2.0-flash-lite-preview-02-05": (0.075, 0.30),
+}
+PRECIO_POR_DEFECTO = (0.10, 0.40)
+
+# Contexto de las llamadas (tema, etapa...) que se hereda en el código llamado; ver contexto_llamadas()
+_contexto = contextvars.ContextVar("contexto_llm", default={})
+_telemetria_pendiente = []
+_telemetria_lock = threading.Lock()
+
+# === Backend ===
+# El backend crea los objetos "modelo" (con generate_content / generate_content_async, como GenerativeModel).
+# LLM_BACKEND=fake usa fake_llm_backend (respuestas locales deterministas) para pruebas y benchmarks sin red.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+
+class BackendGemini:
+    """Backend real: GenerativeModel de google.generativeai. La API se configura al crear el primer modelo."""
+    nombre = "gemini"
+
+    def __init__(self):
+        self._configurado = False
+
+    def crear_modelo(self, model_name):
+        if not self._configurado:
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            self._configurado = True
+        return genai.GenerativeModel(model_name)
+
+
+# Los modelos se reutilizan por nombre: los GenerativeModel son seguros entre hilos.
+_backend = None
+_modelos = {}
+_modelos_lock = threading.Lock()
+
+
+def _backend_desde_entorno():
+    if LLM_BACKEND == "fake":
+        import fake_llm_backend
+        return fake_llm_backend.FakeBackend.desde_entorno()
+    return BackendGemini()
+
+
+def get_backend():
+    """Retorna el backend activo (por defecto el indicado en LLM_BACKEND)."""
+    global _backend
+    if _backend is None:
+        with _modelos_lock:
+            if _backend is None:
+                _backend = _backend_desde_entorno()
+    return _backend
+
+
+def set_backend(backend):
+    """Sustituye el backend (p. ej. por un FakeBackend en un benchmark) y descarta los modelos creados."""
+    global _backend
+    with _modelos_lock:
+        _backend = backend
+        _modelos.clear()
+
+
+def get_model(model_name=MODELO_POR_DEFECTO):
+    """Retorna la instancia reutilizable del modelo indicado, creada por el backend activo."""
+    model = _modelos.get(model_name)
+    if model is None:
+        backend = get_backend()
+        with _modelos_lock:
+            model = _modelos.get(model_name)
+            if model is None:
+                model = backend.crear_modelo(model_name)
+                _modelos[model_name] = model
+    return model
+
+
+def get_cache_stats():
+    """Contadores de la caché de respuestas (hits, misses, tasa de aciertos, segundos ahorrados...)."""
+    return llm_cache.get_stats()
+
+
+def get_retry_stats():
+    """Contadores de llamadas reales, reintentos, errores de cuota y tiempo esperado por el limitador."""
+    with _retry_stats_lock:
+        return dict(_retry_stats)
+
+
+def _contar(clave, cantidad=1):
+    with _retry_stats_lock:
+        _retry_stats[clave] += cantidad
+
+
+def _tokens_estimados(prompt):
+    return len(prompt) // 4 + TOKENS_SALIDA_ESTIMADOS
+
+
+def _tokens_reales(response):
+    uso = getattr(response, 'usage_metadata', None)
+    return getattr(uso, 'total_token_count', None) if uso else None
+
+
+def _pista_reintento(error):
+    """Segundos de espera que indica el servidor (RetryInfo o cabecera Retry-After), o None."""
+    for detalle in getattr(error, 'details', None) or []:
+        retraso = getattr(detalle, 'retry_delay', None)
+        if retraso is not None and hasattr(retraso, 'seconds'):
+            return retraso.seconds + getattr(retraso, 'nanos', 0) / 1e9
+    respuesta = getattr(error, 'response', None)
+    cabeceras = getattr(respuesta, 'headers', None) or {}
+    retry_after = cabeceras.get('Retry-After') if hasattr(cabeceras, 'get') else None
+    if retry_after and str(retry_after).isdigit():
+        return float(retry_after)
+    coincidencia = _RE_RETRY_DELAY.search(str(error))
+    return float(coincidencia.group(1)) if coincidencia else None
+
+
+def _espera_reintento(error, intento, limitador, model_name):
+    """
+    Decide si un error se reintenta. Relanza el error si no es transitorio o se agotaron los intentos;
+    si no, retorna los segundos a esperar (backoff exponencial con jitter, o la pista del servidor).
+    """
+    if not isinstance(error, _ERRORES_REINTENTABLES) or intento >= LLM_MAX_REINTENTOS:
+        raise error
+    techo = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** intento))
+    espera = random.uniform(techo / 2, techo)
+    pista = _pista_reintento(error)
+    if pista is not None:
+        espera = pista + random.uniform(0, 1)
+    if isinstance(error, _ERRORES_CUOTA):
+        # La cuota es del modelo: el resto de llamadas también esperan
+        _contar('errores_cuota')
+        limitador.pausar(espera)
+    _contar('reintentos')
+    print(f"⏩ Gemini ({model_name}) respondió {type(error).__name__}; reintento {intento + 1}/{LLM_MAX_REINTENTOS} en {espera:.1f} s")
+    return espera
+
+
+@contextmanager
+def contexto_llamadas(**campos):
+    """
+    Asocia las llamadas a Gemini hechas dentro del bloque a un contexto (p. ej. tema=..., etapa=...)
+    que se guarda en la telemetría. Los bloques anidados añaden o sobrescriben campos.
+    """
+    token = _contexto.set({**_contexto.get(), **campos})
+    try:
+        yield
+    finally:
+        _contexto.reset(token)
+
+
+def propagar_contexto(func):
+    """
+    Envuelve func para que se ejecute con el contexto de llamadas actual, también en otro hilo
+    (los hilos de un ThreadPoolExecutor no heredan los contextvars).
+    """
+    contexto = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def envoltura(*args, **kwargs):
+        # Una copia por ejecución: un mismo Context no puede estar activo en dos hilos a la vez
+        return contexto.copy().run(func, *args, **kwargs)
+    return envoltura
+
+
+def _llamador():
+    """'modulo.funcion' del primer marco de la pila fuera de este módulo (quien pidió la llamada)."""
+    marco = sys._getframe(1)
+    while marco is not None and marco.f_globals.get('__name__') == __name__:
+        marco = marco.f_back
+    if marco is None:
+        return None
+    return f"{marco.f_globals.get('__name__')}.{marco.f_code.co_name}"
+
+
+class _RegistroLlamada:
+    """Telemetría de una llamada a generate_*: se rellena durante la llamada y se encola al terminar."""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.llamador = _llamador()
+        self.contexto = _contexto.get()
+        self.inicio = time.monotonic()
+        self.fecha = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self.reintentos = 0
+        self.tokens_prompt = None
+        self.tokens_respuesta = None
+
+    def uso(self, response):
+        """Toma el uso de una respuesta (o de un trozo del stream); sin metadatos de uso no cambia nada."""
+        uso = getattr(response, 'usage_metadata', None)
+        if uso:
+            self.tokens_prompt = getattr(uso, 'prompt_token_count', None)
+            self.tokens_respuesta = getattr(uso, 'candidates_token_count', None)
+
+    def terminar(self, cache_hit=False, error=None):
+        if not LLM_TELEMETRIA:
+            return
+        precio_entrada, precio_salida = PRECIOS_USD_POR_MILLON.get(self.model_name, PRECIO_POR_DEFECTO)
+        coste = ((self.tokens_prompt or 0) * precio_entrada + (self.tokens_respuesta or 0) * precio_salida) / 1e6
+        registro = {
+            'fecha': self.fecha,
+            'tema': self.contexto.get('tema'),
+            'etapa': self.contexto.get('etapa'),
+            'llamador': self.llamador,
+            'modelo': self.model_name,
+            'tokens_prompt': self.tokens_prompt,
+            'tokens_respuesta': self.tokens_respuesta,
+            'latencia': time.monotonic() - self.inicio,
+            'reintentos': self.reintentos,
+            'cache_hit': int(cache_hit),
+            'coste': coste,
+            'error': type(error).__name__ if error else None,
+        }
+        with _telemetria_lock:
+            _telemetria_pendiente.append(registro)
+            lleno = len(_telemetria_pendiente) >= TELEMETRIA_TAMANO_BLOQUE
+        if lleno:
+            volcar_telemetria()
+
+
+def volcar_telemetria():
+    """Inserta en la base de datos los registros de telemetría pendientes."""
+    with _telemetria_lock:
+        registros = _telemetria_pendiente[:]
+        _telemetria_pendiente.clear()
+    if registros:
+        database.guardar_llamadas_llm(registros)
+
+
+atexit.register(volcar_telemetria)
+
+
+def _clave_cache(model_name, prompt, generation_config=None):
+    # Las respuestas de un backend de pruebas no deben servirse nunca en una ejecución real
+    backend = get_backend().nombre
+    modelo_cache = model_name if backend == BackendGemini.nombre else f"{backend}:{model_name}"
+    return llm_cache.clave(modelo_cache, prompt, generation_config)
+
+
+def descartar_respuesta(prompt, model_name=MODELO_POR_DEFECTO, generation_config=None):
+    """
+    Borra de la caché la respuesta guardada para este prompt (mismos parámetros que la llamada que la generó).
+    Para los llamadores que validan la respuesta después de recibirla: una respuesta inválida no debe servirse
+    de nuevo durante todo LLM_CACHE_TTL.
+    """
+    llm_cache.eliminar(_clave_cache(model_name, prompt, generation_config))
+
+
+def _consultar_cache(model_name, prompt, usar_cache, refrescar_cache, generation_config=None):
+    """Retorna (clave, respuesta_cacheada o None, si hay que guardar la respuesta nueva)."""
+    usar_cache = usar_cache and llm_cache.LLM_CACHE_ACTIVADA
+    clave_cache = _clave_cache(model_name, prompt, generation_config)
+    if usar_cache and not refrescar_cache:
+        return clave_cache, llm_cache.obtener(clave_cache), usar_cache
+    llm_cache.registrar_omitida()
+    return clave_cache, None, usar_cache
+
+
+def generate_raw_content(prompt, model_name=MODELO_POR_DEFECTO, usar_cache=True, refrescar_cache=False,
+                         generation_config=None):
     """
     Genera contenido crudo usando el modelo Gemini.
     Esta función es un wrapper simple de la llamada generate_content.
     No maneja prompts específicos ni parsing de resultados.
+    Como mucho MAX_LLAMADAS_CONCURRENTES llamadas están en curso a la vez; el resto espera turno.
+    Cada llamada respeta los límites de peticiones/tokens por minuto del modelo (rate_limiter) y los
+    errores transitorios se reintentan con backoff; si aun así falla, se relanza la excepción.
+    Las respuestas se guardan en la caché persistente (llm_cache) por modelo + prompt:
+    usar_cache=False la ignora por completo; refrescar_cache=True no la lee pero guarda la respuesta nueva.
+    generation_config (dict del SDK, opcional) se pasa tal cual a generate_content y forma parte de la clave de caché.
     """
+    registro = _RegistroLlamada(model_name)
+    clave_cache, respuesta_cacheada, guardar = _consultar_cache(model_name, prompt, usar_cache, refrescar_cache, generation_config)
+    if respuesta_cacheada is not None:
+        registro.terminar(cache_hit=True)
+        return respuesta_cacheada
+
+    model = get_model(model_name)
+    limitador = rate_limiter.get_limitador(model_name)
+    tokens = _tokens_estimados(prompt)
+    inicio = time.monotonic()
     try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
-        # Devuelve solo el texto, como en el código original
-        return response.text
+        for intento in range(LLM_MAX_REINTENTOS + 1):
+            espera = limitador.reservar(tokens)
+            if espera:
+                _contar('segundos_espera_limitador', espera)
+                time.sleep(espera)
+            try:
+                _contar('llamadas')
+                with _semaforo_llamadas:
+                    response = model.generate_content(prompt, generation_config=generation_config)
+                # Devuelve solo el texto, como en el código original
+                text = response.text
+                limitador.ajustar_tokens(tokens, _tokens_reales(response))
+                registro.uso(response)
+                break
+            except Exception as e:
+                # Los errores no transitorios (o el último intento) se relanzan para que el llamador los maneje
+                time.sleep(_espera_reintento(e, intento, limitador, model_name))
+                registro.reintentos += 1
     except Exception as e:
-        # Relanzar la excepción para que el llamador la maneje
-        raise e
+        registro.terminar(error=e)
+        raise
+    latencia = time.monotonic() - inicio
+    registro.terminar()
+
+    if guardar:
+        llm_cache.guardar(clave_cache, model_name, text, latencia)
+    return text
+
+
+async def _adquirir_turno():
+    """Espera turno en el semáforo global sin bloquear el bucle de eventos."""
+    while not _semaforo_llamadas.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+
+
+async def generate_raw_content_async(prompt, model_name=MODELO_POR_DEFECTO, usar_cache=True, refrescar_cache=False,
+                                     generation_config=None):
+    """
+    Versión asíncrona de generate_raw_content sobre generate_content_async del SDK.
+    Comparte caché y límite de concurrencia con la versión síncrona. El cliente asíncrono del SDK
+    queda ligado al bucle de eventos en el que se usa por primera vez: usar siempre el mismo bucle.
+    """
+    registro = _RegistroLlamada(model_name)
+    clave_cache, respuesta_cacheada, guardar = _consultar_cache(model_name, prompt, usar_cache, refrescar_cache, generation_config)
+    if respuesta_cacheada is not None:
+        registro.terminar(cache_hit=True)
+        return respuesta_cacheada
+
+    model = get_model(model_name)
+    limitador = rate_limiter.get_limitador(model_name)
+    tokens = _tokens_estimados(prompt)
+    inicio = time.monotonic()
+    try:
+        for intento in range(LLM_MAX_REINTENTOS + 1):
+            espera = limitador.reservar(tokens)
+            if espera:
+                _contar('segundos_espera_limitador', espera)
+                await asyncio.sleep(espera)
+            try:
+                _contar('llamadas')
+                await _adquirir_turno()
+                try:
+                    response = await model.generate_content_async(prompt, generation_config=generation_config)
+                finally:
+                    _semaforo_llamadas.release()
+                text = response.text
+                limitador.ajustar_tokens(tokens, _tokens_reales(response))
+                registro.uso(response)
+                break
+            except Exception as e:
+                await asyncio.sleep(_espera_reintento(e, intento, limitador, model_name))
+                registro.reintentos += 1
+    except Exception as e:
+        registro.terminar(error=e)
+        raise
+    latencia = time.monotonic() - inicio
+    registro.terminar()
+
+    if guardar:
+        llm_cache.guardar(clave_cache, model_name, text, latencia)
+    return text
+
+
+def _texto_trozo(chunk):
+    """Texto de un trozo del stream ('' si el trozo no trae partes de texto, p. ej. solo metadatos)."""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def generate_raw_content_stream(prompt, model_name=MODELO_POR_DEFECTO, usar_cache=True, refrescar_cache=False,
+                                generation_config=None):
+    """
+    Versión en streaming de generate_raw_content: generador que produce el texto por trozos según llega.
+    Si el llamador deja de iterar (break o close()) antes del final, la generación se abandona y se libera el turno.
+    Con la misma caché, límites y reintentos que generate_raw_content, con dos matices: una respuesta
+    en caché llega como un único trozo y solo se guarda la respuesta completa; y solo se reintenta si el
+    error llega antes de entregar el primer trozo (después se relanza).
+    El último trozo se retiene hasta que termina el stream del proveedor: la llamada se cierra (uso, caché,
+    telemetría) antes de entregarlo, así que cortar después de recibirlo ya no cuenta como abandono.
+    """
+    registro = _RegistroLlamada(model_name)
+    clave_cache, respuesta_cacheada, guardar = _consultar_cache(model_name, prompt, usar_cache, refrescar_cache, generation_config)
+    if respuesta_cacheada is not None:
+        registro.terminar(cache_hit=True)
+        yield respuesta_cacheada
+        return
+
+    model = get_model(model_name)
+    limitador = rate_limiter.get_limitador(model_name)
+    tokens = _tokens_estimados(prompt)
+    inicio = time.monotonic()
+    partes = []
+    entregado = False
+    pendiente = None
+    try:
+        for intento in range(LLM_MAX_REINTENTOS + 1):
+            espera = limitador.reservar(tokens)
+            if espera:
+                _contar('segundos_espera_limitador', espera)
+                time.sleep(espera)
+            try:
+                _contar('llamadas')
+                # El turno solo se ocupa mientras se lee del proveedor: se devuelve durante cada yield,
+                # para que un llamador lento procesando los trozos no deje sin turno a las demás llamadas
+                _semaforo_llamadas.acquire()
+                con_turno = True
+                try:
+                    response = model.generate_content(prompt, generation_config=generation_config, stream=True)
+                    for chunk in response:
+                        # Cada trozo trae el uso acumulado hasta ese momento: si el stream se abandona,
+                        # se registra lo ya facturado en vez de una llamada sin tokens ni coste
+                        registro.uso(chunk)
+                        texto = _texto_trozo(chunk)
+                        if texto:
+                            if pendiente is not None:
+                                entregado = True
+                                _semaforo_llamadas.release()
+                                con_turno = False
+                                yield pendiente
+                                _semaforo_llamadas.acquire()
+                                con_turno = True
+                            partes.append(texto)
+                            pendiente = texto
+                finally:
+                    # Si el llamador cierra el stream durante un yield, el turno ya está devuelto
+                    if con_turno:
+                        _semaforo_llamadas.release()
+                limitador.ajustar_tokens(tokens, _tokens_reales(response))
+                registro.uso(response)
+                break
+            except Exception as e:
+                if entregado:
+                    raise
+                # El llamador aún no ha recibido nada: se puede reintentar desde cero
+                partes.clear()
+                pendiente = None
+                time.sleep(_espera_reintento(e, intento, limitador, model_name))
+                registro.reintentos += 1
+    except GeneratorExit:
+        # El llamador cortó el stream antes del final: se registra como abandonada, con el uso del último trozo recibido
+        registro.terminar(error=GeneratorExit())
+        raise
+    except Exception as e:
+        registro.terminar(error=e)
+        raise
+    latencia = time.monotonic() - inicio
+    registro.terminar()
+
+    if guardar:
+        llm_cache.guardar(clave_cache, model_name, "".join(partes), latencia)
+    if pendiente is not None:
+        yield pendiente
+
+
+# === Respuestas estructuradas (JSON con esquema declarado) ===
+# Campos de esquema que acepta la API; el resto (p. ej. minimum/maximum) solo se usan al validar en local
+_CAMPOS_ESQUEMA_API = {'type', 'format', 'description', 'nullable', 'enum', 'items', 'max_items', 'min_items', 'properties', 'required'}
+_TIPOS_JSON = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+}
+
+# Caracteres de control no válidos en JSON (excepto tab, newline, return)
+_RE_CONTROL = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F\u2028\u2029]')
+
+# errores: solicitudes que terminaron en excepción (API); no entran en llamadas_por_exito
+_structured_stats = {'solicitudes': 0, 'validas_primera': 0, 'reparadas': 0, 'fallidas': 0, 'errores': 0,
+                     'llamadas_reparacion': 0}
+
+
+def get_structured_stats():
+    """
+    Contadores de generate_structured y llamadas a Gemini gastadas por respuesta válida, contando solo
+    las solicitudes completadas (válidas, reparadas o fallidas); las que acabaron en excepción van en 'errores'.
+    """
+    with _retry_stats_lock:
+        stats = dict(_structured_stats)
+    exitos = stats['validas_primera'] + stats['reparadas']
+    completadas = exitos + stats['fallidas']
+    stats['llamadas_por_exito'] = (completadas + stats['llamadas_reparacion']) / exitos if exitos else 0.0
+    return stats
+
+
+def _contar_estructurada(clave):
+    with _retry_stats_lock:
+        _structured_stats[clave] += 1
+
+
+def _esquema_para_api(esquema):
+    """Copia del esquema solo con los campos que entiende la API de Gemini."""
+    limpio = {k: v for k, v in esquema.items() if k in _CAMPOS_ESQUEMA_API}
+    if 'properties' in limpio:
+        limpio['properties'] = {k: _esquema_para_api(v) for k, v in limpio['properties'].items()}
+    if 'items' in limpio:
+        limpio['items'] = _esquema_para_api(limpio['items'])
+    return limpio
+
+
+def config_json(esquema):
+    """generation_config que pide a Gemini JSON conforme al esquema."""
+    return {"response_mime_type": "application/json", "response_schema": _esquema_para_api(esquema)}
+
+
+def validar_esquema(valor, esquema, ruta="$"):
+    """Valida un valor ya parseado contra el subconjunto de esquema que usamos. Retorna la lista de errores."""
+    tipo = esquema.get('type')
+    esperado = _TIPOS_JSON.get(tipo)
+    if esperado and (not isinstance(valor, esperado) or (tipo in ('integer', 'number') and isinstance(valor, bool))):
+        if valor is None and esquema.get('nullable'):
+            return []
+        return [f"{ruta}: se esperaba {tipo} y llegó {type(valor).__name__}"]
+
+    errores = []
+    if 'enum' in esquema and valor not in esquema['enum']:
+        errores.append(f"{ruta}: valor {valor!r} fuera de {esquema['enum']}")
+    if 'minimum' in esquema and valor < esquema['minimum']:
+        errores.append(f"{ruta}: {valor} es menor que {esquema['minimum']}")
+    if 'maximum' in esquema and valor > esquema['maximum']:
+        errores.append(f"{ruta}: {valor} es mayor que {esquema['maximum']}")
+    if tipo == 'object':
+        for clave in esquema.get('required', []):
+            if clave not in valor:
+                errores.append(f"{ruta}: falta la clave '{clave}'")
+        for clave, sub_esquema in esquema.get('properties', {}).items():
+            if clave in valor:
+                errores.extend(validar_esquema(valor[clave], sub_esquema, f"{ruta}.{clave}"))
+    elif tipo == 'array':
+        if 'min_items' in esquema and len(valor) < esquema['min_items']:
+            errores.append(f"{ruta}: menos de {esquema['min_items']} elementos")
+        if 'max_items' in esquema and len(valor) > esquema['max_items']:
+            errores.append(f"{ruta}: más de {esquema['max_items']} elementos")
+        if 'items' in esquema:
+            for i, elemento in enumerate(valor):
+                errores.extend(validar_esquema(elemento, esquema['items'], f"{ruta}[{i}]"))
+    return errores
+
+
+def parsear_y_validar(texto, esquema):
+    """Retorna (valor, errores). Con errores vacíos el valor es válido."""
+    texto = texto.strip()
+    if texto.startswith("```"):
+        texto = texto.strip("`").removeprefix("json").strip()
+    try:
+        valor = _json_loads(texto)
+    except _ErrorJSON:
+        # Segundo intento en local, más permisivo (saltos de línea sin escapar, caracteres de control)
+        # antes de gastar una llamada de reparación
+        try:
+            valor = json.loads(_RE_CONTROL.sub('', texto), strict=False)
+        except json.JSONDecodeError as e:
+            return None, [f"JSON inválido: {e}"]
+    return valor, validar_esquema(valor, esquema)
+
+
+def _prompt_reparacion(texto, errores):
+    return f"""
+El siguiente JSON no cumple el esquema requerido. Errores:
+{chr(10).join('- ' + e for e in errores[:20])}
+
+Corrige SOLO lo necesario para que cumpla el esquema, conservando todo el contenido válido,
+y devuelve SOLO el JSON corregido.
+
+JSON:
+{texto}
+"""
+
+
+def generate_structured(prompt, esquema, model_name=MODELO_POR_DEFECTO, usar_cache=True, refrescar_cache=False):
+    """
+    Pide a Gemini una respuesta JSON restringida al esquema (response_mime_type + response_schema),
+    la parsea y la valida. Si no es válida se hace UN intento de reparación enviando solo la respuesta
+    y los errores (no se regenera desde el prompt original). Retorna el valor parseado o None.
+    Los errores de la API (tras los reintentos) se relanzan, como en generate_raw_content.
+    Las respuestas que no pasan la validación se borran de la caché para no volver a servirlas.
+    """
+    _contar_estructurada('solicitudes')
+    try:
+        return _generar_estructurada(prompt, esquema, model_name, usar_cache, refrescar_cache)
+    except Exception:
+        _contar_estructurada('errores')
+        raise
+
+
+def _generar_estructurada(prompt, esquema, model_name, usar_cache, refrescar_cache):
+    generation_config = config_json(esquema)
+    texto = generate_raw_content(prompt, model_name, usar_cache, refrescar_cache, generation_config)
+    valor, errores = parsear_y_validar(texto, esquema)
+    if not errores:
+        _contar_estructurada('validas_primera')
+        return valor
+
+    print(f"⚠️ Respuesta estructurada inválida ({'; '.join(errores[:3])}). Intentando reparación...")
+    if usar_cache:
+        descartar_respuesta(prompt, model_name, generation_config)
+    prompt_reparacion = _prompt_reparacion(texto, errores)
+    texto_reparado = generate_raw_content(prompt_reparacion, model_name, usar_cache, refrescar_cache, generation_config)
+    # Se cuenta al terminar: una reparación que acaba en excepción es parte de un error, no de la ratio
+    _contar_estructurada('llamadas_reparacion')
+    valor, errores = parsear_y_validar(texto_reparado, esquema)
+    if not errores:
+        _contar_estructurada('reparadas')
+        return valor
+
+    if usar_cache:
+        descartar_respuesta(prompt_reparacion, model_name, generation_config)
+    _contar_estructurada('fallidas')
+    print(f"❌ La reparación no produjo una respuesta válida: {'; '.join(errores[:3])}")
+    return None
@@ -1,86 +1,174 @@
 # main.py
 # Punto de entrada principal. Orquesta solo la fase de búsqueda, análisis y guardado de fuentes.
 
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
 # Importamos los módulos necesarios
 import database
+import llm_client
 import scraper
+import web_tools
+
+# analyzer es usado internamente por scraper; llm_client solo se importa aquí
+# para el contexto de telemetría y los informes del final.
+
+# Número de temas que se procesan a la vez
+MAX_TEMAS_PARALELOS = int(os.getenv("MAX_TEMAS_PARALELOS", "3"))
+
+
+def procesar_tema(tema):
+    """
+    Fase 1 completa para un tema: busca y analiza fuentes con el scraper y guarda las 3 mejores.
+    Retorna un resumen {'tema', 'analizadas', 'guardadas', 'errores', 'segundos'}.
+    """
+    inicio = time.monotonic()
+    resumen = {'tema': tema, 'analizadas': 0, 'guardadas': 0, 'errores': 0, 'segundos': 0.0}
+    try:
+        # Las llamadas a Gemini de este tema quedan registradas en la telemetría con su tema y etapa
+        with llm_client.contexto_llamadas(tema=tema, etapa='analisis_fuentes'):
+            _buscar_y_guardar_fuentes(tema, resumen)
+    finally:
+        resumen['segundos'] = time.monotonic() - inicio
+    return resumen
+
+
+def _buscar_y_guardar_fuentes(tema, resumen):
+    """Cuerpo de procesar_tema (lógica original del bucle por tema); va anotando en 'resumen'."""
+    # --- FASE 1: Buscar y Analizar Fuentes ---
+    print(f"\n--- Iniciando fase de búsqueda y análisis de fuentes para '{tema}' ---")
+
+    # El scraper busca noticias, las analiza con Gemini y retorna las metadata de las que pasaron el filtro (score >= 5)
+    # num_resultados_scraper de la configuración del tema, o 10 como en el original
+    num_noticias = database.get_config(tema).get('num_resultados_scraper') or 10
+    resultados_analisis_scraping = scraper.buscar_noticias(tema, num_noticias=num_noticias)
+
+    # === Lógica de Feedback si no hay resultados analizados ===
+    if not resultados_analisis_scraping:
+        print(f"⚠️ No se encontraron artículos fuente relevantes (score >= 5) para '{tema}' en esta ejecución.")
+        print("Esto puede deberse a que las fuentes encontradas ya estaban en la base de datos, no cumplieron el criterio de score/contenido, o hubo errores de acceso.")
+        print("No se guardará ninguna fuente en esta ejecución para este tema.")
+        return # Saltar al siguiente tema o terminar si solo hay uno
+    # === FIN Lógica de Feedback ===
+
+
+    resumen['analizadas'] = len(resultados_analisis_scraping)
+
+    # Imprimir los resultados analizados que se considerarán para guardar
+    # Mantenemos la impresión original del TOP 3 de los resultados analizados encontrados
+    print(f"\n🏆 TOP {min(len(resultados_analisis_scraping), 3)} resultados analizados con Score >= 5 (se intentarán guardar como fuentes):")
+
+    # Iterar sobre los primeros 3 resultados analizados para imprimir y preparar su guardado
+    # El .get() para score, reason, url, tags y resumen se usa para mayor seguridad, aunque tu original usaba [] para algunos.
+    # Mantengo la lógica de iterar solo sobre los 3 primeros analizados (resultados_analisis_scraping[:3])
+    fuentes_a_guardar = []
+    for i, art in enumerate(resultados_analisis_scraping[:3], 1):
+        print(f"\n{i}. ⭐ {art.get('score', 'N/A')}/10: {art.get('reason', 'Sin razón')}")
+        print(f"   🔗 {art.get('url', 'Sin URL')}")
+        resumen_texto = art.get('resumen', art.get('reason', 'Sin resumen'))
+        print(f"   📝 Resumen: {resumen_texto}")
+        print(f"   🏷️ Tags: {', '.join(art.get('tags', []))}")
+
+        # Preparar el diccionario del artículo para guardar en la tabla 'articulos'
+        # 'usada_para_generar' no se pasa aquí; se inserta con DEFAULT 0
+        fuentes_a_guardar.append({
+            'titulo': art.get('titulo', f"Artículo sobre {tema}"), # Lógica similar a la original
+            'url': art.get('url', 'Sin URL'), # Usando .get por seguridad
+            'score': art.get('score', 0), # Usando .get por seguridad
+            'resumen': art.get('resumen', art.get('reason', '')[:100]), # Lógica original para resumen
+            'fuente': art.get('url', '').split('/')[2] if art.get('url') else '',
+            'tags': art.get('tags', []), # Usando .get
+            'texto': art.get('texto'), # Texto limpio extraído; se guarda comprimido para la fase de generación
+            'simhash': art.get('simhash') # Huella para detectar casi duplicados en futuras búsquedas
+        })
+
+    # Guardar todas las fuentes (y sus tags) en la base de datos en una sola transacción
+    try:
+        ids_guardados = database.guardar_articulos(fuentes_a_guardar)
+    except Exception as e:
+        # Si falla, no se guarda ninguna del lote; se cuenta como error de cada una y se continúa
+        resumen['errores'] += len(fuentes_a_guardar)
+        print(f"⚠️ Falló el guardado de {len(fuentes_a_guardar)} artículos fuente: {str(e)}")
+        ids_guardados = []
+    for fuente, source_id_saved in zip(fuentes_a_guardar, ids_guardados):
+        if source_id_saved:
+            resumen['guardadas'] += 1
+            print(f"   - Guardado/Actualizado como fuente en DB con ID {source_id_saved}: {fuente['url']}")
+        else:
+            print(f"   - ⚠️ Falló el guardado o no se pudo obtener ID para fuente: {fuente.get('url', 'N/A')}")
+
+    print("\n✅ Fase de búsqueda, análisis y guardado de fuentes completada.")
+
+
+def ejecutar_temas(temas, max_temas_paralelos=MAX_TEMAS_PARALELOS):
+    """
+    Procesa varios temas a la vez en un pool de hilos. Todos comparten los mismos límites:
+    llamadas simultáneas a Gemini (llm_client), descargas por dominio y globales (scraper)
+    y un único escritor en la DB (database). Informa del progreso por tema y de los totales.
+    """
+    resumenes = []
+    inicio = time.monotonic()
+    desde = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    with ThreadPoolExecutor(max_workers=max(1, min(max_temas_paralelos, len(temas))), thread_name_prefix="tema") as pool:
+        futuros = {pool.submit(procesar_tema, tema): tema for tema in temas}
+        for completados, futuro in enumerate(as_completed(futuros), 1):
+            tema = futuros[futuro]
+            try:
+                resumen = futuro.result()
+            except Exception as e:
+                print(f"❌ Error no controlado procesando el tema '{tema}': {e}")
+                resumen = {'tema': tema, 'analizadas': 0, 'guardadas': 0, 'errores': 1, 'segundos': 0.0}
+            resumenes.append(resumen)
+            print(f"\n📈 [{completados}/{len(temas)}] '{tema}': {resumen['analizadas']} relevantes, "
+                  f"{resumen['guardadas']} guardadas, {resumen['errores']} errores ({resumen['segundos']:.1f} s)")
+
+    total_segundos = time.monotonic() - inicio
+    print(f"\n📊 Totales: {len(temas)} temas | {sum(r['analizadas'] for r in resumenes)} fuentes relevantes | "
+          f"{sum(r['guardadas'] for r in resumenes)} guardadas | {sum(r['errores'] for r in resumenes)} errores | {total_segundos:.0f} s")
+    cache_llm = llm_client.get_cache_stats()
+    print(f"🧠 Caché LLM: {cache_llm['hits']} hits / {cache_llm['misses']} misses "
+          f"({cache_llm['tasa_aciertos']:.0%}), ~{cache_llm['segundos_ahorrados']:.0f} s de llamadas ahorrados")
+    reintentos_llm = llm_client.get_retry_stats()
+    print(f"⏱️ Gemini: {reintentos_llm['llamadas']} llamadas | {reintentos_llm['reintentos']} reintentos "
+          f"({reintentos_llm['errores_cuota']} por cuota) | {reintentos_llm['segundos_espera_limitador']:.0f} s esperando al limitador")
+    estructuradas = llm_client.get_structured_stats()
+    print(f"🧩 Respuestas estructuradas: {estructuradas['validas_primera']} válidas a la primera, "
+          f"{estructuradas['reparadas']} reparadas, {estructuradas['fallidas']} fallidas, {estructuradas['errores']} con error | "
+          f"{estructuradas['llamadas_por_exito']:.2f} llamadas por respuesta válida")
+
+    llm_client.volcar_telemetria()
+    informe = database.informe_llamadas_llm(agrupar_por=('tema', 'etapa'), desde=desde)
+    if informe:
+        print("💰 Gemini por tema y etapa en esta ejecución:")
+        for fila in informe:
+            print(f"   - {fila['tema']} / {fila['etapa']}: {fila['llamadas']} llamadas ({fila['cache_hits']} en caché), "
+                  f"{fila['tokens_prompt'] + fila['tokens_respuesta']} tokens, {fila['latencia_total']:.0f} s, ~${fila['coste']:.4f}")
+    return resumenes
 
-# analyzer y llm_client son usados internamente por scraper y analyzer,
-# no necesitan importarse aquí directamente para la estructura deseada.
 
 if __name__ == "__main__":
     # Inicializar la base de datos - LLAMA A LA FUNCIÓN QUE CARGA schema.sql
     # Esto asegurará que las tablas existan.
     database.inicializar_db()
-
-    # Definir los temas para buscar fuentes
-    # Puedes cambiar este tema si ya tienes muchas fuentes sobre él
-    temas = ["'panot'de barcelona"] # Tema original del ejemplo
-    # Ejemplo con otro tema: temas = ["tendencias en robótica educativa 2024"]s
-
-
-    # Iterar sobre los temas
-    for tema in temas:
-        # --- FASE 1: Buscar y Analizar Fuentes ---
-        print(f"\n--- Iniciando fase de búsqueda y análisis de fuentes para '{tema}' ---")
-
-        # El scraper busca noticias, las analiza con Gemini y retorna las metadata de las que pasaron el filtro (score >= 5)
-        # Mantenemos el comportamiento original de buscar un máximo de 5 resultados analizados
-        resultados_analisis_scraping = scraper.buscar_noticias(tema, num_noticias=10)
-
-        # === Lógica de Feedback si no hay resultados analizados ===
-        if not resultados_analisis_scraping:
-            print(f"⚠️ No se encontraron artículos fuente relevantes (score >= 5) para '{tema}' en esta ejecución.")
-            print("Esto puede deberse a que las fuentes encontradas ya estaban en la base de datos, no cumplieron el criterio de score/contenido, o hubo errores de acceso.")
-            print("No se guardará ninguna fuente en esta ejecución para este tema.")
-            continue # Saltar al siguiente tema o terminar si solo hay uno
-        # === FIN Lógica de Feedback ===
-
-
-        # Imprimir los resultados analizados que se considerarán para guardar
-        # Mantenemos la impresión original del TOP 3 de los resultados analizados encontrados
-        print(f"\n🏆 TOP {min(len(resultados_analisis_scraping), 3)} resultados analizados con Score >= 5 (se intentarán guardar como fuentes):")
-
-        # Iterar sobre los primeros 3 resultados analizados para imprimir y guardar
-        # El .get() para score, reason, url, tags y resumen se usa para mayor seguridad, aunque tu original usaba [] para algunos.
-        # Mantengo la lógica de iterar solo sobre los 3 primeros analizados (resultados_analisis_scraping[:3])
-        for i, art in enumerate(resultados_analisis_scraping[:3], 1):
-            print(f"\n{i}. ⭐ {art.get('score', 'N/A')}/10: {art.get('reason', 'Sin razón')}")
-            print(f"   🔗 {art.get('url', 'Sin URL')}")
-            resumen_texto = art.get('resumen', art.get('reason', 'Sin resumen'))
-            print(f"   📝 Resumen: {resumen_texto}")
-            print(f"   🏷️ Tags: {', '.join(art.get('tags', []))}")
-
-            # Preparar el diccionario del artículo para guardar en la tabla 'articulos'
-            # Esta función guarda en la tabla 'articulos' y 'articulos_fuente_tags'.
-            # Asumimos que guardar_articulo ahora también maneja el campo 'usada_para_generar' (con default 0)
-            # y retorna el ID del artículo fuente guardado o existente.
-            articulo_db_source_data = {
-                'titulo': art.get('titulo', f"Artículo sobre {tema}"), # Lógica similar a la original
-                'url': art.get('url', 'Sin URL'), # Usando .get por seguridad
-                'score': art.get('score', 0), # Usando .get por seguridad
-                'resumen': art.get('resumen', art.get('reason', '')[:100]), # Lógica original para resumen
-                'fuente': art.get('url', '').split('/')[2] if art.get('url') else '',
-                'tags': art.get('tags', []) # Usando .get
-                # 'usada_para_generar' no se pasa aquí; se espera que save_articulo la inserte con DEFAULT 0
-            }
-
-            # Guardar el artículo fuente en la base de datos
-            try:
-                # guardar_articulo ahora retorna el ID del artículo fuente guardado o existente
-                source_id_saved = database.guardar_articulo(articulo_db_source_data)
-                if source_id_saved:
-                    print(f"   - Guardado/Actualizado como fuente en DB con ID {source_id_saved}.")
-                else:
-                     # Esto podría ocurrir si guardar_articulo retorna None por algún fallo interno
-                     print(f"   - ⚠️ Falló el guardado o no se pudo obtener ID para fuente: {articulo_db_source_data.get('url', 'N/A')}")
-
-            except Exception as e:
-                # El manejo de error original solo imprime y continúa. Lo replicamos.
-                print(f"⚠️ Falló el guardado del artículo fuente {articulo_db_source_data.get('url', 'N/A')}: {str(e)}")
-                pass # Continúa con el siguiente artículo fuente aunque falle uno
-
-        print("\n✅ Fase de búsqueda, análisis y guardado de fuentes completada.")
+    # Índice en memoria de URLs ya guardadas: se carga una sola vez para toda la ejecución
+    database.cargar_indice_urls()
+    database.cargar_indice_simhash()
+
+    # Arrancar por adelantado los navegadores del pool compartido (SELENIUM_PRECALENTAR, 0 por defecto).
+    # El pool vive todo el proceso y se cierra solo al salir.
+    web_tools.get_driver_pool().precalentar()
+
+    # Temas con configuración guardada en la tabla 'configuracion'; si no hay ninguno, el tema de ejemplo
+    temas = database.get_available_temas_secciones()
+    if not temas:
+        # Puedes cambiar este tema si ya tienes muchas fuentes sobre él
+        temas = ["'panot'de barcelona"] # Tema original del ejemplo
+        # Ejemplo con otro tema: temas = ["tendencias en robótica educativa 2024"]
+    print(f"\n🗂️ {len(temas)} temas a procesar (hasta {MAX_TEMAS_PARALELOS} en paralelo).")
+
+    ejecutar_temas(temas)
 
     # Mensaje final - Copiado exacto del original (aunque ahora solo guarda fuentes)
     print("\n✅ Proceso principal completado (solo búsqueda y guardado de fuentes).")
\ No newline at end of file
@@ -0,0 +1,91 @@
+# rate_limiter.py
+# Limitador de ritmo por modelo para las llamadas a Gemini (peticiones/minuto y tokens/minuto).
+# Cada modelo tiene dos cubos de tokens (token bucket) que se rellenan de forma continua.
+# Una llamada "reserva" su coste y recibe cuántos segundos debe esperar: así el mismo limitador
+# sirve para hilos (time.sleep) y para asyncio (asyncio.sleep) sin retener ningún lock mientras espera.
+
+import os
+import threading
+import time
+
+# Límites por defecto de cada modelo (se pueden ajustar por modelo en LIMITES_POR_MODELO)
+LLM_RPM = int(os.getenv("LLM_RPM", "30"))
+LLM_TPM = int(os.getenv("LLM_TPM", "1000000"))
+# nombre_modelo -> (rpm, tpm)
+LIMITES_POR_MODELO = {
+    "gemini-2.0-flash-lite-preview-02-05": (LLM_RPM, LLM_TPM),
+}
+
+
+class TokenBucket:
+    """Cubo de 'capacidad' unidades que se rellena a 'por_segundo' unidades por segundo."""
+
+    def __init__(self, capacidad, por_segundo):
+        self.capacidad = float(capacidad)
+        self.por_segundo = float(por_segundo)
+        self._disponible = float(capacidad)
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rellenar(self, ahora):
+        self._disponible = min(self.capacidad, self._disponible + (ahora - self._ultima) * self.por_segundo)
+        self._ultima = ahora
+
+    def reservar(self, cantidad):
+        """
+        Descuenta 'cantidad' (el saldo puede quedar en negativo) y retorna los segundos que hay que
+        esperar hasta que el saldo vuelva a cero. Las reservas quedan en cola en orden de llegada.
+        """
+        cantidad = min(cantidad, self.capacidad)  # Una petición mayor que el cubo no debe bloquear para siempre
+        with self._lock:
+            ahora = time.monotonic()
+            self._rellenar(ahora)
+            self._disponible -= cantidad
+            return max(0.0, -self._disponible / self.por_segundo)
+
+    def ajustar(self, diferencia):
+        """Corrige una reserva ya hecha (p. ej. con los tokens reales de la respuesta)."""
+        with self._lock:
+            self._rellenar(time.monotonic())
+            self._disponible = min(self.capacidad, self._disponible - diferencia)
+
+
+class LimitadorModelo:
+    """Límites de peticiones/minuto y tokens/minuto de un modelo, más una pausa común tras un 429."""
+
+    def __init__(self, rpm, tpm):
+        self.peticiones = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self._pausa_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def reservar(self, tokens_estimados):
+        """Reserva una petición con 'tokens_estimados' y retorna los segundos de espera antes de lanzarla."""
+        espera = max(self.peticiones.reservar(1), self.tokens.reservar(tokens_estimados))
+        with self._lock:
+            pausa = self._pausa_hasta - time.monotonic()
+        return max(espera, pausa, 0.0)
+
+    def ajustar_tokens(self, tokens_estimados, tokens_reales):
+        if tokens_reales:
+            self.tokens.ajustar(tokens_reales - tokens_estimados)
+
+    def pausar(self, segundos):
+        """Tras un 429 ninguna llamada al modelo sale antes de 'segundos' (lo indique quien lo indique)."""
+        with self._lock:
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+
+
+_limitadores = {}
+_limitadores_lock = threading.Lock()
+
+
+def get_limitador(model_name):
+    """Retorna el limitador compartido del modelo (se crea la primera vez con sus límites)."""
+    with _limitadores_lock:
+        limitador = _limitadores.get(model_name)
+        if limitador is None:
+            rpm, tpm = LIMITES_POR_MODELO.get(model_name, (LLM_RPM, LLM_TPM))
+            limitador = LimitadorModelo(rpm, tpm)
+            _limitadores[model_name] = limitador
+        return limitador
@@ -0,0 +1,167 @@
+# relevance.py
+# Puntuación léxica local de relevancia de un texto respecto al tema (sin llamar a Gemini).
+# Normaliza tildes, mayúsculas y sufijos frecuentes del español, y puntúa los términos del tema
+# en el texto con la saturación de frecuencia y la normalización por longitud de BM25.
+# El resultado está entre 0 (no menciona ningún término) y ~1 (todos los términos, repetidos).
+#
+# Modos (RELEVANCIA_MODO):
+#  - "activo": los textos por debajo del umbral no se envían a Gemini.
+#  - "sombra": no se descarta nada; se compara la decisión local con el score de Gemini para calibrar el umbral.
+#  - "off": no se puntúa.
+
+import functools
+import os
+import re
+import threading
+import unicodedata
+
+RELEVANCIA_MODO = os.getenv("RELEVANCIA_MODO", "sombra")
+RELEVANCIA_UMBRAL = float(os.getenv("RELEVANCIA_UMBRAL", "0.15"))
+# Score de Gemini a partir del cual un artículo se considera relevante (mismo corte que buscar_noticias)
+SCORE_RELEVANTE = 5
+
+# Parámetros de BM25 y longitud de referencia (en términos) de un artículo típico
+BM25_K1 = 1.2
+BM25_B = 0.75
+LONGITUD_MEDIA = 600
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo bien cada como con contra cual
+cuales cuando de del desde donde dos e el ella ellas ello ellos en entre era eran es esa esas ese eso esos
+esta estan estas este esto estos fue fueron ha habia han hasta hay la las le les lo los mas me mi mientras
+muy ni no nos o otra otras otro otros para pero poco por porque que quien se segun ser si sin sobre son su
+sus tambien tan tanto te tiene tienen todo todos tras tu un una unas uno unos y ya
+the of and in on for to with
+""".split())
+
+# Sufijos que se recortan (del más largo al más corto) para agrupar variantes de una misma palabra
+SUFIJOS = (
+    "amientos", "imientos", "aciones", "uciones", "amiento", "imiento", "idades", "mente",
+    "acion", "ucion", "ancia", "encia", "istas", "idad", "ista", "ables", "ibles", "able", "ible",
+    "osos", "osas", "ivos", "ivas", "oso", "osa", "ivo", "iva",
+    "es", "as", "os", "s", "a", "o", "e",
+)
+LONGITUD_MINIMA_RAIZ = 3
+
+_RE_PALABRA = re.compile(r"\w+")
+
+_lock = threading.Lock()
+# URL -> puntuación local de los textos que pasaron a Gemini (pendientes de comparar con su score)
+_pendientes = {}
+_stats = {
+    'evaluados': 0,
+    'descartados': 0,
+    # Comparación con Gemini: local_relevante/local_irrelevante x gemini_relevante/gemini_irrelevante
+    'coinciden_relevante': 0,
+    'coinciden_irrelevante': 0,
+    'falsos_positivos': 0,    # Local dice relevante, Gemini < SCORE_RELEVANTE (llamada que se podría ahorrar)
+    'falsos_negativos': 0,    # Local dice irrelevante, Gemini >= SCORE_RELEVANTE (se habría perdido un artículo)
+}
+
+
+def _sin_tildes(texto):
+    if texto.isascii():
+        return texto
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+
+@functools.lru_cache(maxsize=65536)
+def raiz(palabra):
+    """Recorta el sufijo más largo conocido dejando al menos LONGITUD_MINIMA_RAIZ caracteres."""
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= LONGITUD_MINIMA_RAIZ:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def normalizar(texto):
+    """Lista de raíces del texto: minúsculas, sin tildes, sin stopwords ni números."""
+    terminos = []
+    for palabra in _RE_PALABRA.findall(_sin_tildes(texto.lower())):
+        if palabra in STOPWORDS or palabra.isdigit() or len(palabra) < 2:
+            continue
+        terminos.append(raiz(palabra))
+    return terminos
+
+
+class PuntuadorRelevancia:
+    """Puntúa textos frente a los términos de un tema (se prepara una vez por tema)."""
+
+    def __init__(self, tema):
+        self.tema = tema
+        # Términos únicos del tema, conservando el orden
+        self.terminos = list(dict.fromkeys(normalizar(tema)))
+
+    def puntuar(self, texto):
+        """Puntuación en [0, 1): media de la contribución BM25 normalizada de cada término del tema."""
+        if not self.terminos or not texto:
+            return 0.0
+        documento = normalizar(texto)
+        if not documento:
+            return 0.0
+        frecuencias = {}
+        for termino in documento:
+            frecuencias[termino] = frecuencias.get(termino, 0) + 1
+
+        norma = BM25_K1 * (1 - BM25_B + BM25_B * len(documento) / LONGITUD_MEDIA)
+        total = 0.0
+        for termino in self.terminos:
+            tf = frecuencias.get(termino, 0)
+            # tf / (tf + norma) es la saturación de BM25 dividida por su máximo (k1 + 1)
+            total += tf / (tf + norma) if tf else 0.0
+        return total / len(self.terminos)
+
+
+def evaluar(puntuador, url, texto):
+    """
+    Puntúa el texto y decide si sigue hacia Gemini. Retorna (sigue, puntuacion).
+    En modo "sombra" siempre sigue; en "off" siempre sigue sin puntuar.
+    """
+    if RELEVANCIA_MODO == "off":
+        return True, None
+    puntuacion = puntuador.puntuar(texto)
+    relevante = puntuacion >= RELEVANCIA_UMBRAL
+    with _lock:
+        _stats['evaluados'] += 1
+        if RELEVANCIA_MODO == "activo" and not relevante:
+            _stats['descartados'] += 1
+            return False, puntuacion
+        _pendientes[url] = puntuacion
+    return True, puntuacion
+
+
+def registrar_score_llm(url, score):
+    """Compara la decisión local de una URL ya evaluada con el score que le dio Gemini."""
+    with _lock:
+        puntuacion = _pendientes.pop(url, None)
+        if puntuacion is None or score is None:
+            return
+        local_relevante = puntuacion >= RELEVANCIA_UMBRAL
+        llm_relevante = score >= SCORE_RELEVANTE
+        if local_relevante and llm_relevante:
+            _stats['coinciden_relevante'] += 1
+        elif not local_relevante and not llm_relevante:
+            _stats['coinciden_irrelevante'] += 1
+        elif local_relevante:
+            _stats['falsos_positivos'] += 1
+        else:
+            _stats['falsos_negativos'] += 1
+
+
+def descartar(url):
+    """Olvida la puntuación pendiente de una URL cuyo análisis con Gemini falló (no hay score con el que comparar)."""
+    with _lock:
+        _pendientes.pop(url, None)
+
+
+def get_stats():
+    """Contadores del filtro y de la comparación con Gemini, con la tasa de acuerdo calculada."""
+    with _lock:
+        stats = dict(_stats)
+    comparados = (stats['coinciden_relevante'] + stats['coinciden_irrelevante']
+                  + stats['falsos_positivos'] + stats['falsos_negativos'])
+    stats['comparados'] = comparados
+    stats['tasa_acuerdo'] = (stats['coinciden_relevante'] + stats['coinciden_irrelevante']) / comparados if comparados else 0.0
+    stats['modo'] = RELEVANCIA_MODO
+    stats['umbral'] = RELEVANCIA_UMBRAL
+    return stats
@@ -2,10 +2,15 @@
 # Se encarga de buscar URLs candidatas (ej. en DuckDuckGo), resolverlas y analizar su metadata.
 
 import json  # Mantenido aunque no se use directamente, estaba en el original
+import os
 import re  # Mantenido aunque no se use directamente, estaba en el original
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote_plus
 
 import analyzer
+import dedup
+import llm_client
+import relevance
 # Mantener imports necesarios para la búsqueda inicial (DuckDuckGo HTML)
 import requests
 import web_tools  # Importamos las herramientas web
@@ -14,100 +19,300 @@ from bs4 import BeautifulSoup
 # Importamos módulos de utilidad y análisis
 import database
 
+# === Límites del modo concurrente ===
+# Los límites de descargas (global y por host) viven en web_tools: se comparten con la
+# resolución de redirecciones. Aquí solo se usa el global para dimensionar el pool.
+MAX_DESCARGAS_GLOBALES = web_tools.MAX_DESCARGAS_GLOBALES
+# Máximo de análisis con Gemini en paralelo dentro de un tema.
+MAX_ANALISIS_CONCURRENTES = int(os.getenv("SCRAPER_MAX_ANALISIS", "5"))
+# Analizar los candidatos en lotes (varios artículos por petición a Gemini) en el modo concurrente.
+ANALISIS_POR_LOTES = os.getenv("SCRAPER_ANALISIS_LOTES", "0") == "1"
 
-def buscar_noticias(tema, num_noticias=5):
+# Fragmentos de URL que delatan páginas que no son artículos (listados, archivos...)
+PATRONES_NO_ARTICULO = ["/tag/", "/temas/", "?page=", "#", "/category/", ".pdf", ".zip"]
+
+
+def _fetch_urls_from_ddg(tema):
+    """Realiza la búsqueda en DuckDuckGo y retorna una lista de URLs candidatas."""
+    query = f"{tema} site:.es OR site:.com after:2024"
+    url = f"https://duckduckgo.com/html/?q={quote_plus(query)}&kl=es-es"
+    headers = {'User-Agent': 'Mozilla/5.0'}
+
+    try:
+        response = requests.get(url, headers=headers, timeout=15)
+        response.raise_for_status()
+        soup = BeautifulSoup(response.text, 'html.parser')
+        return [
+            ("https:" + a['href'] if a['href'].startswith("//") else a['href'])
+            for a in soup.select('a.result__url')[:10]
+            if not any(x in a['href'] for x in ["youtube.com", "facebook.com", "twitter.com", "linkedin.com"])
+        ]
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️ Error en búsqueda de URLs (RequestException): {str(e)}")
+        return []
+    except Exception as e:
+        print(f"⚠️ Error en búsqueda de URLs (General Exception): {str(e)}")
+        return []
+
+
+def _es_url_no_articulo(url):
+    return any(x in url for x in PATRONES_NO_ARTICULO)
+
+
+def _descartar_url(url):
     """
-    Busca noticias sobre un tema, resuelve URLs, analiza con IA y retorna resultados.
+    Filtros baratos (sin red) sobre una URL ya resuelta: duplicados contra el índice en memoria
+    de database y patrones de no-artículo. Retorna True (e informa) si hay que descartarla.
     """
-    print(f"\n🔍 Buscando noticias sobre: {tema}")
+    if database.url_conocida(url):
+        print(f"⏩ Saltando duplicado: {url[:60]}...")
+        return True
+    if _es_url_no_articulo(url):
+        print(f"⏩ Saltando URL no-articulo/archivo: {url[:60]}...")
+        return True
+    return False
 
-    # La función interna de búsqueda no necesita cambios.
-    def fetch_urls_from_ddg():
-        """Realiza la búsqueda en DuckDuckGo y retorna una lista de URLs candidatas."""
-        query = f"{tema} site:.es OR site:.com after:2024"
-        url = f"https://duckduckgo.com/html/?q={quote_plus(query)}&kl=es-es"
-        headers = {'User-Agent': 'Mozilla/5.0'}
 
-        try:
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            return [
-                ("https:" + a['href'] if a['href'].startswith("//") else a['href'])
-                for a in soup.select('a.result__url')[:10]
-                if not any(x in a['href'] for x in ["youtube.com", "facebook.com", "twitter.com", "linkedin.com"])
-            ]
-        except requests.exceptions.RequestException as e:
-            print(f"⚠️ Error en búsqueda de URLs (RequestException): {str(e)}")
-            return []
-        except Exception as e:
-            print(f"⚠️ Error en búsqueda de URLs (General Exception): {str(e)}")
-            return []
+def _prefiltrar_candidatos(urls):
+    """
+    Filtra la lista de candidatos de una vez, ANTES de cualquier trabajo de red o navegador:
+    la mayoría de enlaces de DuckDuckGo llevan el destino en 'uddg', que se decodifica localmente.
+    También elimina destinos repetidos dentro de la misma búsqueda. Conserva el orden original.
+    """
+    candidatos = []
+    destinos_vistos = set()
+    for url in urls:
+        destino = web_tools.decode_ddg_url(url)
+        if destino:
+            if destino in destinos_vistos or _descartar_url(destino):
+                continue
+            destinos_vistos.add(destino)
+        candidatos.append(url)
+    return candidatos
 
-    # --- Lógica principal con la estructura corregida ---
-    
-    ranked_articles = []
-    driver = None  # Inicializar driver fuera del try para que exista en el finally
 
+def _preparar_candidato(url):
+    """
+    Etapa de red: resuelve la redirección, descarta duplicados/no-artículos y descarga el texto.
+    Retorna (final_url, text) o None si el candidato debe descartarse.
+    """
     try:
-        # 1. Iniciar el driver UNA SOLA VEZ.
+        # Resolver redirección. Selenium (vía el pool compartido de drivers) solo se usa
+        # si la vía sin navegador falla.
+        final_url = url
+        resolved = web_tools.get_final_url(url)
+        if resolved:
+            final_url = resolved
+        else:
+            print(f"⚠️ Usando URL original por fallo en redirección: {final_url[:60]}...")
+
+        # Control de duplicados y URLs no deseadas (de nuevo: la resolución por red puede cambiar el destino)
+        if _descartar_url(final_url):
+            return None
+
+        # Obtener contenido
+        with web_tools.limite_descarga(final_url):
+            text = web_tools.fetch_and_extract_content(final_url)
+        if not text:
+            print(f"⏩ Saltando URL por contenido no extraído/muy corto: {final_url[:60]}...")
+            return None
+
+        return final_url, text
+
+    except Exception as e:
+        # Capturar error de UNA SOLA URL, para que el resto continúe
+        print(f"⚠️ Error procesando URL {url}: {e}")
+        return None
+
+
+def _comprobar_casi_duplicado(final_url, text, indice_busqueda):
+    """
+    Calcula la huella SimHash del texto y la compara con las fuentes ya guardadas y con los
+    candidatos ya aceptados en esta búsqueda (indice_busqueda). Si no es un casi duplicado,
+    la añade a indice_busqueda y la retorna; si lo es, informa y retorna None.
+    """
+    huella = dedup.simhash(text)
+    duplicado = database.buscar_casi_duplicado(huella) or indice_busqueda.buscar(huella)
+    if duplicado:
+        print(f"⏩ Saltando casi duplicado de {str(duplicado[0])[:50]}... (distancia {duplicado[1]}): {final_url[:60]}...")
+        return None
+    indice_busqueda.agregar(huella, final_url)
+    return huella
+
+
+def _filtrar_casi_duplicados(candidatos):
+    """
+    Etapa local (en serie y en el orden original, por eso el resultado no depende de la concurrencia):
+    descarta los casi duplicados ANTES de gastar una llamada a Gemini.
+    Retorna la lista de (final_url, text, huella) que siguen adelante.
+    """
+    indice_busqueda = dedup.IndiceSimHash()
+    aceptados = []
+    for final_url, text in candidatos:
+        huella = _comprobar_casi_duplicado(final_url, text, indice_busqueda)
+        if huella is not None:
+            aceptados.append((final_url, text, huella))
+    return aceptados
+
+
+def _filtrar_por_relevancia(tema, candidatos):
+    """
+    Etapa local: descarta (en modo "activo") los textos que apenas mencionan el tema antes de llamar a Gemini.
+    En modo "sombra" solo los puntúa para comparar después con Gemini.
+    """
+    puntuador = relevance.PuntuadorRelevancia(tema)
+    aceptados = []
+    for final_url, text, huella in candidatos:
+        sigue, puntuacion = relevance.evaluar(puntuador, final_url, text)
+        if sigue:
+            aceptados.append((final_url, text, huella))
+        else:
+            print(f"⏩ Saltando por baja relevancia local ({puntuacion:.2f}): {final_url}")
+    return aceptados
+
+
+def _completar_analisis(analysis, final_url, text, huella):
+    """Añade al análisis la URL, el texto limpio y su huella."""
+    relevance.registrar_score_llm(final_url, analysis.get('score'))
+    analysis['url'] = final_url
+    # Conservamos el texto limpio (y su huella) para guardarlo con la fuente: la fase 2 no volverá a descargarlo
+    analysis['texto'] = text
+    analysis['simhash'] = huella
+    print(f"✅ Analizado: {final_url[:60]}... | Score: {analysis.get('score', 0)}")
+    return analysis
+
+
+def _analizar_candidato(tema, final_url, text, huella=None):
+    """Etapa LLM: analiza el texto con Gemini. Retorna el dict de análisis o None si falla."""
+    try:
+        analysis = analyzer.analyze_with_gemini(tema, text)
+        if analysis is None:
+            # Sin análisis válido: se descarta en esta ejecución (no se guarda con una puntuación falsa)
+            print(f"⚠️ Sin análisis para {final_url}, se omite.")
+            return None
+        return _completar_analisis(analysis, final_url, text, huella)
+    except Exception as e:
+        print(f"⚠️ Error procesando URL {final_url}: {e}")
+        return None
+    finally:
+        # Si el análisis falló, su puntuación local quedaría pendiente para siempre (con éxito ya se retiró)
+        relevance.descartar(final_url)
+
+
+def _analizar_en_lotes(tema, candidatos):
+    """
+    Etapa LLM en lote: reparte los candidatos en lotes por presupuesto de tokens y analiza cada lote
+    con una sola petición (los lotes van en paralelo). Retorna los análisis en el orden de los candidatos.
+    """
+    lotes = analyzer.dividir_en_lotes([(i, text) for i, (_, text, _) in enumerate(candidatos)])
+    analisis = []
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(lotes), MAX_ANALISIS_CONCURRENTES), thread_name_prefix="analisis") as pool:
+            resultados = {}
+            # propagar_contexto: los hilos del pool heredan el contexto de telemetría (tema, etapa) del llamador
+            analizar_lote = llm_client.propagar_contexto(lambda lote: analyzer.analyze_batch_with_gemini(tema, lote))
+            for parcial in pool.map(analizar_lote, lotes):
+                resultados.update(parcial)
+
+        for i, (final_url, text, huella) in enumerate(candidatos):
+            analysis = resultados.get(i)
+            if analysis is None:
+                print(f"⚠️ Sin análisis para {final_url}, se omite.")
+                continue
+            analisis.append(_completar_analisis(analysis, final_url, text, huella))
+    finally:
+        # Los candidatos sin análisis (o todos, si falló un lote) no dejan su puntuación local pendiente
+        for final_url, _, _ in candidatos:
+            relevance.descartar(final_url)
+    print(f"📦 {len(candidatos)} candidatos analizados en {len(lotes)} peticiones por lotes.")
+    return analisis
+
+
+def _procesar_en_serie(tema, urls):
+    """Camino original: cada candidato se resuelve, descarga y analiza uno detrás de otro."""
+    ranked_articles = []
+    indice_busqueda = dedup.IndiceSimHash()
+    puntuador = relevance.PuntuadorRelevancia(tema)
+    for url in urls:
+        candidato = _preparar_candidato(url)
+        if not candidato:
+            continue
+        huella = _comprobar_casi_duplicado(*candidato, indice_busqueda)
+        if huella is None:
+            continue
+        sigue, puntuacion = relevance.evaluar(puntuador, candidato[0], candidato[1])
+        if not sigue:
+            print(f"⏩ Saltando por baja relevancia local ({puntuacion:.2f}): {candidato[0]}")
+            continue
+        analysis = _analizar_candidato(tema, *candidato, huella)
+        if analysis:
+            ranked_articles.append(analysis)
+    return ranked_articles
+
+
+def _procesar_en_paralelo(tema, urls, por_lotes=False):
+    """
+    Pipeline por etapas: todas las descargas en paralelo y después todos los análisis en paralelo
+    (o en lotes de varios artículos por petición con por_lotes=True).
+    Los resultados se recogen en el orden original de las URLs, así la salida coincide con el modo en serie.
+    """
+    if not urls:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(len(urls), MAX_DESCARGAS_GLOBALES), thread_name_prefix="descarga") as pool:
+        candidatos = list(pool.map(_preparar_candidato, urls))
+    candidatos = _filtrar_por_relevancia(tema, _filtrar_casi_duplicados([c for c in candidatos if c]))
+
+    if not candidatos:
+        return []
+    if por_lotes:
+        return _analizar_en_lotes(tema, candidatos)
+
+    with ThreadPoolExecutor(max_workers=min(len(candidatos), MAX_ANALISIS_CONCURRENTES), thread_name_prefix="analisis") as pool:
+        analizar = llm_client.propagar_contexto(lambda c: _analizar_candidato(tema, *c))
+        analisis = list(pool.map(analizar, candidatos))
+    return [a for a in analisis if a]
+
+
+def buscar_noticias(tema, num_noticias=5, concurrente=True, por_lotes=None):
+    """
+    Busca noticias sobre un tema, resuelve URLs, analiza con IA y retorna resultados.
+    Con concurrente=True descarga y analiza los candidatos en paralelo (con límite global y por host);
+    con concurrente=False usa el recorrido en serie original.
+    por_lotes (por defecto ANALISIS_POR_LOTES) agrupa los análisis del modo concurrente en peticiones por lotes.
+    """
+    if por_lotes is None:
+        por_lotes = ANALISIS_POR_LOTES
+    print(f"\n🔍 Buscando noticias sobre: {tema}")
+
+    ranked_articles = []
+    stats_antes = web_tools.get_redirect_stats()
+
+    # Los drivers de Selenium los presta el pool compartido de web_tools (vive todo el proceso),
+    # así que aquí no se arranca ni se cierra ningún navegador.
+    urls = _prefiltrar_candidatos(_fetch_urls_from_ddg(tema))
+    if concurrente:
         try:
-            driver = web_tools.setup_driver()
+            ranked_articles = _procesar_en_paralelo(tema, urls, por_lotes)
         except Exception as e:
-            print(f"❌ Falló la configuración del driver de Selenium: {e}. No se podrán resolver redirecciones.")
-            driver = None # Asegurar que es None si falla
-
-        # 2. Iterar sobre las URLs. El driver ya está vivo.
-        for url in fetch_urls_from_ddg():
-            try:
-                # Resolver redirección (si el driver existe)
-                final_url = url
-                if driver:
-                    resolved = web_tools.get_final_url(url, driver)
-                    if resolved:
-                        final_url = resolved
-                    else:
-                        print(f"⚠️ Usando URL original por fallo en redirección: {final_url[:60]}...")
-                
-                # Control de duplicados
-                if database.url_existe(final_url):
-                    print(f"⏩ Saltando duplicado: {final_url[:60]}...")
-                    continue
-
-                # Filtrar URLs no deseadas
-                if any(x in final_url for x in ["/tag/", "/temas/", "?page=", "#", "/category/", ".pdf", ".zip"]):
-                    print(f"⏩ Saltando URL no-articulo/archivo: {final_url[:60]}...")
-                    continue
-
-                # Obtener contenido
-                text = web_tools.fetch_and_extract_content(final_url)
-                if not text:
-                    print(f"⏩ Saltando URL por contenido no extraído/muy corto: {final_url[:60]}...")
-                    continue
-
-                # Analizar con IA
-                analysis = analyzer.analyze_with_gemini(tema, text)
-                analysis['url'] = final_url
-                ranked_articles.append(analysis)
-                print(f"✅ Analizado: {final_url[:60]}... | Score: {analysis.get('score', 0)}")
-
-            except Exception as e:
-                # Capturar error de UNA SOLA URL, para que el bucle continúe
-                print(f"⚠️ Error procesando URL {url}: {e}")
-                # continue no es necesario, el bucle avanzará naturalmente
+            # Si el pipeline concurrente falla como tal, recurrimos al camino en serie
+            print(f"⚠️ Falló el modo concurrente ({e}). Reintentando en serie...")
+            ranked_articles = _procesar_en_serie(tema, urls)
+    else:
+        ranked_articles = _procesar_en_serie(tema, urls)
 
-    finally:
-        # 3. Cerrar el driver UNA SOLA VEZ al final de todo el proceso.
-        if driver:
-            try:
-                driver.quit()
-                print("\n✅ Driver de Selenium cerrado correctamente.")
-            except Exception as e:
-                print(f"⚠️ Error al cerrar el driver de Selenium: {e}")
+    # Diferencia respecto al inicio: los contadores son globales y pueden compartirse con otros temas
+    stats = {k: v - stats_antes.get(k, 0) for k, v in web_tools.get_redirect_stats().items()}
+    print(f"🔀 Redirecciones resueltas: uddg={stats['uddg']}, http={stats['http']}, selenium={stats['selenium']}, fallidas={stats['fallidas']}")
+    relevancia = relevance.get_stats()
+    print(f"🎯 Relevancia local ({relevancia['modo']}, umbral {relevancia['umbral']}, acumulado): "
+          f"{relevancia['descartados']}/{relevancia['evaluados']} descartados | acuerdo con Gemini "
+          f"{relevancia['tasa_acuerdo']:.0%} de {relevancia['comparados']} (falsos negativos: {relevancia['falsos_negativos']})")
+    cache_stats = web_tools.get_http_cache_stats()
+    print(f"💾 Caché HTTP (acumulado): hits={cache_stats['hits']}, revalidadas={cache_stats['revalidadas']}, misses={cache_stats['misses']}, {cache_stats['bytes_ahorrados'] / 1024:.0f} KB ahorrados")
 
     # Filtrar y ordenar los resultados (esto ya estaba bien)
     ranked_articles = [a for a in ranked_articles if a.get('score', 0) >= 5]
     ranked_articles.sort(key=lambda x: x.get('score', 0), reverse=True)
 
     return ranked_articles[:num_noticias]
-
@@ -0,0 +1,89 @@
+# url_utils.py
+# Utilidades puras (sin red) para normalizar URLs y usarlas como clave estable.
+
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+_PUERTOS_POR_DEFECTO = {'http': '80', 'https': '443'}
+
+
+def canonicalize_url(url):
+    """
+    Retorna una forma canónica de la URL para usarla como clave:
+    esquema y host en minúsculas, sin puerto por defecto, sin fragmento (#...)
+    y con los parámetros de query ordenados. Si la URL no se puede parsear se retorna tal cual.
+    """
+    if not url:
+        return url
+    try:
+        parsed = urlparse(url.strip())
+    except ValueError:
+        return url
+
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    if parsed.port and str(parsed.port) != _PUERTOS_POR_DEFECTO.get(scheme):
+        host = f"{host}:{parsed.port}"
+
+    path = parsed.path or '/'
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, host, path, parsed.params, query, ''))
+
+
+# Parámetros de seguimiento conocidos (redes sociales, anuncios, newsletters, analítica), que nunca
+# cambian el artículo. Nombres genéricos como 'source', 'ref' u 'output' no están: en algunos
+# sitios seleccionan otro artículo, y tratarlos como seguimiento uniría artículos distintos.
+_PARAMETROS_SEGUIMIENTO = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid',
+    'ref_src', 'cmpid', 'ns_source', 'ns_mchannel', 'ns_campaign', 'ito', 'int_campaign',
+}
+_PREFIJOS_SEGUIMIENTO = ('utm_', 'at_', 'pk_', 'mtm_', 'hsa_', '__twitter', '_ga')
+# Parámetros que solo piden la versión AMP del mismo artículo, con los valores que lo indican
+_PARAMETROS_AMP = {'amp': {'', '1', 'true'}, 'outputtype': {'amp'}, 'output': {'amp'}}
+# Subdominios de versiones móvil/AMP que sirven el mismo artículo que el dominio principal
+_PREFIJOS_HOST_VARIANTE = ('www.', 'm.', 'mobile.', 'amp.', 'movil.')
+
+
+def _es_parametro_seguimiento(nombre, valor):
+    """True si el parámetro se puede quitar sin cambiar de artículo (seguimiento o variante AMP)."""
+    nombre = nombre.lower()
+    if nombre in _PARAMETROS_AMP:
+        return valor.lower() in _PARAMETROS_AMP[nombre]
+    return nombre in _PARAMETROS_SEGUIMIENTO or nombre.startswith(_PREFIJOS_SEGUIMIENTO)
+
+
+def canonicalize_article_url(url):
+    """
+    Forma canónica "agresiva" para detectar el mismo artículo bajo URLs distintas:
+    además de canonicalize_url, elimina parámetros de seguimiento (utm_*, fbclid...),
+    variantes AMP (/amp, /amp/, .amp, ?amp=1, outputType=amp), subdominios móvil/AMP/www,
+    fuerza https y quita la barra final. No sirve como URL descargable, solo como clave.
+    """
+    canonica = canonicalize_url(url)
+    if not canonica:
+        return canonica
+    try:
+        parsed = urlparse(canonica)
+    except ValueError:
+        return canonica
+
+    host = parsed.netloc
+    cambiado = True
+    while cambiado:
+        cambiado = False
+        for prefijo in _PREFIJOS_HOST_VARIANTE:
+            if host.startswith(prefijo) and host.count('.') > 1:
+                host = host[len(prefijo):]
+                cambiado = True
+
+    path = parsed.path
+    for sufijo in ('/amp/', '/amp', '.amp.html', '.amp'):
+        if path.endswith(sufijo):
+            path = path[:-len(sufijo)] + ('.html' if sufijo == '.amp.html' else '')
+            break
+    if path.startswith('/amp/'):
+        path = path[len('/amp'):]
+    path = path.rstrip('/') or '/'
+
+    query = urlencode([(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if not _es_parametro_seguimiento(k, v)])
+    scheme = 'https' if parsed.scheme in ('http', 'https') else parsed.scheme
+    return urlunparse((scheme, host, path, parsed.params, query, ''))
@@ -2,10 +2,15 @@
 # Contiene funciones de utilidad para interactuar con la web (scraping básico, manejo de URLs, búsqueda de imágenes).
 
 # === Configuración de Unsplash API ===
+import atexit
+import codecs
 import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
 
 import requests
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -14,8 +19,10 @@ from selenium.webdriver.support.ui import WebDriverWait
 # No importamos EC ya que no se usa en las funciones movidas, aunque estaba en el original.
 from webdriver_manager.chrome import ChromeDriverManager
 
-# import urllib.parse # No se usa directamente aquí, se usa en scraper para quote_plus
-
+import html_parsing
+import http_cache
+# extract_article_content vive ahora en html_parsing; se re-exporta aquí por compatibilidad
+from html_parsing import extract_article_content
 
 load_dotenv()
 
@@ -23,11 +30,105 @@ load_dotenv()
 UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY")
 UNSPLASH_API_URL = "https://api.unsplash.com/"
 
+# === Configuración del pool de drivers de Selenium ===
+# Número máximo de navegadores vivos a la vez en el proceso
+SELENIUM_POOL_SIZE = int(os.getenv("SELENIUM_POOL_SIZE", "2"))
+# Un navegador se recicla (se cierra y se crea otro) tras este número de páginas
+SELENIUM_MAX_PAGINAS = int(os.getenv("SELENIUM_MAX_PAGINAS", "50"))
+# Navegadores a arrancar por adelantado al llamar a precalentar() sin argumentos
+SELENIUM_PRECALENTAR = int(os.getenv("SELENIUM_PRECALENTAR", "0"))
+# Fichero donde se recuerda la ruta de chromedriver entre ejecuciones
+CHROMEDRIVER_CACHE_FILE = os.getenv("CHROMEDRIVER_CACHE_FILE", os.path.join(os.path.expanduser("~"), ".auto_seo_chromedriver_path"))
+
+_chromedriver_path = None
+_chromedriver_path_lock = threading.Lock()
+
+# === Límites de descarga de páginas ===
+# Bytes máximos que se leen de una página (el resto se descarta)
+MAX_DESCARGA_BYTES = int(os.getenv("WEB_MAX_DESCARGA_BYTES", str(3 * 1024 * 1024)))
+# Tiempo máximo total de una descarga, aunque el servidor siga enviando datos
+MAX_DESCARGA_SEGUNDOS = float(os.getenv("WEB_MAX_DESCARGA_SEGUNDOS", "30"))
+# Caracteres de texto en <p> a partir de los cuales se deja de descargar (páginas sin <article>)
+MAX_CARACTERES_TEXTO = int(os.getenv("WEB_MAX_CARACTERES_TEXTO", "100000"))
+TAMANO_TROZO = 16 * 1024
+
+# === Límites de concurrencia de red ===
+# Máximo de peticiones simultáneas en todo el proceso (compartido entre temas).
+MAX_DESCARGAS_GLOBALES = int(os.getenv("SCRAPER_MAX_DESCARGAS", "8"))
+# Máximo de peticiones simultáneas contra un mismo host (evita martillear un medio).
+MAX_DESCARGAS_POR_HOST = int(os.getenv("SCRAPER_MAX_DESCARGAS_POR_HOST", "2"))
+
+_semaforo_global = threading.BoundedSemaphore(MAX_DESCARGAS_GLOBALES)
+_semaforos_host = {}
+_semaforos_host_lock = threading.Lock()
+
+# Content-Types que nunca son artículos: se rechazan antes de leer el cuerpo
+_CONTENT_TYPES_RECHAZADOS = ('application/pdf', 'application/zip', 'application/octet-stream',
+                             'application/msword', 'application/vnd.', 'image/', 'video/', 'audio/', 'font/')
+# Firmas de ficheros binarios habituales (por si el servidor miente en el Content-Type)
+_FIRMAS_BINARIAS = (b'%PDF', b'PK\x03\x04', b'\x89PNG', b'GIF8', b'\xff\xd8\xff', b'\x1f\x8b', b'Rar!', b'\xd0\xcf\x11\xe0')
+
+
+def _semaforo_para_host(url):
+    """Retorna (creándolo si hace falta) el semáforo asociado al host de la URL."""
+    host = urlparse(url).netloc.lower()
+    with _semaforos_host_lock:
+        semaforo = _semaforos_host.get(host)
+        if semaforo is None:
+            semaforo = threading.BoundedSemaphore(MAX_DESCARGAS_POR_HOST)
+            _semaforos_host[host] = semaforo
+        return semaforo
+
+
+@contextmanager
+def limite_descarga(url):
+    """
+    Respeta el límite global y el límite por host mientras dura una petición.
+    Lo usan tanto la resolución de redirecciones como la descarga de páginas (scraper).
+    """
+    with _semaforo_global:
+        with _semaforo_para_host(url):
+            yield
+
+
+def get_chromedriver_path():
+    """
+    Retorna la ruta del binario de chromedriver sin resolver versiones más de una vez.
+    Orden: memoria del proceso, variable CHROMEDRIVER_PATH, fichero de caché en disco y,
+    solo si nada de eso sirve, ChromeDriverManager().install() (cuyo resultado se guarda).
+    """
+    global _chromedriver_path
+    with _chromedriver_path_lock:
+        if _chromedriver_path and os.path.exists(_chromedriver_path):
+            return _chromedriver_path
+
+        candidatos = [os.getenv("CHROMEDRIVER_PATH")]
+        try:
+            with open(CHROMEDRIVER_CACHE_FILE, 'r', encoding='utf-8') as f:
+                candidatos.append(f.read().strip())
+        except OSError:
+            pass
+
+        for candidato in candidatos:
+            if candidato and os.path.exists(candidato):
+                _chromedriver_path = candidato
+                return _chromedriver_path
+
+        # Intentar instalar el driver si no está presente y obtener su path
+        _chromedriver_path = ChromeDriverManager().install()
+        try:
+            with open(CHROMEDRIVER_CACHE_FILE, 'w', encoding='utf-8') as f:
+                f.write(_chromedriver_path)
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar la ruta de chromedriver en caché ({CHROMEDRIVER_CACHE_FILE}): {e}")
+        return _chromedriver_path
+
 
 def setup_driver():
     """
     Configura y retorna un driver de Selenium optimizado para uso headless.
     Retorna el driver si tiene éxito, None si falla.
+    Para reutilizar navegadores entre temas usa get_driver_pool() en lugar de esta función.
     """
     options = Options()
     options.add_argument("--headless")
@@ -40,9 +141,8 @@ def setup_driver():
 
     # Usando Service para compatibilidad con versiones recientes de Selenium y webdriver-manager
     try:
-        # Intentar instalar el driver si no está presente y obtener su path
-        driver_path = ChromeDriverManager().install()
-        service = Service(driver_path)
+        # Ruta de chromedriver cacheada: no hay resolución de versión en cada arranque
+        service = Service(get_chromedriver_path())
         driver = webdriver.Chrome(service=service, options=options)
         # print("✅ Driver de Selenium configurado correctamente (headless).") # Depuración, opcional
         return driver
@@ -53,16 +153,227 @@ def setup_driver():
         return None
 
 
-def get_final_url(ddg_redirect_url, driver):
+def _cerrar_driver(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        print(f"⚠️ Error al cerrar el driver de Selenium: {e}")
+
+
+def _driver_sano(driver):
+    """Comprueba que el navegador sigue respondiendo (no se ha colgado ni cerrado)."""
+    try:
+        return driver.execute_script("return 1") == 1
+    except Exception:
+        return False
+
+
+class DriverPool:
     """
-    Resuelve redirecciones de DuckDuckGo usando Selenium para obtener la URL final.
-    Requiere un driver de Selenium activo.
-    Retorna la URL final o None si falla.
+    Pool de navegadores headless que vive todo el proceso.
+    Crea drivers bajo demanda hasta 'size', comprueba su salud al prestarlos y
+    los recicla tras 'max_paginas' usos o si dejan de responder.
     """
-    if not driver:
-        # print("⚠️ Driver de Selenium no disponible. No se puede resolver redirección.") # Depuración, opcional
-        return None # No se puede resolver sin driver
 
+    def __init__(self, size=SELENIUM_POOL_SIZE, max_paginas=SELENIUM_MAX_PAGINAS):
+        self.size = max(1, size)
+        self.max_paginas = max(1, max_paginas)
+        self._libres = []  # Entradas [driver, paginas_usadas]
+        self._creados = 0
+        self._cerrado = False
+        self._cond = threading.Condition()
+
+    def _adquirir(self, timeout):
+        limite = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._cond:
+                while not self._libres and self._creados >= self.size and not self._cerrado:
+                    restante = limite - time.monotonic() if limite is not None else None
+                    if restante is not None and restante <= 0:
+                        return None
+                    self._cond.wait(restante)
+                if self._cerrado:
+                    return None
+                if self._libres:
+                    entrada = self._libres.pop()
+                else:
+                    self._creados += 1
+                    entrada = None
+
+            if entrada is None:
+                driver = setup_driver()
+                if driver:
+                    return [driver, 0]
+                with self._cond:
+                    self._creados -= 1
+                    self._cond.notify()
+                return None
+
+            # Chequeo de salud fuera del lock: un navegador caído se descarta y se busca otro
+            if _driver_sano(entrada[0]):
+                return entrada
+            print("⚠️ Driver de Selenium sin respuesta. Reciclando...")
+            _cerrar_driver(entrada[0])
+            with self._cond:
+                self._creados -= 1
+                self._cond.notify()
+
+    def _liberar(self, entrada, sano):
+        entrada[1] += 1
+        reciclar = not sano or entrada[1] >= self.max_paginas
+        with self._cond:
+            if not reciclar and not self._cerrado:
+                self._libres.append(entrada)
+                self._cond.notify()
+                return
+            self._creados -= 1
+            self._cond.notify()
+        _cerrar_driver(entrada[0])
+
+    @contextmanager
+    def driver(self, timeout=60):
+        """
+        Presta un driver durante el bloque 'with'. Entrega None si no se pudo crear
+        ninguno o si no quedó libre ninguno antes de 'timeout' segundos.
+        """
+        entrada = self._adquirir(timeout)
+        if entrada is None:
+            yield None
+            return
+        sano = True
+        try:
+            yield entrada[0]
+        except Exception:
+            sano = False
+            raise
+        finally:
+            self._liberar(entrada, sano)
+
+    def precalentar(self, n=None):
+        """Arranca por adelantado hasta n navegadores (por defecto SELENIUM_PRECALENTAR)."""
+        n = SELENIUM_PRECALENTAR if n is None else n
+        entradas = []
+        for _ in range(min(n, self.size)):
+            entrada = self._adquirir(timeout=0)
+            if entrada is None:
+                break
+            entradas.append(entrada)
+        with self._cond:
+            self._libres.extend(entradas)
+            self._cond.notify_all()
+        if entradas:
+            print(f"🔥 {len(entradas)} driver(s) de Selenium precalentados.")
+
+    def cerrar(self):
+        """Cierra todos los navegadores libres; los prestados se cierran al devolverse."""
+        with self._cond:
+            self._cerrado = True
+            libres, self._libres = self._libres, []
+            self._creados -= len(libres)
+            self._cond.notify_all()
+        for driver, _ in libres:
+            _cerrar_driver(driver)
+
+
+_driver_pool = None
+_driver_pool_lock = threading.Lock()
+
+
+def get_driver_pool():
+    """Retorna el pool de drivers compartido por todo el proceso (se crea la primera vez)."""
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None:
+            _driver_pool = DriverPool()
+            atexit.register(shutdown_driver_pool)
+        return _driver_pool
+
+
+def shutdown_driver_pool():
+    """Cierra el pool de drivers compartido. Se registra automáticamente con atexit."""
+    global _driver_pool
+    with _driver_pool_lock:
+        pool, _driver_pool = _driver_pool, None
+    if pool:
+        pool.cerrar()
+
+
+# Contadores de cómo se resolvió cada redirección (para medir cuánto se usa Chrome)
+_redirect_stats = {'uddg': 0, 'http': 0, 'selenium': 0, 'fallidas': 0}
+_redirect_stats_lock = threading.Lock()
+
+# Hosts que consideramos "todavía en DuckDuckGo" al seguir redirecciones
+_DDG_HOSTS = ('duckduckgo.com', 'www.duckduckgo.com', 'html.duckduckgo.com', 'lite.duckduckgo.com')
+
+
+def _contar_redireccion(metodo):
+    with _redirect_stats_lock:
+        _redirect_stats[metodo] += 1
+
+
+def get_redirect_stats():
+    """Retorna una copia de los contadores de resolución de redirecciones por método."""
+    with _redirect_stats_lock:
+        return dict(_redirect_stats)
+
+
+def reset_redirect_stats():
+    """Pone a cero los contadores de resolución de redirecciones."""
+    with _redirect_stats_lock:
+        for metodo in _redirect_stats:
+            _redirect_stats[metodo] = 0
+
+
+def _es_url_ddg(url):
+    return urlparse(url).netloc.lower() in _DDG_HOSTS
+
+
+def _es_url_final_valida(url):
+    """Una URL final útil es http(s) y ya no apunta a DuckDuckGo."""
+    if not url:
+        return False
+    parsed = urlparse(url)
+    return parsed.scheme in ('http', 'https') and bool(parsed.netloc) and not _es_url_ddg(url)
+
+
+def decode_ddg_url(ddg_redirect_url):
+    """
+    Decodifica localmente un enlace de resultado de DuckDuckGo (/l/?uddg=...).
+    No hace ninguna petición de red. Retorna la URL destino o None si el enlace no la lleva.
+    Si la URL no es de DuckDuckGo se retorna tal cual.
+    """
+    if not ddg_redirect_url:
+        return None
+    url = "https:" + ddg_redirect_url if ddg_redirect_url.startswith("//") else ddg_redirect_url
+    if not _es_url_ddg(url):
+        return url if _es_url_final_valida(url) else None
+
+    # parse_qs ya aplica unquote sobre el valor de uddg
+    destino = parse_qs(urlparse(url).query).get('uddg', [None])[0]
+    return destino if _es_url_final_valida(destino) else None
+
+
+def _resolver_por_http(url, timeout=10):
+    """
+    Sigue la cadena de redirecciones con HEAD (y GET en streaming si el servidor no acepta HEAD).
+    Retorna la URL final o None si no sale de DuckDuckGo o falla la red.
+    """
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+    for method in ('head', 'get'):
+        try:
+            # stream=True en GET: solo nos interesan las cabeceras, no descargamos el cuerpo
+            with limite_descarga(url):
+                response = requests.request(method, url, headers=headers, timeout=timeout, allow_redirects=True, stream=(method == 'get'))
+                response.close()
+            if response.status_code < 400 and _es_url_final_valida(response.url):
+                return response.url
+        except requests.exceptions.RequestException:
+            continue
+    return None
+
+
+def _resolver_por_selenium(ddg_redirect_url, driver):
+    """Resuelve la redirección navegando con Selenium. Retorna la URL final o None si falla."""
     try:
         # Navegar a la URL que genera la redirección de DDG
         driver.get(ddg_redirect_url)
@@ -85,99 +396,148 @@ def get_final_url(ddg_redirect_url, driver):
         return None # Falló la resolución de la URL
 
 
-def extract_article_content(soup):
+def get_final_url(ddg_redirect_url, driver=None, driver_lock=None, usar_pool=True):
     """
-    Extrae el contenido principal del artículo de un objeto BeautifulSoup.
-    Intenta identificar bloques de contenido comunes y limpia elementos irrelevantes.
-    Retorna el texto extraído o una cadena vacía/None si no se encuentra contenido significativo.
+    Resuelve redirecciones de DuckDuckGo para obtener la URL final, de la vía más barata a la más cara:
+      1. Decodificando el parámetro 'uddg' localmente (sin red).
+      2. Siguiendo la cadena de redirecciones con HEAD/GET.
+      3. Navegando con Selenium: con el driver dado o, si no se da ninguno, con uno
+         prestado por el pool compartido (usar_pool=False lo desactiva).
+    driver_lock (opcional) serializa el uso de un driver propio compartido entre hilos.
+    Retorna la URL final o None si falla.
     """
-    # Remover elementos que generalmente no son parte del cuerpo del artículo
-    for element in soup(['script', 'style', 'nav', 'footer', 'iframe', 'aside', 'header', 'form', '.sidebar']): # Añadidos más selectores comunes
-        if element: # Added check
-            try:
-                element.decompose()
-            except Exception as e:
-                 # print(f"⚠️ Error al descomponer elemento: {e}") # Depuración, opcional
-                 pass
-
-
-    # Selectores comunes para identificar el cuerpo del artículo
-    selectors = [
-        'article', # La etiqueta semántica article
-        '.article-content', '.entry-content', '.post-content', # Clases comunes
-        '#main-content', '#content', # IDs comunes para el área principal
-        'div[itemprop="articleBody"]', # Microdatos
-        'div.body', 'div.story', 'div.text', 'div.content' # Otros selectores genéricos
-    ]
+    final_url = decode_ddg_url(ddg_redirect_url)
+    if final_url:
+        _contar_redireccion('uddg')
+        return final_url
+
+    url = "https:" + ddg_redirect_url if ddg_redirect_url.startswith("//") else ddg_redirect_url
+    final_url = _resolver_por_http(url)
+    if final_url:
+        _contar_redireccion('http')
+        return final_url
+
+    if not driver and usar_pool:
+        with get_driver_pool().driver() as pooled_driver:
+            final_url = _resolver_por_selenium(url, pooled_driver) if pooled_driver else None
+        _contar_redireccion('selenium' if final_url else 'fallidas')
+        return final_url
 
-    content_element = None
-    for selector in selectors:
-        content_element = soup.select_one(selector)
-        if content_element:
-            # print(f"✅ Contenido encontrado usando selector: {selector}") # Depuración, opcional
-            break # Encontramos un candidato, salimos del bucle
-
-    # Si no se encontró un contenedor específico, intentar con el body o un div genérico
-    if not content_element:
-        # print("⚠️ No se encontró contenedor específico. Intentando fallback con body o div.") # Depuración, opcional
-        content_element = soup.body or soup.find('div') # Fallback al body o al primer div
-
-    if not content_element:
-         # print("❌ No se encontró ningún elemento para extraer contenido.") # Depuración, opcional
-         return None
-
-
-    # Extraer texto de los párrafos dentro del elemento encontrado
-    # Limite de párrafos para evitar descargar/procesar contenido masivo accidentalmente
-    paragraphs = content_element.find_all('p', limit=20) # Aumentado ligeramente el límite
-
-    # Si no hay párrafos directos, intentar extraer texto de otros elementos de bloque comunes
-    if not paragraphs:
-        # print("⚠️ No se encontraron <p> directos. Intentando otros elementos de bloque.") # Depuración, opcional
-        block_elements = content_element.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'li', 'blockquote', 'pre', 'div'], limit=20) # Añadir otros elementos relevantes
-        if block_elements:
-             # Concatenar el texto de los elementos encontrados, añadiendo saltos de línea para simular estructura
-             content_text = "\n\n".join(elem.get_text(strip=True) for elem in block_elements)
-             if len(content_text) > 100: # Mínimo de caracteres para considerar que hay contenido
-                  # print(f"✅ Contenido extraído de elementos de bloque: {len(content_text)} chars") # Depuración, opcional
-                  return content_text
-             else:
-                  # print("⚠️ Contenido extraído de elementos de bloque muy corto.") # Depuración, opcional
-                  return None
-
-    # Si se encontraron párrafos, unirlos
-    if paragraphs:
-        content_text = ' '.join(p.get_text(strip=True) for p in paragraphs) # Usar strip=True para limpiar espacios en blanco
-        if len(content_text) > 100:
-            # print(f"✅ Contenido extraído de <p>: {len(content_text)} chars") # Depuración, opcional
-            return content_text
-        else:
-             # print("⚠️ Contenido extraído de <p> muy corto.") # Depuración, opcional
-             return None
+    if not driver:
+        # print("⚠️ Driver de Selenium no disponible. No se puede resolver redirección.") # Depuración, opcional
+        _contar_redireccion('fallidas')
+        return None # No se puede resolver sin driver
 
-    # Si no se encontró contenido significativo por ninguno de los métodos
-    # print("❌ No se pudo extraer contenido significativo.") # Depuración, opcional
-    return None
+    if driver_lock:
+        with driver_lock:
+            final_url = _resolver_por_selenium(url, driver)
+    else:
+        final_url = _resolver_por_selenium(url, driver)
+    _contar_redireccion('selenium' if final_url else 'fallidas')
+    return final_url
+
+
+def get_http_cache_stats():
+    """Contadores de la caché HTTP en disco (hits, revalidadas, misses, bytes ahorrados...)."""
+    return http_cache.get_stats()
+
+
+def _es_content_type_rechazado(content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return any(content_type.startswith(rechazado) for rechazado in _CONTENT_TYPES_RECHAZADOS)
 
 
-def fetch_and_extract_content(url, timeout=15):
+def _parece_binario(primer_trozo):
+    """Olfatea el inicio del cuerpo: firmas de ficheros conocidos o bytes nulos."""
+    inicio = primer_trozo[:512]
+    return inicio.startswith(_FIRMAS_BINARIAS) or b'\x00' in inicio
+
+
+def _leer_cuerpo_limitado(response, url, max_bytes):
+    """
+    Lee el cuerpo en streaming hasta max_bytes, MAX_DESCARGA_SEGUNDOS o hasta que el
+    DetectorFinArticulo indique que ya está todo lo que la extracción va a usar.
+    Retorna los bytes leídos o None si el contenido resulta ser binario.
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    detector = html_parsing.DetectorFinArticulo(max_caracteres=MAX_CARACTERES_TEXTO)
+    limite_tiempo = time.monotonic() + MAX_DESCARGA_SEGUNDOS
+    trozos = []
+    leidos = 0
+
+    for trozo in response.iter_content(chunk_size=TAMANO_TROZO):
+        if not trozo:
+            continue
+        if not trozos and _parece_binario(trozo):
+            print(f"⏩ Contenido binario detectado, descarga cancelada: {url[:60]}...")
+            return None
+        trozos.append(trozo)
+        leidos += len(trozo)
+        if detector.alimentar(decoder.decode(trozo)):
+            break
+        if leidos >= max_bytes or time.monotonic() > limite_tiempo:
+            print(f"✂️ Descarga truncada a {leidos // 1024} KB: {url[:60]}...")
+            break
+
+    return b''.join(trozos)[:max_bytes]
+
+
+def _descargar_html(url, timeout=15, usar_cache=True, max_bytes=None):
+    """
+    Descarga el cuerpo de una URL pasando por la caché HTTP en disco:
+    dentro del TTL se sirve sin red; fuera del TTL se revalida con un GET condicional
+    (If-None-Match / If-Modified-Since) y un 304 reutiliza el cuerpo guardado.
+    La descarga es en streaming: se rechazan PDFs/binarios antes de leer el cuerpo y se
+    corta al llegar a max_bytes (por defecto MAX_DESCARGA_BYTES) o al tener el artículo completo.
+    Retorna los bytes del cuerpo, o None si el contenido no es HTML.
+    Lanza requests.exceptions.RequestException si falla la red o el HTTP.
+    """
+    # Headers más amigables
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'} # User-Agent más común
+    max_bytes = max_bytes or MAX_DESCARGA_BYTES
+
+    entrada = http_cache.obtener(url) if usar_cache else None
+    if entrada and entrada['fresca']:
+        http_cache.registrar_hit(entrada)
+        return entrada['body']
+    if entrada:
+        headers.update(http_cache.cabeceras_condicionales(entrada))
+
+    with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if entrada and response.status_code == 304:
+            http_cache.marcar_revalidada(url, entrada)
+            return entrada['body']
+        response.raise_for_status() # Lanza excepción para errores HTTP (4xx, 5xx)
+
+        if _es_content_type_rechazado(response.headers.get('Content-Type')):
+            print(f"⏩ Content-Type no HTML ({response.headers.get('Content-Type')}), sin descargar: {url[:60]}...")
+            return None
+
+        body = _leer_cuerpo_limitado(response, url, max_bytes)
+        if body is None:
+            return None
+
+    if usar_cache:
+        http_cache.registrar_miss()
+        http_cache.guardar(url, response.status_code, response.headers, body)
+    return body
+
+
+def fetch_and_extract_content(url, timeout=15, usar_cache=True, max_bytes=None):
     """
     Descarga el HTML de una URL y extrae el contenido principal del artículo.
     Función de conveniencia para usar en otros módulos.
-    Retorna el texto extraído o None si falla o el contenido es insuficiente.
+    usar_cache=False ignora la caché HTTP en disco (ni la lee ni la escribe).
+    max_bytes limita lo que se descarga de la página (por defecto MAX_DESCARGA_BYTES).
+    Retorna el texto extraído o None si falla, no es HTML o el contenido es insuficiente.
     """
     try:
-        # Headers más amigables
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'} # User-Agent más común
-
-        response = requests.get(url, headers=headers, timeout=timeout)
-        response.raise_for_status() # Lanza excepción para errores HTTP (4xx, 5xx)
-
-        # Usar response.content y especificar encoding si es posible
-        soup = BeautifulSoup(response.content, 'html.parser')
+        html = _descargar_html(url, timeout=timeout, usar_cache=usar_cache, max_bytes=max_bytes)
+        if not html:
+            return None
 
-        # Usamos la función de extracción mejorada
-        content = extract_article_content(soup)
+        # Extracción con el backend de parseo configurado (ver html_parsing.HTML_PARSER)
+        content = html_parsing.extraer_contenido(html)
 
         # Umbral mínimo de texto extraído y verificación de contenido no deseado (ej: mensajes de cookie)
         if not content or len(content) < 200 or "aceptar cookies" in content.lower() or "suscribete" in content.lower()[:200]: # Aumentado umbral, añadido filtro básico
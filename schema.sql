@@ -11,7 +11,11 @@ CREATE TABLE IF NOT EXISTS articulos (
     fuente TEXT,
     fecha_publicacion_fuente TEXT, -- Renombrado para claridad
     fecha_scraping TEXT DEFAULT CURRENT_TIMESTAMP,
-    usada_para_generar INTEGER DEFAULT 0 -- Nuevo campo (0=No, 1=Sí)
+    usada_para_generar INTEGER DEFAULT 0, -- Nuevo campo (0=No, 1=Sí)
+    texto_comprimido BLOB, -- Texto limpio extraído de la fuente, comprimido con zlib
+    texto_hash TEXT, -- SHA-256 del texto limpio (sin comprimir)
+    url_canonica TEXT, -- URL normalizada (sin tracking, AMP, móvil...) para detectar duplicados
+    simhash INTEGER -- Huella SimHash de 64 bits del texto, para detectar casi duplicados
 );
 
 -- Tabla para los tags (pueden ser usados por fuentes o generados)
@@ -74,4 +78,22 @@ CREATE TABLE IF NOT EXISTS configuracion (
     -- Otros campos de configuración específicos que puedan surgir
     fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP,
     fecha_actualizacion TEXT DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+-- Telemetría de las llamadas a Gemini (una fila por llamada, incluidos los aciertos de caché)
+CREATE TABLE IF NOT EXISTS llm_llamadas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT DEFAULT CURRENT_TIMESTAMP, -- Inicio de la llamada (UTC)
+    tema TEXT, -- Contexto de la llamada (llm_client.contexto_llamadas)
+    etapa TEXT, -- 'analisis_fuentes', 'generacion'...
+    llamador TEXT, -- 'modulo.funcion' que pidió la llamada
+    modelo TEXT NOT NULL,
+    tokens_prompt INTEGER,
+    tokens_respuesta INTEGER,
+    latencia REAL, -- Segundos, incluidos reintentos y esperas del limitador
+    reintentos INTEGER DEFAULT 0,
+    cache_hit INTEGER DEFAULT 0, -- 1 si se sirvió desde la caché de respuestas
+    coste REAL, -- Coste estimado en USD
+    error TEXT -- Tipo de la excepción si la llamada falló
+);
+CREATE INDEX IF NOT EXISTS idx_llm_llamadas_fecha ON llm_llamadas (fecha);